@@ -1,11 +1,13 @@
-import sys 
+import sys
 sys.path.append('/teamspace/studios/this_studio/utilitiess')
 from bbox_utils import get_center_of_bbox, measure_distance
+import numpy as np
+from tracking_framework.track_table import TrackTable
 
 class PlayerBallAssigner():
     def __init__(self):
         self.max_player_ball_distance = 70
-    
+
     def assign_ball_to_player(self,players,ball_bbox):
         ball_position = get_center_of_bbox(ball_bbox)
 
@@ -24,4 +26,117 @@ class PlayerBallAssigner():
                     miniumum_distance = distance
                     assigned_player = player_id
 
-        return assigned_player
\ No newline at end of file
+        return assigned_player
+
+    def build_assignment_arrays(self,tracks):
+        # Pack the ball and player tracks of a clip into padded arrays:
+        # ball_centers (F, 2) with NaN for frames without a ball, player_bboxes (F, P, 4) padded with NaN,
+        # player_ids (F, P) padded with -1 and player_teams (F, P) padded with 0
+        if isinstance(tracks, TrackTable):
+            return self.build_assignment_arrays_from_table(tracks)[:4]
+
+        number_of_frames = len(tracks['players'])
+        max_players = max((len(player_track) for player_track in tracks['players']), default=0)
+
+        ball_centers = np.full((number_of_frames, 2), np.nan)
+        player_bboxes = np.full((number_of_frames, max_players, 4), np.nan)
+        player_ids = np.full((number_of_frames, max_players), -1, dtype=np.int64)
+        player_teams = np.zeros((number_of_frames, max_players), dtype=np.int64)
+
+        for frame_num, player_track in enumerate(tracks['players']):
+            ball_track = tracks['ball'][frame_num]
+            if ball_track:
+                ball_centers[frame_num] = get_center_of_bbox(ball_track[1]['bbox'])
+
+            number_of_players = len(player_track)
+            if number_of_players == 0:
+                continue
+            player_ids[frame_num, :number_of_players] = list(player_track.keys())
+            player_bboxes[frame_num, :number_of_players] = [player['bbox'] for player in player_track.values()]
+            player_teams[frame_num, :number_of_players] = [player.get('team', 0) for player in player_track.values()]
+
+        return ball_centers, player_bboxes, player_ids, player_teams
+
+    def build_assignment_arrays_from_table(self,table):
+        # Same arrays as build_assignment_arrays, plus the table row behind every player slot (-1 for padding)
+        number_of_frames = table.number_of_frames
+
+        ball_rows = np.flatnonzero(table.object_mask('ball'))
+        ball_centers = np.full((number_of_frames, 2), np.nan)
+        ball_bbox = table.bbox[ball_rows]
+        ball_centers[table.frame[ball_rows]] = np.trunc(np.stack([ball_bbox[:, 0] + ball_bbox[:, 2], ball_bbox[:, 1] + ball_bbox[:, 3]], axis=1) / 2)
+
+        # Player rows are contiguous within a frame, so a row's slot is its offset from the frame's first player row
+        player_rows = np.flatnonzero(table.object_mask('players'))
+        player_frames = table.frame[player_rows]
+        slots = np.arange(len(player_rows)) - np.searchsorted(player_frames, player_frames)
+        max_players = slots.max() + 1 if len(slots) else 0
+
+        player_bboxes = np.full((number_of_frames, max_players, 4), np.nan)
+        player_ids = np.full((number_of_frames, max_players), -1, dtype=np.int64)
+        player_teams = np.zeros((number_of_frames, max_players), dtype=np.int64)
+        slot_rows = np.full((number_of_frames, max_players), -1, dtype=np.int64)
+
+        player_bboxes[player_frames, slots] = table.bbox[player_rows]
+        player_ids[player_frames, slots] = table.track_id[player_rows]
+        if 'team' in table:
+            player_teams[player_frames, slots] = table['team'][player_rows]
+        slot_rows[player_frames, slots] = player_rows
+
+        return ball_centers, player_bboxes, player_ids, player_teams, slot_rows
+
+    def assign_ball_to_players(self,ball_centers,player_bboxes,player_ids,player_teams,initial_team=0):
+        # Vectorized assign_ball_to_player over a whole clip or chunk.
+        # Returns the assigned player ID per frame (-1 if none) and the team in control of the ball,
+        # which carries the previous frame's team forward when nobody is close enough.
+        # initial_team is the team in control before the first frame, for continuing across chunks.
+        feet_y = player_bboxes[:, :, 3]
+        distance_left = ((player_bboxes[:, :, 0] - ball_centers[:, None, 0])**2 + (feet_y - ball_centers[:, None, 1])**2)**0.5
+        distance_right = ((player_bboxes[:, :, 2] - ball_centers[:, None, 0])**2 + (feet_y - ball_centers[:, None, 1])**2)**0.5
+        distances = np.fmin(distance_left, distance_right)
+
+        # Padding and missing balls produce NaN and are never assigned
+        distances = np.where(distances < self.max_player_ball_distance, distances, np.inf)
+
+        number_of_frames = distances.shape[0]
+        assigned_players = np.full(number_of_frames, -1, dtype=np.int64)
+        assigned_teams = np.zeros(number_of_frames, dtype=np.int64)
+        if distances.shape[1] > 0:
+            closest = distances.argmin(axis=1)
+            rows = np.arange(number_of_frames)
+            has_player = np.isfinite(distances[rows, closest])
+            assigned_players = np.where(has_player, player_ids[rows, closest], -1)
+            assigned_teams = player_teams[rows, closest]
+        else:
+            has_player = np.zeros(number_of_frames, dtype=bool)
+
+        # Forward fill the controlling team from the last frame with an assigned player
+        last_assigned = np.maximum.accumulate(np.where(has_player, np.arange(number_of_frames), -1)) if number_of_frames else np.zeros(0, dtype=np.int64)
+        team_ball_control = np.where(last_assigned >= 0, assigned_teams[np.maximum(last_assigned, 0)], initial_team)
+
+        return assigned_players, team_ball_control
+
+    def assign_ball_possession(self,tracks,initial_team=0):
+        # Marks the player with the ball in every frame and returns the team_ball_control array
+        if isinstance(tracks, TrackTable):
+            return self.assign_ball_possession_in_table(tracks, initial_team)
+
+        arrays = self.build_assignment_arrays(tracks)
+        assigned_players, team_ball_control = self.assign_ball_to_players(*arrays, initial_team=initial_team)
+
+        for frame_num in np.flatnonzero(assigned_players != -1):
+            tracks['players'][frame_num][assigned_players[frame_num]]['has_ball'] = True
+
+        return team_ball_control
+
+    def assign_ball_possession_in_table(self,table,initial_team=0):
+        ball_centers, player_bboxes, player_ids, player_teams, slot_rows = self.build_assignment_arrays_from_table(table)
+        assigned_players, team_ball_control = self.assign_ball_to_players(ball_centers, player_bboxes, player_ids, player_teams, initial_team=initial_team)
+
+        has_ball = table.empty_column('has_ball')
+        assigned_frames = np.flatnonzero(assigned_players != -1)
+        assigned_slots = (player_ids[assigned_frames] == assigned_players[assigned_frames, None]).argmax(axis=1)
+        has_ball[slot_rows[assigned_frames, assigned_slots]] = True
+        table['has_ball'] = has_ball
+
+        return team_ball_control
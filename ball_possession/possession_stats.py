@@ -0,0 +1,145 @@
+import threading
+import numpy as np
+from tracking_framework.track_table import TrackTable
+
+class PossessionStats:
+    # Incremental ball control statistics. Frames are appended as they are analyzed (one at a time or a chunk at once)
+    # and every query is answered from prefix counts, so the cost per frame stays constant over a whole match and
+    # a live dashboard can poll it at any time.
+    # Teams are 1 and 2; frames with team 0 (nobody has had the ball yet) count for neither.
+    # Pitch zones split the bounds of the pitch coordinates into zone_grid = (columns along x, rows along y) cells,
+    # numbered row by row; frames without a pitch position for the ball have no zone.
+    def __init__(self, frame_rate=24, zone_grid=(3, 3), pitch_bounds=((0, 0), (23.32, 68))):
+        self.frame_rate = frame_rate
+        self.zone_grid = zone_grid
+        self.pitch_bounds = np.asarray(pitch_bounds, dtype=np.float64)
+        self.number_of_zones = zone_grid[0] * zone_grid[1]
+        self.lock = threading.Lock()
+
+        # prefix_counts[f] holds the frames of (no team, team 1, team 2) before frame f; grown by doubling
+        self.prefix_counts = np.zeros((1024, 3), dtype=np.int64)
+        self.number_of_frames = 0
+        self.zone_counts = np.zeros((self.number_of_zones, 3), dtype=np.int64)
+
+    @classmethod
+    def from_tracks(cls, tracks, team_ball_control, frame_rate=24, zone_grid=(3, 3), pitch_bounds=((0, 0), (23.32, 68)),
+                    view_transformer=None, camera_movement_per_frame=None):
+        stats = cls(frame_rate, zone_grid, pitch_bounds)
+        stats.extend(team_ball_control, ball_pitch_positions(tracks, view_transformer, camera_movement_per_frame))
+        return stats
+
+    @classmethod
+    def from_team_ball_control(cls, team_ball_control, frame_rate=24):
+        stats = cls(frame_rate)
+        stats.extend(team_ball_control)
+        return stats
+
+    def __len__(self):
+        return self.number_of_frames
+
+    def zone_index(self, positions):
+        # Zone of each (x, y) pitch position, or -1 outside the pitch bounds or for NaN
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        (x_min, y_min), (x_max, y_max) = self.pitch_bounds
+        columns, rows = self.zone_grid
+        with np.errstate(invalid='ignore'):
+            column = np.floor((positions[:, 0] - x_min) / (x_max - x_min) * columns)
+            row = np.floor((positions[:, 1] - y_min) / (y_max - y_min) * rows)
+            # Points on the far edge belong to the last zone
+            column = np.where(positions[:, 0] == x_max, columns - 1, column)
+            row = np.where(positions[:, 1] == y_max, rows - 1, row)
+            inside = (column >= 0) & (column < columns) & (row >= 0) & (row < rows)
+        return np.where(inside, np.nan_to_num(row) * columns + np.nan_to_num(column), -1).astype(np.int64)
+
+    def extend(self, teams, ball_positions=None):
+        # Append the controlling team of consecutive frames, with the ball's pitch position per frame if known
+        teams = np.asarray(teams, dtype=np.int64).reshape(-1)
+        team_counts = np.stack([teams == 0, teams == 1, teams == 2], axis=1).astype(np.int64)
+        zones = self.zone_index(ball_positions) if ball_positions is not None else np.full(len(teams), -1)
+
+        with self.lock:
+            start = self.number_of_frames
+            end = start + len(teams)
+            if end + 1 > len(self.prefix_counts):
+                grown = np.zeros((max(2 * len(self.prefix_counts), end + 1), 3), dtype=np.int64)
+                grown[:start + 1] = self.prefix_counts[:start + 1]
+                self.prefix_counts = grown
+            self.prefix_counts[start + 1:end + 1] = self.prefix_counts[start] + np.cumsum(team_counts, axis=0)
+
+            in_zone = zones >= 0
+            np.add.at(self.zone_counts, zones[in_zone], team_counts[in_zone])
+            self.number_of_frames = end
+
+    def update(self, team, ball_position=None):
+        self.extend([team], None if ball_position is None else [ball_position])
+
+    def frame_counts(self, start_frame=0, end_frame=None):
+        # Frames each team controlled in [start_frame, end_frame), as (team 1, team 2)
+        end_frame = self.number_of_frames if end_frame is None else min(end_frame, self.number_of_frames)
+        counts = self.prefix_counts[end_frame] - self.prefix_counts[max(start_frame, 0)]
+        return counts[1], counts[2]
+
+    def shares(self, team_1_frames, team_2_frames):
+        total_frames = team_1_frames + team_2_frames
+        if total_frames == 0:
+            return 0.0, 0.0
+        return float(team_1_frames / total_frames), float(team_2_frames / total_frames)
+
+    def possession(self, frame_num=None):
+        # Share of ball control of each team up to and including frame_num (the latest frame by default)
+        end_frame = self.number_of_frames if frame_num is None else frame_num + 1
+        return self.shares(*self.frame_counts(0, end_frame))
+
+    def window_possession(self, start_frame, end_frame):
+        return self.shares(*self.frame_counts(start_frame, end_frame))
+
+    def possession_by_window(self, window_seconds=300):
+        # (start second, team 1 share, team 2 share) for consecutive windows of window_seconds
+        window_frames = max(int(round(window_seconds * self.frame_rate)), 1)
+        boundaries = np.r_[np.arange(0, self.number_of_frames, window_frames), self.number_of_frames]
+        counts = np.diff(self.prefix_counts[boundaries], axis=0)
+        totals = np.maximum(counts[:, 1] + counts[:, 2], 1)
+        return np.stack([boundaries[:-1] / self.frame_rate, counts[:, 1] / totals, counts[:, 2] / totals], axis=1)
+
+    def possession_by_zone(self):
+        # (zones, 2) frames each team controlled the ball while it was in each zone
+        return self.zone_counts[:, 1:].copy()
+
+    def summary(self, window_seconds=300):
+        team_1, team_2 = self.possession()
+        return {
+            "frames": self.number_of_frames,
+            "possession": {"team_1": team_1, "team_2": team_2},
+            "windows": self.possession_by_window(window_seconds).tolist(),
+            "zones": self.possession_by_zone().tolist(),
+        }
+
+def ball_pitch_positions(tracks, view_transformer=None, camera_movement_per_frame=None):
+    # (frames, 2) pitch position of the ball per frame, NaN where it has none.
+    # The ball is interpolated after the view transform, so with a view_transformer the positions are computed
+    # from the ball bboxes the same way as for every other object: bbox center, minus camera movement, transformed.
+    if isinstance(tracks, TrackTable):
+        number_of_frames = tracks.number_of_frames
+        ball_rows = np.flatnonzero(tracks.object_mask('ball'))
+        ball_frames = tracks.frame[ball_rows]
+        ball_bboxes = tracks.bbox[ball_rows]
+        # Only read when needed, so a lazy position_transformed column is not computed for nothing
+        transformed = tracks['position_transformed'][ball_rows] if view_transformer is None and 'position_transformed' in tracks else None
+    else:
+        number_of_frames = len(tracks['ball'])
+        ball_frames = np.array([frame_num for frame_num, ball_track in enumerate(tracks['ball']) if 1 in ball_track], dtype=np.int64)
+        ball_bboxes = np.array([tracks['ball'][frame_num][1]['bbox'] for frame_num in ball_frames], dtype=np.float64).reshape(-1, 4)
+        transformed = np.array([
+            [np.nan, np.nan] if tracks['ball'][frame_num][1].get('position_transformed') is None else tracks['ball'][frame_num][1]['position_transformed']
+            for frame_num in ball_frames
+        ], dtype=np.float64).reshape(-1, 2)
+
+    positions = np.full((number_of_frames, 2), np.nan)
+    if view_transformer is not None:
+        centers = np.trunc(np.stack([ball_bboxes[:, 0] + ball_bboxes[:, 2], ball_bboxes[:, 1] + ball_bboxes[:, 3]], axis=1) / 2)
+        if camera_movement_per_frame is not None:
+            centers -= np.asarray(camera_movement_per_frame, dtype=np.float64).reshape(-1, 2)[ball_frames]
+        positions[ball_frames] = view_transformer.transform_points(centers)
+    elif transformed is not None:
+        positions[ball_frames] = transformed
+    return positions
@@ -0,0 +1,85 @@
+import argparse
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Make the repository root and utilities importable when run as a script
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, 'utilities'))
+
+from benchmarks.synthetic_tracks import make_synthetic_table, make_synthetic_camera_movement
+from motion_metrics.speed_and_distance_estimator import SpeedAndDistance_Estimator
+from view_transformer.view_transformer import ViewTransformer
+from export.track_export import export_tracks, TrackReader, pa
+
+# Compares the columnar export with a pickle of the nested tracks dict on a synthetic match:
+# file size, write time, full load time, and the time to read one player or one minute of play.
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def save_pickle(path, value):
+    with open(path, 'wb') as f:
+        pickle.dump(value, f)
+
+def load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=13500, help='Synthetic match length (the pickle side builds the full tracks dict)')
+    parser.add_argument('--frame-rate', type=int, default=25)
+    args = parser.parse_args()
+
+    # Every column the analysis stages add, so the export is as wide as a real one
+    table = make_synthetic_table(args.frames)
+    camera_movement = make_synthetic_camera_movement(args.frames)
+    table['position'] = np.stack([np.trunc((table.bbox[:, 0] + table.bbox[:, 2]) / 2), np.trunc(table.bbox[:, 3])], axis=1)
+    table['position_adjusted'] = table['position'] - np.asarray(camera_movement)[table.frame]
+    table['position_transformed'] = ViewTransformer().transform_points(table['position_adjusted'])
+    SpeedAndDistance_Estimator(frame_rate=args.frame_rate).add_speed_and_distance_to_tracks(table)
+    team_ball_control = np.random.default_rng(0).integers(1, 3, args.frames)
+
+    workdir = tempfile.mkdtemp()
+    try:
+        rows = []
+        tracks = table.to_tracks()
+        pickle_path = os.path.join(workdir, 'tracks.pkl')
+        _, write_time = timed(lambda: save_pickle(pickle_path, tracks))
+        _, load_time = timed(lambda: load_pickle(pickle_path))
+        rows.append(("pickle", os.path.getsize(pickle_path), write_time, load_time, load_time, load_time))
+        del tracks
+
+        player_id = int(table.track_id[table.object_mask('players')][0])
+        minute = (args.frames // 2, args.frames // 2 + 60 * args.frame_rate)
+        for export_format in ('npy', 'parquet'):
+            if export_format == 'parquet' and pa is None:
+                print("pyarrow not installed, skipping Parquet")
+                continue
+            path = os.path.join(workdir, export_format)
+            _, write_time = timed(lambda: export_tracks(path, table, team_ball_control, camera_movement, frame_rate=args.frame_rate, format=export_format))
+            _, load_time = timed(lambda: TrackReader(path).to_table())
+            _, player_time = timed(lambda: TrackReader(path).track(player_id))
+            _, range_time = timed(lambda: TrackReader(path).frame_range(*minute))
+            rows.append((export_format, directory_size(path), write_time, load_time, player_time, range_time))
+    finally:
+        shutil.rmtree(workdir)
+
+    print(f"{len(table)} rows over {args.frames} frames")
+    print(f"{'format':<10} {'MB':>8} {'write s':>9} {'load s':>9} {'player s':>9} {'minute s':>9}")
+    for name, size, write_time, load_time, player_time, range_time in rows:
+        print(f"{name:<10} {size / 1024**2:>8.1f} {write_time:>9.3f} {load_time:>9.3f} {player_time:>9.4f} {range_time:>9.4f}")
+
+if __name__ == '__main__':
+    main()
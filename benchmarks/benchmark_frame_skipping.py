@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+import time
+
+# Make the repository root and utilities importable when run as a script
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, 'utilities'))
+
+from tracking_framework.track_object import Tracker
+from tracking_framework.track_evaluation import compare_tracks
+from utilities.video_utils import read_video_chunks, get_video_properties
+
+# Tracks the same clip at full rate and with detection frame-skipping, and reports the throughput
+# of each setting next to its box recall, precision and mean IoU against the full-rate tracks.
+
+def track_video(model_path, video_path, chunk_size, detection_stride, motion_threshold):
+    tracker = Tracker(model_path, detection_stride=detection_stride, motion_threshold=motion_threshold)
+    tracks = tracker.create_empty_tracks()
+    start = time.perf_counter()
+    for frames in read_video_chunks(video_path, chunk_size):
+        tracker.add_chunk_to_tracks(frames, tracks)
+    return tracks, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='runs/detect/train/weights/best.pt')
+    parser.add_argument('--video', default='demo_vid_1.mp4')
+    parser.add_argument('--chunk-size', type=int, default=120)
+    parser.add_argument('--strides', type=int, nargs='+', default=[2, 3, 5, 10])
+    parser.add_argument('--motion-threshold', type=float, default=None)
+    args = parser.parse_args()
+
+    frame_count = get_video_properties(args.video)["frame_count"]
+
+    reference_tracks, reference_elapsed = track_video(args.model, args.video, args.chunk_size, 1, None)
+    print(f"{'stride':>6} {'fps':>8} {'speedup':>8} {'recall':>7} {'precision':>9} {'mean IoU':>8} {'ball recall':>11}")
+    print(f"{1:>6} {frame_count / reference_elapsed:>8.1f} {1:>7.2f}x {1:>7.3f} {1:>9.3f} {1:>8.3f} {1:>11.3f}")
+
+    for detection_stride in args.strides:
+        tracks, elapsed = track_video(args.model, args.video, args.chunk_size, detection_stride, args.motion_threshold)
+        report = compare_tracks(reference_tracks, tracks)
+        print(
+            f"{detection_stride:>6} {frame_count / elapsed:>8.1f} {reference_elapsed / elapsed:>7.2f}x "
+            f"{report['all']['recall']:>7.3f} {report['all']['precision']:>9.3f} {report['all']['mean_iou']:>8.3f} "
+            f"{report['ball']['recall']:>11.3f}"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+# Make the repository root and utilities importable when run as a script
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, 'utilities'))
+
+from camera_motion_analysis.camera_movement_estimator import CameraMovementEstimator
+from team_identifier.team_assigner import TeamAssigner
+from utilities.shared_frames import SharedFrameRing
+
+# Measures the cost of handing frames to stages in other processes. Each frame goes to two consumer processes,
+# camera movement and team color crops, either pickled through a ProcessPoolExecutor or as a FrameRef into a
+# SharedFrameRing, and the same stages run in this process as the no-IPC baseline.
+# With --stages none, the consumers only touch the frame, so the times are the IPC cost alone.
+
+CONSUMERS = ("camera", "team")
+
+# State of a consumer process: its stage objects and the attached ring
+_ring = None
+_camera_movement_estimator = None
+_team_assigner = None
+
+def player_bboxes(frame_shape, count=20):
+    # Fixed player-sized boxes spread over the frame, standing in for one frame of detections
+    height, width = frame_shape[:2]
+    rng = np.random.default_rng(0)
+    x1 = rng.uniform(0, width - 40, count)
+    y1 = rng.uniform(0, height - 90, count)
+    return np.stack([x1, y1, x1 + 40, y1 + 90], axis=1).tolist()
+
+def init_consumer(spec):
+    global _ring
+    if spec is not None:
+        _ring = SharedFrameRing.attach(spec)
+
+def run_stage(consumer, stages, frame):
+    global _camera_movement_estimator, _team_assigner
+    if stages == 'none':
+        return int(frame[0, 0, 0])
+    if consumer == 'camera':
+        if _camera_movement_estimator is None:
+            _camera_movement_estimator = CameraMovementEstimator(frame)
+        return _camera_movement_estimator.get_camera_movement_chunk([frame])[0]
+    if _team_assigner is None:
+        _team_assigner = TeamAssigner()
+    return _team_assigner.get_player_features(frame, player_bboxes(frame.shape))[0]
+
+def consume_frame(consumer, stages, frame):
+    return run_stage(consumer, stages, frame)
+
+def consume_shared(consumer, stages, ref):
+    try:
+        return run_stage(consumer, stages, _ring.frame(ref))
+    finally:
+        _ring.release(ref)
+
+def make_synthetic_frames(frame_shape, distinct=8):
+    # A few distinct noise frames, made before timing; noise keeps the frames from compressing or caching well
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, frame_shape, dtype=np.uint8) for _ in range(distinct)]
+
+def synthetic_frames(distinct_frames, count):
+    for frame_index in range(count):
+        yield distinct_frames[frame_index % len(distinct_frames)]
+
+def decoded_frames(video_path, count):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        for _ in range(count):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+def run_local(frames, stages):
+    global _camera_movement_estimator, _team_assigner
+    _camera_movement_estimator = _team_assigner = None
+    start = time.perf_counter()
+    count = 0
+    for frame in frames:
+        for consumer in CONSUMERS:
+            run_stage(consumer, stages, frame)
+        count += 1
+    return count, time.perf_counter() - start
+
+def start_pools(context, spec=None):
+    # One single-process pool per consumer, so each stage sees the frames in order like in a pipeline
+    pools = {consumer: ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=init_consumer, initargs=(spec,)) for consumer in CONSUMERS}
+    # Start the processes before timing
+    for pool in pools.values():
+        pool.submit(int, 0).result()
+    return pools
+
+def stop_pools(pools):
+    for pool in pools.values():
+        pool.shutdown()
+
+def run_pickled(frames, stages, context, in_flight):
+    pools = start_pools(context)
+    try:
+        start = time.perf_counter()
+        count = 0
+        pending = []
+        for frame in frames:
+            # Bound the frames in flight like the ring does, so both runs hold the same number of frames
+            if len(pending) >= in_flight * len(CONSUMERS):
+                pending.pop(0).result()
+            for consumer in CONSUMERS:
+                pending.append(pools[consumer].submit(consume_frame, consumer, stages, frame))
+            count += 1
+        for future in pending:
+            future.result()
+        return count, time.perf_counter() - start
+    finally:
+        stop_pools(pools)
+
+def run_shared(ring, refs, stages, context):
+    pools = start_pools(context, ring.spec())
+    try:
+        start = time.perf_counter()
+        count = 0
+        pending = []
+        for ref in refs:
+            for consumer in CONSUMERS:
+                pending.append(pools[consumer].submit(consume_shared, consumer, stages, ref))
+            count += 1
+            # Drop finished futures, raising their errors; the ring itself bounds the frames in flight
+            if len(pending) > 4 * ring.slots * len(CONSUMERS):
+                still_pending = []
+                for future in pending:
+                    if future.done():
+                        future.result()
+                    else:
+                        still_pending.append(future)
+                pending = still_pending
+        for future in pending:
+            future.result()
+        return count, time.perf_counter() - start
+    finally:
+        stop_pools(pools)
+
+def shared_synthetic_refs(ring, frames):
+    # The frames exist before the benchmark, so the ring copies them in once; a decoder writes into the slot instead
+    for frame_index, frame in enumerate(frames):
+        ref = ring.put(frame, frame_index)
+        ring.retain(ref, len(CONSUMERS))
+        yield ref
+        ring.release(ref)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--video', default='demo_vid_1.mp4')
+    parser.add_argument('--slots', type=int, default=8, help='Ring slots, and the frames in flight for the pickled run')
+    parser.add_argument('--stages', choices=('none', 'real'), default=None, help='Run only with these consumer stages (default: both)')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    synthetic_shape = (args.height, args.width, 3)
+
+    distinct_frames = make_synthetic_frames(synthetic_shape)
+    sources = [("synthetic", synthetic_shape)]
+    if os.path.exists(args.video):
+        cap = cv2.VideoCapture(args.video)
+        video_shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+        cap.release()
+        sources.append((args.video, video_shape))
+    else:
+        print(f"{args.video} not found, skipping decoded frames")
+
+    print(f"{'source':<16} {'stages':<6} {'mode':<8} {'frames':>7} {'s':>7} {'fps':>8} {'ms/frame over local':>20}")
+    for stages in ('none', 'real') if args.stages is None else (args.stages,):
+        for source, frame_shape in sources:
+            def frames():
+                if source == "synthetic":
+                    return synthetic_frames(distinct_frames, args.frames)
+                return decoded_frames(source, args.frames)
+
+            results = {"local": run_local(frames(), stages)}
+            results["pickle"] = run_pickled(frames(), stages, context, args.slots)
+            with SharedFrameRing(args.slots, frame_shape, context=context) as ring:
+                if source == "synthetic":
+                    refs = shared_synthetic_refs(ring, frames())
+                else:
+                    refs = ring.read_frames(source, consumers=len(CONSUMERS), end_frame=args.frames)
+                results["shared"] = run_shared(ring, refs, stages, context)
+                # Every consumer released every frame
+                assert ring.in_use() == 0
+
+            local_per_frame = results["local"][1] / max(results["local"][0], 1)
+            for mode, (count, elapsed) in results.items():
+                overhead = (elapsed / max(count, 1) - local_per_frame) * 1000
+                print(f"{source:<16} {stages:<6} {mode:<8} {count:>7} {elapsed:>7.2f} {count / elapsed:>8.1f} {overhead:>20.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import pickle
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+# Make the repository root and utilities importable when run as a script
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, 'utilities'))
+
+from benchmarks.synthetic_tracks import make_synthetic_table, make_synthetic_camera_movement
+from tracking_framework.track_object import Tracker
+from tracking_framework.track_table import TrackTable
+from team_identifier.team_assigner import TeamAssigner
+from ball_possession.player_ball_assigner import PlayerBallAssigner
+from camera_motion_analysis.camera_movement_estimator import CameraMovementEstimator
+from view_transformer.view_transformer import ViewTransformer
+from motion_metrics.speed_and_distance_estimator import SpeedAndDistance_Estimator
+from utilities.video_utils import read_video_frames
+from visualization.annotation_renderer import AnnotationRenderer
+
+# Times every analysis stage on its own and stores the results under benchmarks/results/<commit>.json,
+# so a later run can be compared against any earlier commit with --compare.
+#   Track stages run on synthetic matches: the TrackTable path at full match size, the dict path on a shorter match.
+#   Team assignment and drawing run on the first frames of the demo clip with the stub tracks.
+
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+
+def time_stage(setup, run, repeats):
+    # setup builds fresh inputs for each repeat and is not timed
+    times = []
+    for _ in range(repeats):
+        inputs = setup()
+        start = time.perf_counter()
+        run(*inputs)
+        times.append(time.perf_counter() - start)
+    return {"best": min(times), "median": statistics.median(times), "repeats": repeats}
+
+def copy_table(table, columns=()):
+    return TrackTable(table.frame, table.track_id, table.object_class, table.bbox, table.number_of_frames,
+                      {name: table[name].copy() for name in columns if name in table})
+
+class StageBenchmarks:
+    def __init__(self, model_path, video_path, stub_path, frames, dict_frames, clip_frames):
+        self.tracker = Tracker(model_path)
+        self.team_assigner = TeamAssigner()
+        self.player_assigner = PlayerBallAssigner()
+        self.view_transformer = ViewTransformer()
+        self.speed_and_distance_estimator = SpeedAndDistance_Estimator()
+        self.renderer = AnnotationRenderer(self.tracker)
+
+        self.table = make_synthetic_table(frames)
+        self.dict_table = make_synthetic_table(dict_frames)
+        self.camera_movement = make_synthetic_camera_movement(frames)
+
+        # Demo clip and its stub tracks with every analysis column filled in, for team assignment and drawing
+        self.clip = [frame for frame, _ in zip(read_video_frames(video_path), range(clip_frames))]
+        with open(stub_path, 'rb') as f:
+            stub_tracks = pickle.load(f)
+        self.camera_movement_estimator = CameraMovementEstimator(self.clip[0])
+        self.clip_camera_movement = self.camera_movement_estimator.get_camera_movement(self.clip)
+        clip_tracks = {object_name: object_tracks[:len(self.clip)] for object_name, object_tracks in stub_tracks.items()}
+        self.clip_tracks = self.analyzed_table(TrackTable.from_tracks(clip_tracks), self.clip_camera_movement).to_tracks()
+        self.clip_team_ball_control = self.player_assigner.assign_ball_possession(self.clip_tracks)
+
+    def analyzed_table(self, table, camera_movement):
+        self.tracker.add_position_to_tracks(table)
+        self.camera_movement_estimator.add_adjust_positions_to_tracks(table, camera_movement)
+        self.view_transformer.add_transformed_position_to_tracks(table)
+        self.speed_and_distance_estimator.add_speed_and_distance_to_tracks(table)
+        return table
+
+    def prepared_table(self, table, columns):
+        # Table with the inputs of a stage already computed
+        camera_movement = make_synthetic_camera_movement(table.number_of_frames)
+        prepared = copy_table(table, ('team', 'team_color'))
+        if 'position' in columns:
+            self.tracker.add_position_to_tracks(prepared)
+        if 'position_adjusted' in columns:
+            self.camera_movement_estimator.add_adjust_positions_to_tracks(prepared, camera_movement)
+        if 'position_transformed' in columns:
+            self.view_transformer.add_transformed_position_to_tracks(prepared)
+        return prepared
+
+    def track_stages(self):
+        # name -> (columns the stage needs, stage function taking tracks and camera movement)
+        return {
+            "add_position_to_tracks": ((), lambda tracks, camera_movement: self.tracker.add_position_to_tracks(tracks)),
+            "add_adjust_positions_to_tracks": (('position',), self.camera_movement_estimator.add_adjust_positions_to_tracks),
+            "add_transformed_position_to_tracks": (('position', 'position_adjusted'), lambda tracks, camera_movement: self.view_transformer.add_transformed_position_to_tracks(tracks)),
+            "add_speed_and_distance_to_tracks": (('position', 'position_adjusted', 'position_transformed'), lambda tracks, camera_movement: self.speed_and_distance_estimator.add_speed_and_distance_to_tracks(tracks)),
+            "assign_ball_possession": ((), lambda tracks, camera_movement: self.player_assigner.assign_ball_possession(tracks)),
+        }
+
+    def run(self, repeats):
+        results = {}
+
+        for name, (columns, stage) in self.track_stages().items():
+            prepared = self.prepared_table(self.table, columns)
+            camera_movement = self.camera_movement.tolist()
+            results[f"table/{name}"] = dict(
+                time_stage(lambda: (copy_table(prepared, prepared.columns), camera_movement), stage, repeats),
+                frames=self.table.number_of_frames, rows=len(self.table),
+            )
+
+            dict_prepared = self.prepared_table(self.dict_table, columns)
+            dict_camera_movement = camera_movement[:self.dict_table.number_of_frames]
+            results[f"dict/{name}"] = dict(
+                time_stage(lambda: (dict_prepared.to_tracks(), dict_camera_movement), stage, repeats),
+                frames=self.dict_table.number_of_frames, rows=len(self.dict_table),
+            )
+
+        clip_frames = len(self.clip)
+        results["clip/team_assignment"] = dict(time_stage(lambda: (TeamAssigner(),), self.assign_clip_teams, repeats), frames=clip_frames)
+        results["clip/draw_annotations"] = dict(time_stage(
+            lambda: (), lambda: self.tracker.draw_annotations(self.clip, self.clip_tracks, self.clip_team_ball_control), repeats), frames=clip_frames)
+        results["clip/draw_camera_movement"] = dict(time_stage(
+            lambda: (), lambda: self.camera_movement_estimator.draw_camera_movement(self.clip, self.clip_camera_movement), repeats), frames=clip_frames)
+        results["clip/draw_speed_and_distance"] = dict(time_stage(
+            lambda: ([frame.copy() for frame in self.clip],), lambda frames: self.speed_and_distance_estimator.draw_speed_and_distance(frames, self.clip_tracks), repeats), frames=clip_frames)
+        results["clip/render_frames"] = dict(time_stage(
+            lambda: ([frame.copy() for frame in self.clip],),
+            lambda frames: list(self.renderer.render_frames(frames, self.clip_tracks, self.clip_team_ball_control, self.clip_camera_movement)), repeats), frames=clip_frames)
+
+        for result in results.values():
+            result["fps"] = result["frames"] / result["best"] if result["best"] > 0 else None
+        return results
+
+    def assign_clip_teams(self, team_assigner):
+        team_assigner.assign_team_color(self.clip[0], self.clip_tracks['players'][0])
+        for frame_num, frame in enumerate(self.clip):
+            team_assigner.get_player_teams(frame, self.clip_tracks['players'][frame_num])
+
+def current_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{commit}-dirty" if dirty else commit
+
+def load_results(reference):
+    # reference is a results file or a commit prefix with a file in RESULTS_DIR
+    if os.path.exists(reference):
+        path = reference
+    else:
+        matches = sorted(name for name in os.listdir(RESULTS_DIR) if name.startswith(reference) and name.endswith('.json'))
+        if not matches:
+            raise FileNotFoundError(f"No benchmark results for {reference!r} in {RESULTS_DIR}")
+        path = os.path.join(RESULTS_DIR, matches[0])
+    with open(path) as f:
+        return json.load(f)
+
+def print_results(results, reference=None, regression_threshold=0.1):
+    header = f"{'stage':<45} {'best s':>9} {'median s':>9} {'fps':>10}"
+    if reference is not None:
+        header += f" {'ref s':>9} {'ratio':>7}"
+    print(header)
+
+    regressions = []
+    for name, result in results["stages"].items():
+        fps = f"{result['fps']:.1f}" if result["fps"] is not None else "-"
+        line = f"{name:<45} {result['best']:>9.4f} {result['median']:>9.4f} {fps:>10}"
+        reference_result = reference["stages"].get(name) if reference is not None else None
+        if reference_result is not None:
+            ratio = result["best"] / reference_result["best"] if reference_result["best"] > 0 else float('inf')
+            line += f" {reference_result['best']:>9.4f} {ratio:>6.2f}x"
+            if ratio > 1 + regression_threshold:
+                line += "  slower"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='yolov8n.yaml', help='Only needed to construct Tracker; no stage here runs the detector')
+    parser.add_argument('--video', default=os.path.join(REPO_ROOT, 'demo_vid_1.mp4'))
+    parser.add_argument('--stub', default=os.path.join(REPO_ROOT, 'stubs', 'track_stubs.pkl'))
+    parser.add_argument('--frames', type=int, default=135000, help='Synthetic match length for the TrackTable stages (90 minutes at 25 fps)')
+    parser.add_argument('--dict-frames', type=int, default=13500, help='Synthetic match length for the dict-based stages')
+    parser.add_argument('--clip-frames', type=int, default=120, help='Demo clip frames for team assignment and drawing')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--compare', default=None, help='Results file or commit to compare against, e.g. a1b2c3d')
+    parser.add_argument('--regression-threshold', type=float, default=0.1, help='Flag stages this much slower than the reference')
+    args = parser.parse_args()
+
+    # Load the reference first, since this run may overwrite the results of the same commit
+    reference = load_results(args.compare) if args.compare is not None else None
+
+    benchmarks = StageBenchmarks(args.model, args.video, args.stub, args.frames, args.dict_frames, args.clip_frames)
+    results = {
+        "commit": current_commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": vars(args),
+        "stages": benchmarks.run(args.repeats),
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_path = os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    with open(results_path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    regressions = print_results(results, reference, args.regression_threshold)
+    print(f"results saved to {results_path}")
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than {reference['commit']}: {', '.join(regressions)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import os
+import sys
+import time
+
+# Make the repository root and utilities importable when run as a script
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, 'utilities'))
+
+from pipeline.streaming_pipeline import StreamingPipeline
+from utilities.video_utils import get_video_properties
+
+# Runs the streaming pipeline end to end on the same clip with and without background
+# decode/encode threads and reports the throughput of each run.
+
+def time_pipeline(model_path, video_path, output_video_path, chunk_size, threaded_io):
+    pipeline = StreamingPipeline(model_path, chunk_size=chunk_size, threaded_io=threaded_io)
+    start = time.perf_counter()
+    pipeline.run(video_path, output_video_path)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='runs/detect/train/weights/best.pt')
+    parser.add_argument('--video', default='demo_vid_1.mp4')
+    parser.add_argument('--output', default='output_videos/benchmark_threaded_io.avi')
+    parser.add_argument('--chunk-size', type=int, default=120)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    frame_count = get_video_properties(args.video)["frame_count"]
+
+    results = {}
+    for threaded_io in (False, True):
+        # Keep the best of several runs to reduce noise from model warm-up and disk cache
+        elapsed = min(time_pipeline(args.model, args.video, args.output, args.chunk_size, threaded_io) for _ in range(args.repeats))
+        results[threaded_io] = elapsed
+        label = "threaded" if threaded_io else "sequential"
+        print(f"{label:>10}: {elapsed:.2f}s ({frame_count / elapsed:.1f} fps)")
+
+    print(f"speedup: {results[False] / results[True]:.2f}x")
+
+if __name__ == '__main__':
+    main()
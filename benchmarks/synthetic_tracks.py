@@ -0,0 +1,73 @@
+import numpy as np
+from tracking_framework.track_table import TrackTable, OBJECT_CLASSES
+
+# Synthetic match data at realistic sizes for benchmarks, e.g. 22 players over a 90 minute match at 25 fps (135k frames).
+# Objects wander across the frame with smooth random walks, reflected at the frame edges.
+
+def reflect(values, low, high):
+    span = high - low
+    values = np.mod(values - low, 2 * span)
+    return low + span - np.abs(values - span)
+
+def random_walks(rng, number_of_frames, number_of_objects, frame_size, step=2.0):
+    width, height = frame_size
+    start = rng.uniform((0, 0), (width, height), size=(number_of_objects, 2))
+    velocity = np.cumsum(rng.normal(0, 0.05, size=(number_of_frames, number_of_objects, 2)), axis=0).clip(-step, step)
+    positions = start + np.cumsum(velocity, axis=0)
+    return np.stack([reflect(positions[..., 0], 0, width), reflect(positions[..., 1], 0, height)], axis=-1)
+
+def make_synthetic_table(number_of_frames, players=22, referees=3, ball_visibility=0.8, frame_size=(1280, 720), seed=0):
+    # TrackTable with bboxes for every player and referee in every frame, a ball in ball_visibility of the frames,
+    # and team/team_color columns for the players (the first half of the IDs is team 1)
+    rng = np.random.default_rng(seed)
+
+    per_class = []
+    for class_index, (object_name, count, box_size) in enumerate([
+        ("players", players, (36, 80)),
+        ("referees", referees, (36, 80)),
+        ("ball", 1, (12, 12)),
+    ]):
+        feet = random_walks(rng, number_of_frames, count, frame_size)
+        box_width, box_height = box_size
+        bbox = np.concatenate([
+            feet[..., 0:1] - box_width / 2, feet[..., 1:2] - box_height,
+            feet[..., 0:1] + box_width / 2, feet[..., 1:2],
+        ], axis=-1)
+
+        visible = np.ones((number_of_frames, count), dtype=bool)
+        if object_name == "ball":
+            visible = rng.random((number_of_frames, 1)) < ball_visibility
+            track_ids = np.ones(count, dtype=np.int64)
+        elif object_name == "referees":
+            track_ids = np.arange(players + 1, players + count + 1)
+        else:
+            track_ids = np.arange(1, count + 1)
+
+        frames = np.broadcast_to(np.arange(number_of_frames)[:, None], (number_of_frames, count))
+        per_class.append((
+            frames[visible],
+            np.broadcast_to(track_ids, (number_of_frames, count))[visible],
+            np.full(visible.sum(), class_index),
+            bbox[visible],
+        ))
+
+    frame, track_id, object_class, bbox = (np.concatenate(parts) for parts in zip(*per_class))
+    order = np.lexsort((object_class, frame))
+    table = TrackTable(frame[order], track_id[order], object_class[order], bbox[order], number_of_frames)
+
+    # Team 1 is the first half of the player IDs, team 2 the rest
+    players_mask = table.object_mask(OBJECT_CLASSES[0])
+    team = table.empty_column('team')
+    team[players_mask] = np.where(table.track_id[players_mask] <= players // 2, 1, 2)
+    team_color = table.empty_column('team_color')
+    team_color[team == 1] = (255, 255, 255)
+    team_color[team == 2] = (40, 160, 40)
+    table['team'] = team
+    table['team_color'] = team_color
+    return table
+
+def make_synthetic_camera_movement(number_of_frames, seed=0):
+    # Mostly still camera with occasional pans, like the output of CameraMovementEstimator
+    rng = np.random.default_rng(seed)
+    moving = rng.random(number_of_frames) < 0.05
+    return np.where(moving[:, None], rng.normal(0, 8, size=(number_of_frames, 2)), 0.0)
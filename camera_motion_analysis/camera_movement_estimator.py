@@ -9,9 +9,20 @@ sys.path.append('/teamspace/studios/this_studio/utilities')
 
 # Import utility functions
 from bbox_utils import measure_distance, measure_xy_distance
+from tracking_framework.track_table import TrackTable
+
+# Ways to turn the per-feature displacements of a frame into one camera movement
+MOVEMENT_ESTIMATORS = ('max', 'median', 'affine')
 
 class CameraMovementEstimator:
-    def __init__(self, frame):
+    # Optical flow runs on grayscale frames downscaled by scale; movements are always reported in full-resolution pixels.
+    # estimator='max' reproduces the original largest-displacement movement, 'median' and 'affine' (a RANSAC
+    # partial affine fit, evaluated at the frame center) ignore the few features that were tracked badly.
+    def __init__(self, frame, scale=1.0, estimator='max'):
+        if estimator not in MOVEMENT_ESTIMATORS:
+            raise ValueError(f"estimator must be one of {MOVEMENT_ESTIMATORS}, got {estimator!r}")
+        self.scale = scale
+        self.estimator = estimator
         self.minimum_distance = 5  # Minimum distance to consider for camera movement
 
         self.lk_params = dict(
@@ -25,6 +36,11 @@ class CameraMovementEstimator:
         mask_features[:, 0:20] = 1  # Mask left border
         mask_features[:, 900:1050] = 1  # Mask right border
 
+        # Bring the mask down to the resolution optical flow runs at
+        flow_size = self.prepare_gray(frame).shape[::-1]
+        mask_features = cv2.resize(mask_features, flow_size, interpolation=cv2.INTER_NEAREST)
+        self.frame_center = np.array(flow_size, dtype=np.float32) / 2
+
         self.features = dict(
             maxCorners=100,
             qualityLevel=0.3,
@@ -33,8 +49,21 @@ class CameraMovementEstimator:
             mask=mask_features
         )
 
+        # Grayscale frame and features carried over between chunks in streaming mode
+        self.old_gray = None
+        self.old_features = None
+
+    def reset_state(self):
+        self.old_gray = None
+        self.old_features = None
+
     def add_adjust_positions_to_tracks(self, tracks, camera_movement_per_frame):
         # Adjust positions of tracked objects based on camera movement
+        if isinstance(tracks, TrackTable):
+            camera_movement = np.asarray(camera_movement_per_frame, dtype=np.float64).reshape(-1, 2)
+            tracks['position_adjusted'] = tracks['position'] - camera_movement[tracks.frame]
+            return
+
         for object, object_tracks in tracks.items():
             for frame_num, track in enumerate(object_tracks):
                 for track_id, track_info in track.items():
@@ -43,50 +72,109 @@ class CameraMovementEstimator:
                     position_adjusted = (position[0] - camera_movement[0], position[1] - camera_movement[1])
                     tracks[object][frame_num][track_id]['position_adjusted'] = position_adjusted
 
-    def get_camera_movement(self, frames, read_from_stub=False, stub_path=None):
+    def settings(self):
+        # The feature mask is derived from the frame size, so only the scalar settings describe a run
+        features = {name: value for name, value in self.features.items() if name != 'mask'}
+        return {
+            "minimum_distance": self.minimum_distance,
+            "lk_params": self.lk_params,
+            "features": features,
+            "scale": self.scale,
+            "estimator": self.estimator,
+        }
+
+    def camera_movement_cache_key(self, cache, video_path, number_of_frames):
+        return cache.make_key('camera_movement', video_path, None, dict(self.settings(), number_of_frames=number_of_frames))
+
+    def get_camera_movement(self, frames, read_from_stub=False, stub_path=None, cache=None, video_path=None):
         # Read camera movement from stub if available
         if read_from_stub and stub_path is not None and os.path.exists(stub_path):
             with open(stub_path, 'rb') as f:
                 return pickle.load(f)
 
-        camera_movement = [[0, 0]] * len(frames)
+        # Read camera movement from the result cache when the video and settings are unchanged
+        cache_key = None
+        if cache is not None and video_path is not None:
+            cache_key = self.camera_movement_cache_key(cache, video_path, len(frames))
+            cached = cache.load(cache_key)
+            if cached is not None:
+                return cached[0]["camera_movement"].tolist()
 
-        old_gray = cv2.cvtColor(frames[0], cv2.COLOR_BGR2GRAY)
-        old_features = cv2.goodFeaturesToTrack(old_gray, **self.features)
+        self.reset_state()
+        camera_movement = self.get_camera_movement_chunk(frames)
 
-        for frame_num in range(1, len(frames)):
-            frame_gray = cv2.cvtColor(frames[frame_num], cv2.COLOR_BGR2GRAY)
-            new_features, _, _ = cv2.calcOpticalFlowPyrLK(old_gray, frame_gray, old_features, None, **self.lk_params)
+        if cache_key is not None:
+            cache.store(cache_key, {"camera_movement": np.array(camera_movement, dtype=np.float64).reshape(-1, 2)})
 
-            max_distance = 0
-            camera_movement_x, camera_movement_y = 0, 0
+        # Save camera movement to stub if stub path is provided
+        if stub_path is not None:
+            with open(stub_path, 'wb') as f:
+                pickle.dump(camera_movement, f)
 
-            for i, (new, old) in enumerate(zip(new_features, old_features)):
-                new_features_point = new.ravel()
-                old_features_point = old.ravel()
+        return camera_movement
 
-                distance = measure_distance(new_features_point, old_features_point)
-                if distance > max_distance:
-                    max_distance = distance
-                    camera_movement_x, camera_movement_y = measure_xy_distance(old_features_point, new_features_point)
+    def prepare_gray(self, frame):
+        # Shrink first, so the grayscale conversion only touches the pixels optical flow will use. At the usual
+        # 0.5 and 0.25 scales bilinear resizing still averages a 2x2 block per pixel and is much cheaper than INTER_AREA.
+        if self.scale != 1.0:
+            height, width = frame.shape[:2]
+            frame = cv2.resize(frame, (round(width * self.scale), round(height * self.scale)), interpolation=cv2.INTER_LINEAR)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def estimate_movement(self, old_points, new_points, status):
+        # Returns the largest feature displacement, which decides whether the camera moved, and the movement itself
+        displacements = (old_points - new_points).reshape(-1, 2) / self.scale
+        distances = np.hypot(displacements[:, 0], displacements[:, 1])
+
+        if self.estimator == 'max':
+            # First feature with the largest displacement, like the original per-feature loop
+            strongest = distances.argmax()
+            return distances[strongest], displacements[strongest]
+
+        tracked = status.ravel() == 1
+        if not tracked.any():
+            return 0, np.zeros(2, dtype=np.float32)
+        max_distance = distances[tracked].max()
+
+        if self.estimator == 'affine' and tracked.sum() >= 3:
+            # Affine map from new to old positions; the movement is how far it shifts the frame center
+            matrix, _ = cv2.estimateAffinePartial2D(new_points[tracked], old_points[tracked], method=cv2.RANSAC, ransacReprojThreshold=3.0)
+            if matrix is not None:
+                center_movement = matrix[:, :2] @ self.frame_center + matrix[:, 2] - self.frame_center
+                return max_distance, (center_movement / self.scale).astype(np.float32)
+
+        return max_distance, np.median(displacements[tracked], axis=0)
+
+    def get_camera_movement_chunk(self, frames):
+        # Estimate camera movement for consecutive frames, continuing from the previous chunk
+        camera_movement = []
+
+        for frame in frames:
+            frame_gray = self.prepare_gray(frame)
+
+            if self.old_gray is None or self.old_features is None:
+                self.old_gray = frame_gray
+                self.old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
+                camera_movement.append([0, 0])
+                continue
+
+            new_features, status, _ = cv2.calcOpticalFlowPyrLK(self.old_gray, frame_gray, self.old_features, None, **self.lk_params)
+            max_distance, movement = self.estimate_movement(self.old_features, new_features, status)
 
             if max_distance > self.minimum_distance:
-                camera_movement[frame_num] = [camera_movement_x, camera_movement_y]
-                old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
+                camera_movement.append([movement[0], movement[1]])
+                self.old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
+            else:
+                camera_movement.append([0, 0])
 
-            old_gray = frame_gray.copy()
-
-        # Save camera movement to stub if stub path is provided
-        if stub_path is not None:
-            with open(stub_path, 'wb') as f:
-                pickle.dump(camera_movement, f)
+            self.old_gray = frame_gray.copy()
 
         return camera_movement
 
-    def draw_camera_movement(self, frames, camera_movement_per_frame):
+    def draw_camera_movement(self, frames, camera_movement_per_frame, start_frame=0):
         output_frames = []
 
-        for frame_num, frame in enumerate(frames):
+        for frame_num, frame in enumerate(frames, start=start_frame):
             frame = frame.copy()
 
             overlay = frame.copy()
@@ -0,0 +1,263 @@
+import json
+import os
+import numpy as np
+from tracking_framework.track_table import TrackTable, OBJECT_CLASSES, COLUMN_SPECS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_VERSION = 1
+EXPORT_FORMATS = ('npy', 'parquet')
+
+# Compact on-disk dtypes; everything is converted back to the TrackTable dtypes when read.
+# Pitch coordinates, speeds and distances need far less precision than float64.
+EXPORT_DTYPES = {
+    "frame": np.int32,
+    "track_id": np.int32,
+    "object_class": np.int8,
+    "bbox": np.float32,
+    "position": np.float32,
+    "position_adjusted": np.float32,
+    "position_transformed": np.float32,
+    "speed": np.float32,
+    "distance": np.float32,
+    "acceleration": np.float32,
+    "max_speed": np.float32,
+    "team": np.int8,
+    "team_color": np.float32,
+    "has_ball": np.bool_,
+    "nearest_opponent": np.int32,
+    "nearest_opponent_distance": np.float32,
+    "opponents_nearby": np.int16,
+}
+
+# Rows per Parquet row group, about a minute of play, so frame range filters can skip whole groups
+PARQUET_ROW_GROUP_SIZE = 40000
+
+def team_palette(table):
+    # {team: color} when every player of a team has the same color, which lets team_color be rebuilt from team
+    # instead of stored per row; None otherwise
+    if 'team' not in table or 'team_color' not in table:
+        return None
+    teams = table['team']
+    colors = table['team_color']
+    palette = {}
+    for team in np.unique(teams[teams > 0]):
+        team_colors = np.unique(colors[teams == team], axis=0)
+        if len(team_colors) != 1:
+            return None
+        palette[int(team)] = team_colors[0].tolist()
+    return palette
+
+def export_tracks(path, tracks, team_ball_control=None, camera_movement_per_frame=None, frame_rate=24, format='npy'):
+    # Write tracks with their derived columns, plus per-frame possession and camera movement, to the directory path.
+    # format='npy' writes one memory-mappable .npy file per column; 'parquet' (needs pyarrow) writes tracks.parquet
+    # and frames.parquet. Either way a manifest.json describes the export, and rows are ordered by frame with an
+    # index of each track's rows, so TrackReader can read a time range or a single track without the whole match.
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {EXPORT_FORMATS}, got {format!r}")
+    if format == 'parquet' and pa is None:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow")
+
+    table = tracks if isinstance(tracks, TrackTable) else TrackTable.from_tracks(tracks)
+    table.materialize()
+    os.makedirs(path, exist_ok=True)
+
+    palette = team_palette(table)
+    columns = {"frame": table.frame, "track_id": table.track_id, "object_class": table.object_class, "bbox": table.bbox}
+    columns.update((name, column) for name, column in table.columns.items() if not (name == 'team_color' and palette is not None))
+    columns = {name: np.ascontiguousarray(column, dtype=EXPORT_DTYPES[name]) for name, column in columns.items()}
+
+    # Rows of each (object class, track ID) in frame order
+    track_rows = np.lexsort((table.frame, table.track_id, table.object_class)).astype(np.int32)
+    keys = np.stack([table.object_class[track_rows], table.track_id[track_rows]], axis=1).astype(np.int64)
+    track_start = np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)] if len(keys) else np.zeros(0, dtype=bool)
+    index = {
+        "frame_offsets": table.frame_offsets.astype(np.int64),
+        "track_rows": track_rows,
+        "track_keys": keys[track_start].astype(np.int32),
+        "track_offsets": np.r_[np.flatnonzero(track_start), len(keys)].astype(np.int64),
+    }
+
+    frames = {}
+    if team_ball_control is not None:
+        frames["possession"] = np.asarray(team_ball_control, dtype=np.int8).reshape(-1)
+    if camera_movement_per_frame is not None:
+        frames["camera_movement"] = np.asarray(camera_movement_per_frame, dtype=np.float32).reshape(-1, 2)
+
+    manifest = {
+        "version": EXPORT_VERSION,
+        "format": format,
+        "number_of_frames": table.number_of_frames,
+        "number_of_rows": len(table),
+        "frame_rate": frame_rate,
+        "object_classes": list(OBJECT_CLASSES),
+        "columns": {name: {"dtype": np.dtype(EXPORT_DTYPES[name]).name, "shape": list(column.shape[1:])} for name, column in columns.items()},
+        "frame_columns": {name: {"dtype": column.dtype.name, "shape": list(column.shape[1:])} for name, column in frames.items()},
+        "team_palette": palette,
+    }
+
+    if format == 'npy':
+        for name, array in {**columns, **frames, **index}.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+    else:
+        write_parquet(os.path.join(path, 'tracks.parquet'), columns, PARQUET_ROW_GROUP_SIZE)
+        if frames:
+            write_parquet(os.path.join(path, 'frames.parquet'), frames, PARQUET_ROW_GROUP_SIZE)
+        # The index is small and needed for every read, so it stays in .npy files
+        for name, array in index.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+
+    with open(os.path.join(path, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+def flatten_columns(columns):
+    # Parquet columns are flat: vector columns are split into name_0, name_1, ...
+    flat = {}
+    for name, column in columns.items():
+        if column.ndim == 1:
+            flat[name] = column
+        else:
+            for i in range(column.shape[1]):
+                flat[f"{name}_{i}"] = column[:, i]
+    return flat
+
+def write_parquet(path, columns, row_group_size):
+    flat = flatten_columns(columns)
+    pq.write_table(pa.table({name: pa.array(column) for name, column in flat.items()}), path, row_group_size=row_group_size, compression='zstd')
+
+class TrackReader:
+    # Reads an export written by export_tracks. With the npy format every column is memory-mapped, so a time range
+    # or a single track only touches the pages it needs; with Parquet only the requested columns and rows are read.
+    # Results are TrackTables with the usual dtypes and absolute frame numbers.
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] > EXPORT_VERSION:
+            raise ValueError(f"Export version {self.manifest['version']} is newer than this reader supports ({EXPORT_VERSION})")
+        if self.manifest["format"] == 'parquet' and pa is None:
+            raise ImportError("Reading a Parquet export needs pyarrow: pip install pyarrow")
+
+        self.number_of_frames = self.manifest["number_of_frames"]
+        self.frame_rate = self.manifest["frame_rate"]
+        self.columns = [name for name in self.manifest["columns"] if name not in ("frame", "track_id", "object_class", "bbox")]
+        if self.manifest["team_palette"] is not None:
+            self.columns.append('team_color')
+
+        self.frame_offsets = self.load_array('frame_offsets')
+        self.track_rows = self.load_array('track_rows')
+        self.track_keys = self.load_array('track_keys')
+        self.track_offsets = self.load_array('track_offsets')
+
+    def load_array(self, name):
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode='r')
+
+    def read_rows(self, rows, columns):
+        # name -> array for the given rows, which are a slice or sorted row indices
+        if self.manifest["format"] == 'npy':
+            return {name: np.asarray(self.load_array(name)[rows]) for name in columns}
+
+        flat_names = []
+        for name in columns:
+            shape = self.manifest["columns"][name]["shape"]
+            flat_names += [name] if not shape else [f"{name}_{i}" for i in range(shape[0])]
+
+        # Read only the row groups that hold the rows
+        parquet_file = pq.ParquetFile(os.path.join(self.path, 'tracks.parquet'))
+        row_numbers = np.arange(rows.start, rows.stop) if isinstance(rows, slice) else np.asarray(rows, dtype=np.int64)
+        group_sizes = [parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)]
+        group_starts = np.r_[0, np.cumsum(group_sizes)].astype(np.int64)
+        group_of_row = np.searchsorted(group_starts, row_numbers, side='right') - 1
+        groups = np.unique(group_of_row)
+        data = parquet_file.read_row_groups(groups.tolist(), columns=flat_names) if len(groups) else None
+
+        # Position of each row within the row groups that were read, one after another
+        read_offsets = np.r_[0, np.cumsum(np.diff(group_starts)[groups])]
+        local_rows = read_offsets[np.searchsorted(groups, group_of_row)] + row_numbers - group_starts[group_of_row]
+
+        result = {}
+        for name in columns:
+            shape = self.manifest["columns"][name]["shape"]
+            dtype = self.manifest["columns"][name]["dtype"]
+            if data is None:
+                result[name] = np.zeros((0,) + tuple(shape), dtype=dtype)
+            elif not shape:
+                result[name] = data.column(name).to_numpy()[local_rows]
+            else:
+                result[name] = np.stack([data.column(f"{name}_{i}").to_numpy()[local_rows] for i in range(shape[0])], axis=1)
+        return result
+
+    def make_table(self, rows, columns=None):
+        columns = self.columns if columns is None else list(columns)
+        unknown = set(columns) - set(self.columns)
+        if unknown:
+            raise KeyError(f"Columns not in this export: {', '.join(sorted(unknown))}")
+
+        stored = [name for name in columns if name in self.manifest["columns"]]
+        if 'team_color' in columns and 'team_color' not in stored and 'team' not in stored:
+            stored.append('team')
+        data = self.read_rows(rows, ["frame", "track_id", "object_class", "bbox"] + stored)
+
+        table = TrackTable(data["frame"], data["track_id"], data["object_class"], data["bbox"], self.number_of_frames)
+        for name in stored:
+            if name in columns:
+                table[name] = data[name].astype(COLUMN_SPECS[name][1])
+        if 'team_color' in columns and 'team_color' not in self.manifest["columns"]:
+            # Rebuild team_color from team and the palette
+            team_color = table.empty_column('team_color')
+            for team, color in self.manifest["team_palette"].items():
+                team_color[data["team"] == int(team)] = color
+            table['team_color'] = team_color
+        return table
+
+    def frame_range(self, start_frame=0, end_frame=None, columns=None, object_name=None):
+        # Every row of frames [start_frame, end_frame), optionally only one object class
+        end_frame = self.number_of_frames if end_frame is None else min(end_frame, self.number_of_frames)
+        start_frame = min(max(start_frame, 0), end_frame)
+        rows = slice(int(self.frame_offsets[start_frame]), int(self.frame_offsets[end_frame]))
+        if object_name is None:
+            return self.make_table(rows, columns)
+
+        object_class = self.read_rows(rows, ["object_class"])["object_class"]
+        return self.make_table(rows.start + np.flatnonzero(object_class == OBJECT_CLASSES.index(object_name)), columns)
+
+    def track_ids(self, object_name='players'):
+        return self.track_keys[self.track_keys[:, 0] == OBJECT_CLASSES.index(object_name), 1].astype(np.int64)
+
+    def track(self, track_id, object_name='players', start_frame=0, end_frame=None, columns=None):
+        # Rows of one track in frame order, optionally within [start_frame, end_frame)
+        key = np.array([OBJECT_CLASSES.index(object_name), track_id])
+        matches = np.flatnonzero((self.track_keys == key).all(axis=1))
+        if len(matches) == 0:
+            raise KeyError(f"No {object_name} track {track_id} in this export")
+
+        rows = np.asarray(self.track_rows[self.track_offsets[matches[0]]:self.track_offsets[matches[0] + 1]])
+        end_frame = self.number_of_frames if end_frame is None else end_frame
+        # Track rows are in frame order, and so are rows overall, so row numbers bound the frame range
+        rows = rows[(rows >= self.frame_offsets[max(start_frame, 0)]) & (rows < self.frame_offsets[min(end_frame, self.number_of_frames)])]
+        return self.make_table(rows, columns)
+
+    def frame_values(self, name, start_frame=0, end_frame=None):
+        # A per-frame column (possession or camera_movement) for frames [start_frame, end_frame)
+        if name not in self.manifest["frame_columns"]:
+            raise KeyError(f"No per-frame {name} in this export")
+        end_frame = self.number_of_frames if end_frame is None else end_frame
+        if self.manifest["format"] == 'npy':
+            return np.asarray(self.load_array(name)[start_frame:end_frame])
+
+        shape = self.manifest["frame_columns"][name]["shape"]
+        flat_names = [name] if not shape else [f"{name}_{i}" for i in range(shape[0])]
+        data = pq.read_table(os.path.join(self.path, 'frames.parquet'), columns=flat_names)
+        if not shape:
+            return data.column(name).to_numpy()[start_frame:end_frame]
+        return np.stack([data.column(flat_name).to_numpy()[start_frame:end_frame] for flat_name in flat_names], axis=1)
+
+    def to_table(self, columns=None):
+        return self.frame_range(0, self.number_of_frames, columns)
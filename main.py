@@ -1,111 +1,194 @@
-from utilities.video_utils import read_video, save_video
+from utilities.video_utils import read_video, save_video, get_video_properties
 from tracking_framework.track_object import Tracker
+import argparse
+import os
 import cv2
 import numpy as np
 from team_identifier.team_assigner import TeamAssigner
+from team_identifier.player_crops import PlayerCrops
 from ball_possession.player_ball_assigner import PlayerBallAssigner
 from camera_motion_analysis.camera_movement_estimator import CameraMovementEstimator
 from view_transformer.view_transformer import ViewTransformer
 from motion_metrics.speed_and_distance_estimator import SpeedAndDistance_Estimator
-
-def main():
-    # Path to the stub file containing precomputed tracks
-    stub_path = '/teamspace/studios/this_studio/stubs/tracks.pkl'
+from pipeline.streaming_pipeline import StreamingPipeline, add_derived_columns
+from tracking_framework.track_table import TrackTable
+from pipeline.sharded_pipeline import ShardedPipeline
+from pipeline.live_pipeline import LivePipeline
+from utilities.result_cache import ResultCache
+from utilities.profiler import StageProfiler
+from ball_possession.possession_stats import PossessionStats
+from visualization.annotation_renderer import AnnotationRenderer
+from export.track_export import export_tracks
+
+def main(calibration_path=None, detection_stride=1, motion_threshold=None, camera_scale=1.0, camera_estimator='max', profiler=None, export_path=None, export_format='npy', team_model_path=None, verbose=False):
+    # Path to the input video
+    video_path = '/teamspace/studios/this_studio/demo_vid_1.mp4'
+
+    # Cache for stage results, keyed by the video, model weights and stage settings
+    result_cache = ResultCache('stubs/cache')
+
+    # Records the wall time, frames and memory of every stage
+    profiler = profiler or StageProfiler()
     
     # Read video frames from a specified video file
-    video_frames = read_video('/teamspace/studios/this_studio/demo_vid_1.mp4')
+    with profiler.stage('decode') as stage_info:
+        video_frames = read_video(video_path)
+        stage_info["frames"] = len(video_frames)
+    number_of_frames = len(video_frames)
+    video_fps = get_video_properties(video_path)["fps"]
 
     # Initialize the object tracker with the specified model weights
-    tracker = Tracker('/teamspace/studios/this_studio/runs/detect/train/weights/best.pt')
+    tracker = Tracker('/teamspace/studios/this_studio/runs/detect/train/weights/best.pt', detection_stride=detection_stride, motion_threshold=motion_threshold)
+    tracker.profiler = profiler
 
-    # Get object tracks from the video frames, optionally using precomputed tracks from a stub file
-    tracks = tracker.get_object_tracks(video_frames, read_from_stub=True, stub_path='stubs/track_stubs.pkl')
+    # Get object tracks from the video frames, reusing cached tracks if nothing changed since the last run
+    tracks = tracker.get_object_tracks(video_frames, cache=result_cache, video_path=video_path)
     
-    # Save a cropped image of a player from the first frame
-    for track_id, player in tracks['players'][0].items():
-        bbox = player['bbox']  # Get the bounding box of the player
-        frame = video_frames[0]  # Get the first frame of the video
-
-        # Crop the player's bounding box from the frame
-        cropped_image = frame[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
-
-        # Save the cropped image to a file
-        cv2.imwrite(f'output_videos/cropped_image.jpg', cropped_image)
-        break
-
-    # Add position information to the tracks
-    tracker.add_position_to_tracks(tracks)
-
     # Initialize the camera movement estimator with the first video frame
-    camera_movement_estimator = CameraMovementEstimator(video_frames[0])
-    
-    # Get camera movement for each frame, optionally using precomputed data from a stub file
-    camera_movement_per_frame = camera_movement_estimator.get_camera_movement(video_frames, read_from_stub=True, stub_path='stubs/camera_movement_stub.pkl')
+    camera_movement_estimator = CameraMovementEstimator(video_frames[0], scale=camera_scale, estimator=camera_estimator)
     
-    # Adjust object positions based on the estimated camera movement
-    camera_movement_estimator.add_adjust_positions_to_tracks(tracks, camera_movement_per_frame)
+    # Get camera movement for each frame, reusing the cached result if nothing changed since the last run
+    with profiler.stage('camera_motion', frames=number_of_frames):
+        camera_movement_per_frame = camera_movement_estimator.get_camera_movement(video_frames, cache=result_cache, video_path=video_path)
 
-    # Initialize the view transformer
-    view_transformer = ViewTransformer()
+    # Initialize the team assigner, from the match's saved team model if there is one
+    team_model_loaded = team_model_path is not None and os.path.exists(team_model_path)
+    team_assigner = TeamAssigner.load(team_model_path) if team_model_loaded else TeamAssigner()
     
-    # Add transformed positions to the tracks to account for changes in view
-    view_transformer.add_transformed_position_to_tracks(tracks)
+    with profiler.stage('team_assignment', frames=number_of_frames):
+        # Assign team colors to players in the first frame
+        if not team_model_loaded:
+            team_assigner.assign_team_color(video_frames[0], tracks['players'][0])
+            if team_model_path is not None:
+                team_assigner.save(team_model_path)
+
+        # Assign teams to players for all frames by a vote over color samples of each player ID.
+        # The players due for a sample are cropped into one tensor, which is color clustered in batches.
+        player_crops = PlayerCrops()
+        chunk_teams = team_assigner.get_chunk_teams(video_frames, tracks['players'], player_crops)
+        for frame_num, player_teams in enumerate(chunk_teams):
+            for player_id, team in player_teams.items():
+                tracks['players'][frame_num][player_id]['team'] = team  # Assign team ID to the player
+                tracks['players'][frame_num][player_id]['team_color'] = team_assigner.team_colors[team]  # Assign team color to the player
+
+    # Save a cropped image of a player from the first frame, taken from the crop tensor
+    first_frame_rows = player_crops.rows(frame_num=0)
+    if len(first_frame_rows):
+        cv2.imwrite(f'output_videos/cropped_image.jpg', player_crops.crop(first_frame_rows[0]))
+
+    # From here on the tracks are a columnar table
+    track_table = TrackTable.from_tracks(tracks)
 
     # Interpolate ball positions to fill in missing data points
-    tracks["ball"] = tracker.interpolate_ball_positions(tracks["ball"])
+    with profiler.stage('ball_interpolation', frames=number_of_frames):
+        track_table = tracker.interpolate_ball_positions(track_table)
 
-    # Initialize the speed and distance estimator
-    speed_and_distance_estimator = SpeedAndDistance_Estimator()
-    
-    # Add speed and distance information to the tracks
-    speed_and_distance_estimator.add_speed_and_distance_to_tracks(tracks)
+    # Initialize the view transformer, optionally from a per-camera keypoint calibration file
+    view_transformer = ViewTransformer(calibration_path)
 
-    # Initialize the team assigner
-    team_assigner = TeamAssigner()
-    
-    # Assign team colors to players in the first frame
-    team_assigner.assign_team_color(video_frames[0], tracks['players'][0])
+    # Initialize the speed and distance estimator at the frame rate of the source video
+    speed_and_distance_estimator = SpeedAndDistance_Estimator(frame_rate=video_fps)
 
-    # Assign teams to players for all frames
-    for frame_num, player_track in enumerate(tracks['players']):
-        for player_id, track in player_track.items():
-            team = team_assigner.get_player_team(video_frames[frame_num], track['bbox'], player_id)
-            tracks['players'][frame_num][player_id]['team'] = team  # Assign team ID to the player
-            tracks['players'][frame_num][player_id]['team_color'] = team_assigner.team_colors[team]  # Assign team color to the player
+    # Positions, camera-adjusted and pitch positions, speeds and distances are only computed once something reads them
+    add_derived_columns(track_table, camera_movement_per_frame, tracker, camera_movement_estimator, view_transformer, speed_and_distance_estimator, profiler=profiler)
 
     # Initialize the player ball assigner
     player_assigner = PlayerBallAssigner()
     
-    # Track which team has ball control for each frame
-    team_ball_control = []
-    for frame_num, player_track in enumerate(tracks['players']):
-        if not tracks['ball'][frame_num]:
-            team_ball_control.append(team_ball_control[-1] if team_ball_control else 0)  # Use the last team's control if no ball data
-            continue
-
-        ball_bbox = tracks['ball'][frame_num][1]['bbox']  # Get the ball's bounding box
-        assigned_player = player_assigner.assign_ball_to_player(player_track, ball_bbox)  # Assign the ball to a player
-
-        if assigned_player != -1:
-            tracks['players'][frame_num][assigned_player]['has_ball'] = True  # Mark the player as having the ball
-            team_ball_control.append(tracks['players'][frame_num][assigned_player]['team'])  # Record the team with ball control
-        else:
-            team_ball_control.append(team_ball_control[-1] if team_ball_control else 0)  # Default to the last team if no player is assigned
-
-    team_ball_control = np.array(team_ball_control)  # Convert to a numpy array for easier manipulation
-    print(f"Team ball control array: {team_ball_control}")
-
-    # Draw annotations on video frames
-    output_video_frames = tracker.draw_annotations(video_frames, tracks, team_ball_control)
-
-    # Draw camera movement on video frames
-    output_video_frames = camera_movement_estimator.draw_camera_movement(output_video_frames, camera_movement_per_frame)
-
-    # Draw speed and distance information on video frames
-    speed_and_distance_estimator.draw_speed_and_distance(output_video_frames, tracks)
+    # Assign the ball to the closest player and track which team has ball control, for all frames at once
+    with profiler.stage('ball_assignment', frames=number_of_frames):
+        team_ball_control = player_assigner.assign_ball_possession(track_table)
+
+        # Possession statistics with prefix counts, also split by time window and by pitch zone of the ball
+        pitch_bounds = (view_transformer.target_vertices.min(axis=0), view_transformer.target_vertices.max(axis=0))
+        possession_stats = PossessionStats.from_tracks(track_table, team_ball_control, frame_rate=video_fps, pitch_bounds=pitch_bounds, view_transformer=view_transformer, camera_movement_per_frame=camera_movement_per_frame)
+    if verbose:
+        print(f"Final ball control: team 1 {possession_stats.possession()[0] * 100:.2f}%, team 2 {possession_stats.possession()[1] * 100:.2f}%")
+
+    # Save tracks, positions, speeds, teams and possession in a columnar format that can be read one player or time range at a time
+    if export_path is not None:
+        with profiler.stage('export', frames=number_of_frames):
+            export_tracks(export_path, track_table, team_ball_control, camera_movement_per_frame, frame_rate=video_fps, format=export_format)
+
+    # Draw player, referee and ball markers, the ball control and camera movement panels and speed labels in one pass.
+    # The frames are annotated in place since they are not needed afterwards. The renderer only reads its own columns.
+    renderer = AnnotationRenderer(tracker)
+    with profiler.stage('draw', frames=number_of_frames):
+        output_video_frames = list(renderer.render_frames(video_frames, track_table.as_tracks(renderer.columns), possession_stats, camera_movement_per_frame))
 
     # Save the annotated video to a file
-    save_video(output_video_frames, 'output_videos/output_video.avi')
+    with profiler.stage('encode', frames=number_of_frames):
+        save_video(output_video_frames, 'output_videos/output_video.avi', fps=video_fps)
+
+    return profiler
+
+def main_streaming(chunk_size=120, threaded_io=False, calibration_path=None, detection_stride=1, motion_threshold=None, camera_scale=1.0, camera_estimator='max', profiler=None, export_path=None, export_format='npy', team_model_path=None):
+    # Process the match chunk by chunk so memory stays bounded regardless of video length
+    pipeline = StreamingPipeline('/teamspace/studios/this_studio/runs/detect/train/weights/best.pt', chunk_size=chunk_size, threaded_io=threaded_io, calibration_path=calibration_path, cache=ResultCache('stubs/cache'), detection_stride=detection_stride, motion_threshold=motion_threshold, camera_scale=camera_scale, camera_estimator=camera_estimator, profiler=profiler or StageProfiler(), team_model_path=team_model_path)
+    pipeline.run('/teamspace/studios/this_studio/demo_vid_1.mp4', 'output_videos/output_video.avi', export_path=export_path, export_format=export_format)
+    return pipeline.profiler
+
+def main_sharded(workers=None, chunk_size=120, calibration_path=None, detection_stride=1, motion_threshold=None, camera_scale=1.0, camera_estimator='max', profiler=None, export_path=None, export_format='npy', team_model_path=None):
+    # Detect, track and extract team colors for overlapping segments of the match in a process pool
+    pipeline = ShardedPipeline('/teamspace/studios/this_studio/runs/detect/train/weights/best.pt', workers=workers, chunk_size=chunk_size, calibration_path=calibration_path, cache=ResultCache('stubs/cache'), detection_stride=detection_stride, motion_threshold=motion_threshold, camera_scale=camera_scale, camera_estimator=camera_estimator, profiler=profiler or StageProfiler(), team_model_path=team_model_path)
+    pipeline.run('/teamspace/studios/this_studio/demo_vid_1.mp4', 'output_videos/output_video.avi', export_path=export_path, export_format=export_format)
+    return pipeline.profiler
+
+def main_live(source, latency_budget=0.2, calibration_path=None, detection_stride=1, motion_threshold=None, camera_scale=1.0, camera_estimator='max', profiler=None, latency_log=None, team_model_path=None):
+    # Analyze a live stream frame by frame within a latency budget; a video file is replayed at its native FPS
+    pipeline = LivePipeline('/teamspace/studios/this_studio/runs/detect/train/weights/best.pt', latency_budget=latency_budget, calibration_path=calibration_path, detection_stride=detection_stride, motion_threshold=motion_threshold, camera_scale=camera_scale, camera_estimator=camera_estimator, profiler=profiler or StageProfiler(), team_model_path=team_model_path)
+    report = pipeline.run(source, 'output_videos/output_video.avi')
+    print(f"Live: {report['frames']} frames at {report['fps']:.1f} fps, {report['dropped_frames']} dropped, detection on {report['detection_ratio'] * 100:.0f}% of frames")
+    if "latency_ms" in report:
+        print(f"Latency (ms): p50 {report['latency_ms']['p50']:.1f}, p95 {report['latency_ms']['p95']:.1f}, max {report['latency_ms']['max']:.1f}, budget {report['latency_budget_ms']:.0f}")
+    if latency_log is not None:
+        pipeline.save_latency_log(latency_log)
+    return pipeline.profiler
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stream', action='store_true', help='Decode, analyze and encode the video in bounded chunks')
+    parser.add_argument('--chunk-size', type=int, default=120, help='Frames per chunk in streaming mode')
+    parser.add_argument('--threaded-io', action='store_true', help='Decode and encode on background threads in streaming mode')
+    parser.add_argument('--calibration', default=None, help='Pitch keypoint calibration file, e.g. view_transformer/calibrations/demo_camera.json')
+    parser.add_argument('--sharded', action='store_true', help='Process overlapping segments of the match in parallel worker processes')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes in sharded mode (default: one per CPU)')
+    parser.add_argument('--live', default=None, help='Analyze a live stream: an RTSP/HTTP URL, a camera index, or a video file replayed at its native FPS')
+    parser.add_argument('--latency-budget', type=float, default=200, help='End-to-end latency budget per frame in live mode, in milliseconds')
+    parser.add_argument('--latency-log', default=None, help='Write per-frame latencies of live mode to this JSON file')
+    parser.add_argument('--detection-stride', type=int, default=1, help='Run the detector on every k-th frame and interpolate the frames in between')
+    parser.add_argument('--motion-threshold', type=float, default=None, help='Also detect on any frame whose mean gray-level change since the last detection exceeds this')
+    parser.add_argument('--camera-scale', type=float, default=1.0, help='Estimate camera movement on frames downscaled by this factor, e.g. 0.5')
+    parser.add_argument('--camera-estimator', choices=['max', 'median', 'affine'], default='max', help='How feature displacements are combined into one camera movement')
+    parser.add_argument('--team-model', default=None, help='Team color model of this match: loaded if the file exists, otherwise fitted and saved there')
+    parser.add_argument('--export', default=None, help='Export tracks and per-frame analytics to this directory, e.g. output_videos/match_export')
+    parser.add_argument('--export-format', choices=['npy', 'parquet'], default='npy', help='Memory-mapped NumPy files, or Parquet (needs pyarrow)')
+    parser.add_argument('--profile-json', default=None, help='Write per-stage timings and events to this JSON file')
+    parser.add_argument('--profile-trace', default=None, help='Write a Chrome trace (chrome://tracing, Perfetto) of all stages to this file')
+    parser.add_argument('--verbose', action='store_true', help='Also print the final ball control of the in-memory pipeline')
+    args = parser.parse_args()
+
+    analysis_settings = {
+        "detection_stride": args.detection_stride,
+        "motion_threshold": args.motion_threshold,
+        "camera_scale": args.camera_scale,
+        "camera_estimator": args.camera_estimator,
+        "team_model_path": args.team_model,
+    }
+    export_settings = {"export_path": args.export, "export_format": args.export_format}
+    if args.live is not None:
+        # A bare number is a camera index
+        source = int(args.live) if args.live.isdigit() else args.live
+        profiler = main_live(source, latency_budget=args.latency_budget / 1000, calibration_path=args.calibration, latency_log=args.latency_log, **analysis_settings)
+    elif args.sharded:
+        profiler = main_sharded(workers=args.workers, chunk_size=args.chunk_size, calibration_path=args.calibration, **analysis_settings, **export_settings)
+    elif args.stream:
+        profiler = main_streaming(chunk_size=args.chunk_size, threaded_io=args.threaded_io, calibration_path=args.calibration, **analysis_settings, **export_settings)
+    else:
+        profiler = main(calibration_path=args.calibration, verbose=args.verbose, **analysis_settings, **export_settings)
+
+    print(profiler.report())
+    if args.profile_json is not None:
+        profiler.save_json(args.profile_json)
+    if args.profile_trace is not None:
+        profiler.save_chrome_trace(args.profile_trace)
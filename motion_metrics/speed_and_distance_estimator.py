@@ -1,65 +1,191 @@
 import cv2
 import sys
+from collections import deque
+import numpy as np
 
 # Add the utilities directory to the system path
 sys.path.append('/teamspace/studios/this_studio/utilities')
 
 # Import utility functions
-from bbox_utils import measure_distance, get_foot_position
+from bbox_utils import get_foot_position
+from tracking_framework.track_table import TrackTable
 
 class SpeedAndDistance_Estimator:
-    def __init__(self):
-        self.frame_window = 5
-        self.frame_rate = 24
-    
+    # Speed, distance, acceleration and top speed of every player, computed for all players at once.
+    # Each track's pitch positions form a time series; positions are smoothed with a centered moving average over
+    # smoothing_window frames, speed is the displacement over (at least) the last frame_window frames, distance is the running
+    # length of the smoothed path and max_speed the running top speed. frame_rate should be the source video's FPS.
+    def __init__(self, frame_rate=24, frame_window=5, smoothing_window=5):
+        self.frame_window = frame_window
+        self.frame_rate = frame_rate
+        self.smoothing_window = smoothing_window
+
+        # Per-track state of update_speed_and_distance
+        self.live_tracks = {}
+
     def add_speed_and_distance_to_tracks(self, tracks):
-        total_distance = {}
+        if isinstance(tracks, TrackTable):
+            self.add_speed_and_distance_to_table(tracks)
+            return
+
+        # Compute on a table and copy the results back into the players' dicts
+        table = TrackTable.from_tracks(tracks)
+        self.add_speed_and_distance_to_table(table)
+        for name in ('speed', 'distance', 'acceleration', 'max_speed'):
+            for row in np.flatnonzero(~np.isnan(table[name])):
+                tracks['players'][table.frame[row]][table.track_id[row]][name] = float(table[name][row])
+
+    def player_time_series(self, table):
+        # Player rows sorted by (track_id, frame), with the index of each row's track and the first position of every track
+        rows = np.flatnonzero(table.object_mask('players'))
+        rows = rows[np.lexsort((table.frame[rows], table.track_id[rows]))]
+        track_ids = table.track_id[rows]
+        track_start = np.r_[True, track_ids[1:] != track_ids[:-1]] if len(rows) else np.zeros(0, dtype=bool)
+        track_index = np.cumsum(track_start) - 1
+        track_first = np.flatnonzero(track_start)
+        return rows, track_index, track_first
+
+    def smooth_positions(self, positions, track_index, track_first):
+        # Centered moving average within each track, ignoring missing positions; missing positions stay missing
+        half_window = self.smoothing_window // 2
+        if half_window == 0 or len(positions) == 0:
+            return positions
+
+        valid = ~np.isnan(positions).any(axis=1)
+        sums = np.r_[np.zeros((1, 2)), np.cumsum(np.where(valid[:, None], positions, 0), axis=0)]
+        counts = np.r_[0, np.cumsum(valid)]
+
+        index = np.arange(len(positions))
+        track_last = np.r_[track_first[1:], len(positions)] - 1
+        low = np.maximum(index - half_window, track_first[track_index])
+        high = np.minimum(index + half_window, track_last[track_index]) + 1
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            smoothed = (sums[high] - sums[low]) / (counts[high] - counts[low])[:, None]
+        return np.where(valid[:, None], smoothed, np.nan)
+
+    def add_speed_and_distance_to_table(self, table):
+        number_of_frames = table.number_of_frames
+        columns = {name: table.empty_column(name) for name in ('speed', 'distance', 'acceleration', 'max_speed')}
+
+        rows, track_index, track_first = self.player_time_series(table)
+        if len(rows):
+            frames = table.frame[rows]
+            positions = self.smooth_positions(table['position_transformed'][rows], track_index, track_first)
+
+            # Each row is compared with its track's last row at least frame_window frames earlier. Rows without one,
+            # or whose only one is more than two windows back because the track was lost in between, get no speed.
+            keys = table.track_id[rows] * (number_of_frames + 1) + frames
+            previous = np.maximum(np.searchsorted(keys, keys - self.frame_window, side='right') - 1, 0)
+            frames_elapsed = frames - frames[previous]
+            has_previous = (track_index[previous] == track_index) & (frames_elapsed >= self.frame_window) & (frames_elapsed <= 2 * self.frame_window)
+            time_elapsed = np.where(has_previous, frames_elapsed, 0) / self.frame_rate
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                displacement = positions - positions[previous]
+                speed_meters_per_second = np.where(time_elapsed > 0, np.hypot(displacement[:, 0], displacement[:, 1]) / time_elapsed, np.nan)
+                acceleration = np.where(time_elapsed > 0, (speed_meters_per_second - speed_meters_per_second[previous]) / time_elapsed, np.nan)
+
+            # Path length of the smoothed positions, restarting for every track. Each step runs from the track's last
+            # valid position, so rows without a position are bridged rather than cutting the path short.
+            has_position = ~np.isnan(positions).any(axis=1)
+            index = np.arange(len(positions))
+            last_valid = np.r_[-1, np.maximum.accumulate(np.where(has_position, index, -1))[:-1]]
+            has_step = has_position & (last_valid >= track_first[track_index])
+            step = np.zeros(len(positions))
+            step[has_step] = np.hypot(*(positions[has_step] - positions[last_valid[has_step]]).T)
+            cumulative = np.cumsum(step)
+            distance = cumulative - cumulative[track_first][track_index]
 
-        # Iterate through each type of tracked object
-        for object, object_tracks in tracks.items():
-            if object == "ball" or object == "referees":
+            # Running top speed per track: offset each track above the previous one so one accumulate never crosses tracks
+            speed_km_per_hour = speed_meters_per_second * 3.6
+            offset = track_index * (np.nanmax(speed_km_per_hour, initial=0) + 2)
+            running_max = np.maximum.accumulate(np.nan_to_num(speed_km_per_hour, nan=-1) + offset) - offset
+
+            columns['speed'][rows] = speed_km_per_hour
+            columns['distance'][rows] = np.where(has_position, distance, np.nan)
+            columns['acceleration'][rows] = acceleration
+            columns['max_speed'][rows] = np.where(running_max >= 0, running_max, np.nan)
+
+        for name, column in columns.items():
+            table[name] = column
+
+    def update_speed_and_distance(self, frame_num, player_track):
+        # Online variant for live streams, one frame at a time. Future frames are unknown, so positions are smoothed
+        # with a trailing rather than centered moving average; otherwise the rules match add_speed_and_distance_to_table.
+        # frame_num must count source frames, including dropped ones, so elapsed times stay correct.
+        for track_id, player in player_track.items():
+            position = player.get('position_transformed')
+            if position is None:
                 continue
-            
-            number_of_frames = len(object_tracks)
-            # Process frames in windows of self.frame_window
-            for frame_num in range(0, number_of_frames, self.frame_window):
-                last_frame = min(frame_num + self.frame_window, number_of_frames - 1)
-
-                # Calculate speed and distance for each track within the window
-                for track_id, _ in object_tracks[frame_num].items():
-                    if track_id not in object_tracks[last_frame]:
-                        continue
-
-                    start_position = object_tracks[frame_num][track_id]['position_transformed']
-                    end_position = object_tracks[last_frame][track_id]['position_transformed']
-
-                    if start_position is None or end_position is None:
-                        continue
-
-                    distance_covered = measure_distance(start_position, end_position)
-                    time_elapsed = (last_frame - frame_num) / self.frame_rate
-                    speed_meters_per_second = distance_covered / time_elapsed
-                    speed_km_per_hour = speed_meters_per_second * 3.6
-
-                    if object not in total_distance:
-                        total_distance[object] = {}
-                    
-                    if track_id not in total_distance[object]:
-                        total_distance[object][track_id] = 0
-                    
-                    total_distance[object][track_id] += distance_covered
-
-                    # Update each frame within the window with speed and distance
-                    for frame_num_batch in range(frame_num, last_frame):
-                        if track_id not in tracks[object][frame_num_batch]:
-                            continue
-                        tracks[object][frame_num_batch][track_id]['speed'] = speed_km_per_hour
-                        tracks[object][frame_num_batch][track_id]['distance'] = total_distance[object][track_id]
-    
-    def draw_speed_and_distance(self, frames, tracks):
+
+            state = self.live_tracks.get(track_id)
+            if state is None:
+                state = self.live_tracks[track_id] = {
+                    "positions": deque(),  # raw (frame, position) within the smoothing window
+                    "history": deque(),  # (frame, smoothed position, speed in m/s) within two frame windows
+                    "distance": 0.0,
+                    "max_speed": np.nan,
+                }
+            positions = state["positions"]
+            history = state["history"]
+
+            positions.append((frame_num, np.asarray(position, dtype=np.float64)))
+            while frame_num - positions[0][0] >= self.smoothing_window:
+                positions.popleft()
+            smoothed = np.mean([position for _, position in positions], axis=0)
+
+            if history:
+                state["distance"] += float(np.hypot(*(smoothed - history[-1][1])))
+            while history and frame_num - history[0][0] > 2 * self.frame_window:
+                history.popleft()
+
+            # Last entry at least frame_window frames earlier
+            previous = None
+            for entry in reversed(history):
+                if frame_num - entry[0] >= self.frame_window:
+                    previous = entry
+                    break
+
+            speed = acceleration = np.nan
+            if previous is not None:
+                time_elapsed = (frame_num - previous[0]) / self.frame_rate
+                speed = np.hypot(*(smoothed - previous[1])) / time_elapsed
+                acceleration = (speed - previous[2]) / time_elapsed
+                state["max_speed"] = np.fmax(state["max_speed"], speed * 3.6)
+            history.append((frame_num, smoothed, speed))
+
+            player['distance'] = state["distance"]
+            if not np.isnan(speed):
+                player['speed'] = float(speed * 3.6)
+            if not np.isnan(acceleration):
+                player['acceleration'] = float(acceleration)
+            if not np.isnan(state["max_speed"]):
+                player['max_speed'] = float(state["max_speed"])
+
+        # Forget tracks that have been lost for a while so state stays bounded on an endless stream
+        for track_id in [track_id for track_id, state in self.live_tracks.items() if frame_num - state["positions"][-1][0] > 10 * self.frame_rate]:
+            del self.live_tracks[track_id]
+
+    def player_summary(self, tracks):
+        # Total distance (m) and top speed (km/h) of every player track, from tracks with speed and distance added
+        table = tracks if isinstance(tracks, TrackTable) else TrackTable.from_tracks(tracks)
+        rows, track_index, track_first = self.player_time_series(table)
+        summary = {}
+        for first, last in zip(track_first, np.r_[track_first[1:], len(rows)]):
+            track_rows = rows[first:last]
+            distances = table['distance'][track_rows]
+            speeds = table['max_speed'][track_rows]
+            summary[int(table.track_id[track_rows[0]])] = {
+                "distance": float(np.nanmax(distances, initial=0)),
+                "max_speed": float(np.nanmax(speeds, initial=0)),
+            }
+        return summary
+
+    def draw_speed_and_distance(self, frames, tracks, start_frame=0):
         output_frames = []
         # Iterate through each frame
-        for frame_num, frame in enumerate(frames):
+        for frame_num, frame in enumerate(frames, start=start_frame):
             # Iterate through each type of tracked object
             for object, object_tracks in tracks.items():
                 if object == "ball" or object == "referees":
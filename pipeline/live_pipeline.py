@@ -0,0 +1,271 @@
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+from utilities.video_utils import LiveVideoSource, ThreadedVideoWriter
+from tracking_framework.track_object import Tracker
+from team_identifier.team_assigner import TeamAssigner
+from ball_possession.player_ball_assigner import PlayerBallAssigner
+from camera_motion_analysis.camera_movement_estimator import CameraMovementEstimator
+from view_transformer.view_transformer import ViewTransformer
+from motion_metrics.speed_and_distance_estimator import SpeedAndDistance_Estimator
+from ball_possession.possession_stats import PossessionStats
+from utilities.profiler import StageProfiler
+from visualization.annotation_renderer import AnnotationRenderer
+
+class LivePipeline:
+    # Runs detection, tracking, camera compensation, speed and possession online, one frame at a time, on a live
+    # stream (RTSP/HTTP URL, device index, or a video file replayed at its native FPS).
+    # Every frame should leave the pipeline within latency_budget seconds of being captured. When it falls behind:
+    #  - a frame that is already over budget is dropped if a newer one is waiting, and the source itself drops the
+    #    oldest frame when its small queue is full;
+    #  - detection is skipped while newer frames are waiting or the predicted latency of a frame is over budget, and
+    #    the boxes of the last two detections are extrapolated instead, but never for more than max_detection_gap
+    #    frames in a row.
+    # detection_stride and motion_threshold choose the keyframes like in the offline pipelines.
+    # Only the current frame is held, so memory stays bounded however long the stream runs.
+    # With a team_model_path, the team color model is loaded from it, or fitted on the stream and saved there.
+    def __init__(self, model_path, latency_budget=0.2, max_detection_gap=10, calibration_path=None, detection_stride=1,
+                 motion_threshold=None, camera_scale=0.5, camera_estimator='max', profiler=None, latency_history=108000,
+                 team_model_path=None):
+        self.latency_budget = latency_budget
+        self.max_detection_gap = max_detection_gap
+        self.profiler = profiler or StageProfiler(enabled=False)
+        self.camera_scale = camera_scale
+        self.camera_estimator = camera_estimator
+        self.tracker = Tracker(model_path, detection_stride=detection_stride, motion_threshold=motion_threshold)
+        self.tracker.profiler = self.profiler
+        self.team_model_path = team_model_path
+        self.team_model_loaded = team_model_path is not None and os.path.exists(team_model_path)
+        self.team_assigner = TeamAssigner.load(team_model_path) if self.team_model_loaded else TeamAssigner()
+        self.player_assigner = PlayerBallAssigner()
+        self.view_transformer = ViewTransformer(calibration_path)
+        self.speed_and_distance_estimator = SpeedAndDistance_Estimator()
+        self.camera_movement_estimator = None
+        self.possession_stats = None
+        self.renderer = AnnotationRenderer(self.tracker)
+
+        # Exponential moving averages of the seconds spent per frame in detection and in everything else
+        self.detection_time = None
+        self.processing_time = None
+        self.smoothing = 0.2
+
+        # (frame index, tracks) of the last two detected frames, for extrapolating the frames in between
+        self.keyframe_tracks = deque(maxlen=2)
+        self.team_with_ball = 0
+        self.frames_processed = 0
+        self.late_dropped_frames = 0
+
+        # Per processed frame: (source frame index, capture time, latency in seconds until written, detected)
+        self.frame_latencies = deque(maxlen=latency_history)
+        self.source = None
+        self.start_time = None
+
+    def run(self, source, output_video_path=None, max_frames=None, on_frame=None):
+        # Process the stream until it ends (or max_frames frames were processed), writing annotated frames to
+        # output_video_path and/or passing each (frame, frame record) to on_frame. Returns the latency report.
+        self.source = source if isinstance(source, LiveVideoSource) else LiveVideoSource(source, start=False)
+        self.speed_and_distance_estimator.frame_rate = self.source.fps
+        self.possession_stats = self.create_possession_stats(self.source.fps)
+
+        # The first inference is far slower than the rest, so it runs before capture starts
+        self.warm_up(self.source.frame_size)
+        self.source.start()
+
+        writer = ThreadedVideoWriter(output_video_path, fps=self.source.fps) if output_video_path is not None else None
+        try:
+            for frame, record in self.process_stream(self.source):
+                if writer is not None:
+                    with self.profiler.stage('encode', frames=1):
+                        writer.write(frame)
+                if on_frame is not None:
+                    on_frame(frame, record)
+                if max_frames is not None and self.frames_processed >= max_frames:
+                    break
+        finally:
+            self.source.close()
+            if writer is not None:
+                writer.close()
+
+        return self.latency_report()
+
+    def warm_up(self, frame_size):
+        width, height = frame_size
+        if width > 0 and height > 0:
+            self.tracker.model.predict(self.tracker.prepare_frame(np.zeros((height, width, 3), dtype=np.uint8))[0], conf=self.tracker.conf, imgsz=self.tracker.imgsz, verbose=False)
+
+    def create_possession_stats(self, frame_rate):
+        pitch_bounds = (self.view_transformer.target_vertices.min(axis=0), self.view_transformer.target_vertices.max(axis=0))
+        return PossessionStats(frame_rate=frame_rate, pitch_bounds=pitch_bounds)
+
+    def process_stream(self, frames):
+        # Yields (annotated frame, frame record) for every processed frame of an iterable of (frame index, capture time, frame)
+        self.start_time = time.perf_counter()
+        for frame_index, capture_time, frame in frames:
+            waited = time.perf_counter() - capture_time
+            if waited > self.latency_budget and self.source is not None and self.source.pending() > 0:
+                # Already too old and a newer frame is waiting: skip straight to it
+                self.late_dropped_frames += 1
+                continue
+
+            frame, detected = self.process_frame(frame, frame_index, capture_time)
+            try:
+                yield frame, {"frame_index": frame_index, "processing_latency": time.perf_counter() - capture_time, "detected": detected}
+            finally:
+                # Measured once the consumer has written the frame, so handing it to the encoder counts too
+                self.frame_latencies.append((frame_index, capture_time, time.perf_counter() - capture_time, detected))
+
+    def should_detect(self, frame, frame_index, capture_time):
+        last_detection = self.keyframe_tracks[-1][0] if self.keyframe_tracks else None
+        force = last_detection is None or frame_index - last_detection >= self.max_detection_gap
+
+        if not force and self.detection_time is not None:
+            # Behind when newer frames are already waiting, or when detecting would push this frame over budget
+            if self.source is not None and self.source.pending() > 0:
+                return False
+            predicted_latency = time.perf_counter() - capture_time + self.detection_time + self.processing_time
+            if predicted_latency > self.latency_budget:
+                return False
+
+        return self.tracker.is_keyframe(frame, frame_index, force=force)
+
+    def process_frame(self, frame, frame_index, capture_time):
+        # Analyze and annotate one frame in place; returns it and whether the detector ran on it
+        frame_num = self.frames_processed
+        start = time.perf_counter()
+
+        detected = self.should_detect(frame, frame_index, capture_time)
+        if detected:
+            frame_tracks = self.detect_frame(frame, frame_index)
+            detection_end = time.perf_counter()
+            self.detection_time = self.update_average(self.detection_time, detection_end - start)
+        else:
+            with self.profiler.stage('track', frames=1):
+                frame_tracks = self.extrapolate_frame(frame_index)
+            detection_end = time.perf_counter()
+
+        # Camera movement since the previous processed frame
+        with self.profiler.stage('camera_motion', frames=1):
+            if self.camera_movement_estimator is None:
+                self.camera_movement_estimator = CameraMovementEstimator(frame, scale=self.camera_scale, estimator=self.camera_estimator)
+            camera_movement = self.camera_movement_estimator.get_camera_movement_chunk([frame])[0]
+
+        with self.profiler.stage('team_assignment', frames=1):
+            self.assign_teams(frame, frame_tracks['players'][0])
+
+        with self.profiler.stage('positions', frames=1):
+            self.tracker.add_position_to_tracks(frame_tracks)
+            self.camera_movement_estimator.add_adjust_positions_to_tracks(frame_tracks, [camera_movement])
+            self.view_transformer.add_transformed_position_to_tracks(frame_tracks)
+
+        with self.profiler.stage('speed', frames=1):
+            self.speed_and_distance_estimator.update_speed_and_distance(frame_index, frame_tracks['players'][0])
+
+        with self.profiler.stage('ball_assignment', frames=1):
+            ball_position = self.assign_ball(frame_tracks)
+            self.possession_stats.update(self.team_with_ball, ball_position)
+
+        # The renderer looks frames up by number, so index this frame's tracks by its position in the stream
+        with self.profiler.stage('draw', frames=1):
+            tracks = {object: {frame_num: object_tracks[0]} for object, object_tracks in frame_tracks.items()}
+            self.renderer.render_frame(frame, frame_num, tracks, self.possession_stats, {frame_num: camera_movement})
+
+        self.processing_time = self.update_average(self.processing_time, time.perf_counter() - detection_end)
+        self.frames_processed += 1
+        return frame, detected
+
+    def update_average(self, average, value):
+        return value if average is None else average + self.smoothing * (value - average)
+
+    def detect_frame(self, frame, frame_index):
+        # Detect and track one frame; ByteTrack keeps its state between frames
+        frame_tracks = self.tracker.create_empty_tracks()
+        self.tracker.add_detections_to_tracks(self.tracker.iter_detections([frame]), frame_tracks)
+        self.keyframe_tracks.append((frame_index, {object: object_tracks[0] for object, object_tracks in frame_tracks.items()}))
+        return frame_tracks
+
+    def extrapolate_frame(self, frame_index):
+        # Continue every track seen on both of the last two detections at its constant velocity; tracks seen only on
+        # the last one keep their box
+        last_frame, last_tracks = self.keyframe_tracks[-1]
+        previous_frame, previous_tracks = self.keyframe_tracks[0] if len(self.keyframe_tracks) == 2 else (None, {})
+
+        frame_tracks = self.tracker.create_empty_tracks()
+        for object, object_tracks in last_tracks.items():
+            before = previous_tracks.get(object, {})
+            extrapolated = {}
+            for track_id, track in object_tracks.items():
+                bbox = np.array(track["bbox"])
+                if track_id in before and last_frame > previous_frame:
+                    velocity = (bbox - np.array(before[track_id]["bbox"])) / (last_frame - previous_frame)
+                    bbox = bbox + velocity * (frame_index - last_frame)
+                extrapolated[track_id] = {"bbox": bbox.tolist()}
+            frame_tracks[object].append(extrapolated)
+        return frame_tracks
+
+    def assign_teams(self, frame, player_track):
+        # Team colors are fitted on the first frame with enough players unless a team model was loaded, then player
+        # IDs are voted on as they are seen
+        if self.team_assigner.centers is None:
+            if len(player_track) < 2:
+                return
+            self.team_assigner.assign_team_color(frame, player_track)
+            if self.team_model_path is not None and not self.team_model_loaded:
+                self.team_assigner.save(self.team_model_path)
+
+        player_teams = self.team_assigner.get_player_teams(frame, player_track)
+        for player_id, team in player_teams.items():
+            player_track[player_id]['team'] = team
+            player_track[player_id]['team_color'] = self.team_assigner.team_colors[team]
+
+    def assign_ball(self, frame_tracks):
+        # Give the ball to the closest player; the team in control carries over frames where nobody has it.
+        # Returns the ball's pitch position, or None.
+        ball_track = frame_tracks['ball'][0]
+        if 1 not in ball_track:
+            return None
+
+        player_track = frame_tracks['players'][0]
+        assigned_player = self.player_assigner.assign_ball_to_player(player_track, ball_track[1]['bbox'])
+        if assigned_player != -1:
+            player_track[assigned_player]['has_ball'] = True
+            self.team_with_ball = player_track[assigned_player].get('team', self.team_with_ball)
+
+        return ball_track[1].get('position_transformed')
+
+    def latency_report(self):
+        # End-to-end latency, from capture until the annotated frame was written, over the processed frames
+        latencies = np.array([latency for _, _, latency, _ in self.frame_latencies], dtype=np.float64)
+        detected = sum(1 for _, _, _, frame_detected in self.frame_latencies if frame_detected)
+        elapsed = time.perf_counter() - self.start_time if self.start_time is not None else 0
+        source_dropped = self.source.dropped_frames if self.source is not None else 0
+
+        report = {
+            "frames": self.frames_processed,
+            "dropped_frames": source_dropped + self.late_dropped_frames,
+            "detected_frames": detected,
+            "detection_ratio": detected / len(latencies) if len(latencies) else 0.0,
+            "fps": self.frames_processed / elapsed if elapsed > 0 else 0.0,
+            "source_fps": self.source.fps if self.source is not None else None,
+            "latency_budget_ms": self.latency_budget * 1000,
+            "over_budget_frames": int((latencies > self.latency_budget).sum()),
+        }
+        if len(latencies):
+            report["latency_ms"] = {
+                "mean": float(latencies.mean() * 1000),
+                "p50": float(np.percentile(latencies, 50) * 1000),
+                "p95": float(np.percentile(latencies, 95) * 1000),
+                "p99": float(np.percentile(latencies, 99) * 1000),
+                "max": float(latencies.max() * 1000),
+            }
+        return report
+
+    def save_latency_log(self, path):
+        # Per-frame latencies, e.g. for plotting latency over the course of a stream
+        frames = [
+            {"frame_index": frame_index, "capture_time": capture_time, "latency_ms": latency * 1000, "detected": detected}
+            for frame_index, capture_time, latency, detected in self.frame_latencies
+        ]
+        with open(path, 'w') as f:
+            json.dump({"report": self.latency_report(), "frames": frames}, f, indent=2)
@@ -0,0 +1,280 @@
+import math
+import multiprocessing
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utilities.video_utils import read_video_chunks, get_video_properties
+from utilities.bbox_utils import measure_iou_matrix
+from tracking_framework.track_object import Tracker
+from tracking_framework.track_table import TrackTable, OBJECT_CLASSES
+from team_identifier.team_assigner import TeamAssigner
+from team_identifier.player_crops import PlayerCrops
+from camera_motion_analysis.camera_movement_estimator import CameraMovementEstimator
+from pipeline.streaming_pipeline import StreamingPipeline
+from utilities.profiler import StageProfiler
+
+def plan_segments(number_of_frames, segment_length, overlap):
+    # [start, end) frame ranges; every segment after the first re-processes the last `overlap` frames of the one before it.
+    # number_of_frames is the container's estimate, so the last segment has no end and reads to the end of the video;
+    # segments planned past the real end decode no frames and are dropped when stitching.
+    segments = []
+    for start in range(0, number_of_frames, segment_length):
+        segments.append((max(start - overlap, 0), start + segment_length))
+    if not segments:
+        return [(0, None)]
+    segments[-1] = (segments[-1][0], None)
+    return segments
+
+def process_segment(model_path, video_path, start_frame, end_frame, chunk_size, torch_threads, detection_stride=1, motion_threshold=None, camera_scale=1.0, camera_estimator='max', profile=False):
+    # Runs in a worker process: detection, ByteTrack, camera movement and jersey colors for one segment.
+    # Results are returned as flat arrays, which are far cheaper to send back than nested dicts.
+    # With profile, the worker's stage events are returned too so the parent can merge them into one trace.
+    import torch
+    torch.set_num_threads(torch_threads)
+
+    profiler = StageProfiler(enabled=profile)
+    tracker = Tracker(model_path, detection_stride=detection_stride, motion_threshold=motion_threshold)
+    tracker.profiler = profiler
+    team_assigner = TeamAssigner()
+    player_crops = PlayerCrops()
+    camera_movement_estimator = None
+
+    tracks = tracker.create_empty_tracks()
+    camera_movement = []
+    player_colors = {}
+    embedding_track_ids = []
+    embedding_frames = []
+    embeddings = []
+    samples = {}
+
+    for frames in profiler.iterate('decode', read_video_chunks(video_path, chunk_size, start_frame, end_frame)):
+        chunk_start = len(tracks["players"])
+        tracker.add_chunk_to_tracks(frames, tracks)
+
+        with profiler.stage('camera_motion', frames=len(frames)):
+            if camera_movement_estimator is None:
+                camera_movement_estimator = CameraMovementEstimator(frames[0], scale=camera_scale, estimator=camera_estimator)
+            camera_movement += camera_movement_estimator.get_camera_movement_chunk(frames)
+
+        # Jersey color of every player ID from the first frame it appears in, and color histograms sampled on the
+        # same schedule as TeamAssigner votes, so the parent can classify each ID by a vote over its samples.
+        # The crops of a chunk are cut frame by frame and color clustered in one batch.
+        with profiler.stage('team_assignment', frames=len(frames)):
+            player_crops.clear()
+            for frame_num, frame in enumerate(frames, start=chunk_start):
+                player_track = tracks["players"][frame_num]
+                due_player_ids = [
+                    player_id for player_id in player_track
+                    if player_id not in samples or team_assigner.is_due(*samples[player_id], frame_num)
+                ]
+                for player_id in due_player_ids:
+                    samples[player_id] = (samples.get(player_id, (0, 0))[0] + 1, frame_num)
+                player_crops.add(frame, frame_num, due_player_ids, [player_track[player_id]["bbox"] for player_id in due_player_ids])
+
+            colors, player_embeddings = team_assigner.get_crop_features(*player_crops.tensor())
+            for player_id, frame_num, color, embedding in zip(player_crops.track_id[:len(player_crops)].tolist(), player_crops.frame[:len(player_crops)].tolist(), colors, player_embeddings):
+                player_colors.setdefault(player_id, color)
+                embedding_track_ids.append(player_id)
+                embedding_frames.append(frame_num)
+                embeddings.append(embedding)
+
+    return {
+        "start_frame": start_frame,
+        "tracks": TrackTable.from_tracks(tracks).to_arrays(),
+        "camera_movement": np.array(camera_movement, dtype=np.float64).reshape(-1, 2),
+        "color_track_ids": np.array(list(player_colors.keys()), dtype=np.int64),
+        "colors": np.array(list(player_colors.values()), dtype=np.float64).reshape(-1, 3),
+        "embedding_track_ids": np.array(embedding_track_ids, dtype=np.int64),
+        "embedding_frames": np.array(embedding_frames, dtype=np.int64),
+        "embeddings": np.array(embeddings, dtype=np.float64).reshape(len(embeddings), team_assigner.histogram_bins ** 3),
+        "profile_events": profiler.events,
+    }
+
+def match_overlap_ids(previous, current, overlap_start, overlap_end, iou_threshold):
+    # Map current-segment track IDs to previous-segment IDs by their mean IoU over the shared frames
+    scores = defaultdict(float)
+    frames_seen = defaultdict(int)
+
+    for frame_num in range(overlap_start, overlap_end):
+        previous_rows = previous.frame_rows(frame_num)
+        current_rows = current.frame_rows(frame_num)
+        for object_name in OBJECT_CLASSES:
+            if object_name == "ball":
+                continue
+            class_index = OBJECT_CLASSES.index(object_name)
+            previous_mask = previous.object_class[previous_rows] == class_index
+            current_mask = current.object_class[current_rows] == class_index
+            previous_ids = previous.track_id[previous_rows][previous_mask]
+            current_ids = current.track_id[current_rows][current_mask]
+
+            for current_id in current_ids:
+                frames_seen[current_id] += 1
+            if len(previous_ids) == 0 or len(current_ids) == 0:
+                continue
+
+            iou = measure_iou_matrix(previous.bbox[previous_rows][previous_mask], current.bbox[current_rows][current_mask])
+            for i, j in zip(*np.nonzero(iou)):
+                scores[(previous_ids[i], current_ids[j])] += iou[i, j]
+
+    # Greedy one-to-one matching, best mean IoU first
+    candidates = sorted(((score / frames_seen[current_id], previous_id, current_id) for (previous_id, current_id), score in scores.items()), reverse=True)
+    id_map = {}
+    used_previous_ids = set()
+    for mean_iou, previous_id, current_id in candidates:
+        if mean_iou < iou_threshold:
+            break
+        if current_id in id_map or previous_id in used_previous_ids:
+            continue
+        id_map[current_id] = previous_id
+        used_previous_ids.add(previous_id)
+
+    return id_map
+
+def stitch_segments(results, iou_threshold=0.3):
+    # Combine per-segment results into one match: the earlier segment owns the overlapping frames,
+    # and track IDs continue across boundaries wherever the overlap lets us match them
+    results = sorted((result for result in results if len(result["camera_movement"])), key=lambda result: result["start_frame"])
+    if not results:
+        raise ValueError("no segment decoded any frames")
+    number_of_frames = max(result["start_frame"] + len(result["camera_movement"]) for result in results)
+    ball_class = OBJECT_CLASSES.index("ball")
+
+    tables = []
+    camera_movement = []
+    player_colors = {}
+    player_embeddings = []
+    sampled_ids = set()
+    previous = None
+    previous_end = 0
+    next_id = 1
+
+    for result in results:
+        start_frame = result["start_frame"]
+        local = TrackTable.from_arrays(result["tracks"])
+        segment = TrackTable(local.frame + start_frame, local.track_id.copy(), local.object_class, local.bbox, number_of_frames, local.columns)
+
+        id_map = {}
+        if previous is not None:
+            id_map = match_overlap_ids(previous, segment, start_frame, previous_end, iou_threshold)
+        for track_id in np.unique(segment.track_id[segment.object_class != ball_class]):
+            if track_id not in id_map:
+                id_map[track_id] = next_id
+                next_id += 1
+
+        not_ball = segment.object_class != ball_class
+        segment.track_id[not_ball] = [id_map[track_id] for track_id in segment.track_id[not_ball]]
+
+        for track_id, color in zip(result["color_track_ids"], result["colors"]):
+            player_colors.setdefault(id_map[track_id], color)
+        # Overlap frames were sampled by the previous segment too, so only its samples count and no ID votes twice.
+        # An ID that the previous segment never sampled, e.g. one that appeared late in the overlap and was not
+        # matched, keeps its overlap samples when it has none of its own.
+        sample_ids = np.array([id_map[track_id] for track_id in result["embedding_track_ids"]], dtype=np.int64)
+        own_samples = result["embedding_frames"] + start_frame >= previous_end
+        voted_ids = sampled_ids | set(sample_ids[own_samples].tolist())
+        keep = own_samples | ~np.isin(sample_ids, list(voted_ids))
+        player_embeddings += list(zip(sample_ids[keep].tolist(), result["embeddings"][keep]))
+        sampled_ids |= set(sample_ids[keep].tolist())
+
+        tables.append(segment.select(segment.frame >= previous_end))
+        camera_movement += result["camera_movement"][previous_end - start_frame:].tolist()
+
+        previous = segment
+        previous_end = start_frame + len(result["camera_movement"])
+
+    return TrackTable.concatenate(tables, number_of_frames), camera_movement, player_colors, player_embeddings
+
+class ShardedPipeline(StreamingPipeline):
+    # Splits the match into overlapping segments and runs detection, tracking, camera movement and
+    # jersey color extraction for each segment in its own process, then stitches the segments back
+    # together. Analysis, drawing and encoding are shared with StreamingPipeline.
+    def __init__(self, model_path, workers=None, segment_length=None, overlap=48, iou_threshold=0.3, **kwargs):
+        super().__init__(model_path, **kwargs)
+        self.workers = workers or os.cpu_count()
+        self.segment_length = segment_length
+        self.overlap = overlap
+        self.iou_threshold = iou_threshold
+
+    def track_pass_settings(self):
+        # Segment boundaries change where ByteTrack restarts and which IDs are stitched, so they are part of the result
+        return {
+            **super().track_pass_settings(),
+            "sharding": {"workers": self.workers, "segment_length": self.segment_length, "overlap": self.overlap, "iou_threshold": self.iou_threshold},
+        }
+
+    def run_track_pass(self, video_path):
+        # The frame count is only used to plan segments; the match length comes from the frames actually decoded
+        estimated_frames = get_video_properties(video_path)["frame_count"]
+        segment_length = self.segment_length or math.ceil(estimated_frames / self.workers)
+        segments = plan_segments(estimated_frames, max(segment_length, 1), self.overlap)
+
+        # Split the CPU between workers so the per-process torch thread pools do not oversubscribe it
+        torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+
+        # spawn keeps torch and OpenCV thread pools out of forked children
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(
+                    process_segment, self.tracker.model_path, video_path, start, end, self.chunk_size, torch_threads,
+                    self.tracker.detection_stride, self.tracker.motion_threshold, self.camera_scale, self.camera_estimator,
+                    self.profiler.enabled,
+                )
+                for start, end in segments
+            ]
+            results = [future.result() for future in futures]
+
+        for result in results:
+            self.profiler.add_events(result["profile_events"])
+
+        with self.profiler.stage('stitch') as stage_info:
+            track_table, camera_movement_per_frame, player_colors, player_embeddings = stitch_segments(results, self.iou_threshold)
+            stage_info["frames"] = track_table.number_of_frames
+        with self.profiler.stage('team_classification', frames=track_table.number_of_frames):
+            self.assign_teams_from_features(track_table, player_colors, player_embeddings)
+
+        return track_table, camera_movement_per_frame
+
+    def assign_teams_from_features(self, track_table, player_colors, player_embeddings):
+        # Team centers are fitted on the first frame with at least two sampled players unless a team model was
+        # loaded, as in the single-process pipeline, then every sampled embedding is a vote for its track ID
+        players = track_table.object_mask('players')
+        first_embeddings = {}
+        for player_id, embedding in player_embeddings:
+            first_embeddings.setdefault(player_id, embedding)
+        if self.team_assigner.centers is None:
+            for frame_num in range(track_table.number_of_frames):
+                rows = track_table.frame_rows(frame_num)
+                fit_ids = [player_id for player_id in track_table.track_id[rows][players[rows]].tolist() if player_id in first_embeddings]
+                if len(fit_ids) >= 2:
+                    self.team_assigner.fit_teams([first_embeddings[player_id] for player_id in fit_ids], [player_colors[player_id] for player_id in fit_ids])
+                    self.save_team_model()
+                    break
+
+        team = track_table.empty_column('team')
+        team_color = track_table.empty_column('team_color')
+        if self.team_assigner.centers is not None:
+            player_teams = self.team_assigner.assign_teams_from_embeddings([player_id for player_id, _ in player_embeddings], [embedding for _, embedding in player_embeddings])
+
+            # An ID without a vote gets the team whose drawing color is closest to its jersey color; one with neither
+            # keeps no team
+            team_colors = np.array([self.team_assigner.team_colors[1], self.team_assigner.team_colors[2]])
+            for player_id in np.unique(track_table.track_id[players]).tolist():
+                if player_id not in player_teams and player_id in player_colors:
+                    player_teams[player_id] = int(np.linalg.norm(team_colors - player_colors[player_id], axis=1).argmin()) + 1
+
+            # Look up every player row's team through its track ID
+            player_ids = np.array(list(player_teams.keys()), dtype=np.int64)
+            teams = np.array(list(player_teams.values()), dtype=np.int64)
+            order = np.argsort(player_ids)
+            player_ids, teams = player_ids[order], teams[order]
+            player_rows = np.flatnonzero(players)
+            positions = np.minimum(np.searchsorted(player_ids, track_table.track_id[player_rows]), max(len(player_ids) - 1, 0))
+            found = player_ids[positions] == track_table.track_id[player_rows] if len(player_ids) else np.zeros(len(player_rows), dtype=bool)
+            player_rows = player_rows[found]
+            team[player_rows] = teams[positions[found]]
+            team_color[player_rows] = team_colors[team[player_rows] - 1]
+
+        track_table['team'] = team
+        track_table['team_color'] = team_color
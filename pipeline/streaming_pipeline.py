@@ -0,0 +1,205 @@
+import os
+import numpy as np
+from utilities.video_utils import read_video_frames, read_video_chunks, get_video_properties, save_video
+from tracking_framework.track_object import Tracker
+from team_identifier.team_assigner import TeamAssigner
+from team_identifier.player_crops import PlayerCrops
+from ball_possession.player_ball_assigner import PlayerBallAssigner
+from camera_motion_analysis.camera_movement_estimator import CameraMovementEstimator
+from view_transformer.view_transformer import ViewTransformer
+from motion_metrics.speed_and_distance_estimator import SpeedAndDistance_Estimator
+from tracking_framework.track_table import TrackTable
+from ball_possession.possession_stats import PossessionStats
+from utilities.profiler import StageProfiler
+from visualization.annotation_renderer import AnnotationRenderer
+from export.track_export import export_tracks
+from spatial_analysis.proximity_metrics import ProximityAnalyzer
+
+def add_derived_columns(track_table, camera_movement_per_frame, tracker, camera_movement_estimator, view_transformer,
+                        speed_and_distance_estimator, proximity_analyzer=None, profiler=None):
+    # Adds positions, camera-adjusted and pitch positions, speeds and (with a proximity_analyzer) proximity metrics
+    # as lazy columns. Each stage runs, under its own profiler stage, when one of its columns is first read.
+    profiler = profiler or StageProfiler(enabled=False)
+    number_of_frames = track_table.number_of_frames
+
+    def stage(name, function):
+        def compute(table):
+            with profiler.stage(name, frames=number_of_frames):
+                function(table)
+        return compute
+
+    track_table.add_lazy_columns(('position',), stage('positions', tracker.add_position_to_tracks))
+    track_table.add_lazy_columns(('position_adjusted',), stage('positions', lambda table: camera_movement_estimator.add_adjust_positions_to_tracks(table, camera_movement_per_frame)))
+    track_table.add_lazy_columns(('position_transformed',), stage('view_transform', view_transformer.add_transformed_position_to_tracks))
+    track_table.add_lazy_columns(('speed', 'distance', 'acceleration', 'max_speed'), stage('speed', speed_and_distance_estimator.add_speed_and_distance_to_tracks))
+    if proximity_analyzer is not None:
+        track_table.add_lazy_columns(('nearest_opponent', 'nearest_opponent_distance', 'opponents_nearby'), stage('proximity', proximity_analyzer.add_proximity_to_tracks))
+
+class StreamingPipeline:
+    # Runs the same stages as main.main, but never holds more than one chunk of frames in memory.
+    # Frames are decoded twice: once for detection, tracking, camera movement and team colors,
+    # and once more for drawing and encoding after the per-track analysis is complete.
+    # With threaded_io, decoding and encoding run on background threads connected through bounded
+    # queues, so they overlap with inference and drawing on the main thread.
+    # With a ResultCache, the output of the tracking pass is reused while the video, weights and settings are unchanged.
+    # With a StageProfiler, every stage records its wall time, frames and memory.
+    # With a team_model_path, the team color model of the match is loaded from it, or fitted and saved there.
+    def __init__(self, model_path, chunk_size=120, threaded_io=False, calibration_path=None, cache=None, detection_stride=1, motion_threshold=None, camera_scale=1.0, camera_estimator='max', profiler=None, team_model_path=None):
+        self.cache = cache
+        self.profiler = profiler or StageProfiler(enabled=False)
+        self.camera_scale = camera_scale
+        self.camera_estimator = camera_estimator
+        self.chunk_size = chunk_size
+        self.threaded_io = threaded_io
+        self.tracker = Tracker(model_path, detection_stride=detection_stride, motion_threshold=motion_threshold)
+        self.tracker.profiler = self.profiler
+        self.team_model_path = team_model_path
+        self.team_model_loaded = team_model_path is not None and os.path.exists(team_model_path)
+        self.team_assigner = TeamAssigner.load(team_model_path) if self.team_model_loaded else TeamAssigner()
+        # Player crops of the current chunk; the buffer is reused from chunk to chunk
+        self.player_crops = PlayerCrops()
+        self.player_assigner = PlayerBallAssigner()
+        self.view_transformer = ViewTransformer(calibration_path)
+        self.speed_and_distance_estimator = SpeedAndDistance_Estimator()
+        self.proximity_analyzer = ProximityAnalyzer()
+        self.camera_movement_estimator = None
+        self.possession_stats = None
+        self.renderer = AnnotationRenderer(self.tracker)
+
+    def run(self, video_path, output_video_path, export_path=None, export_format='npy'):
+        video_properties = get_video_properties(video_path)
+
+        tracks, camera_movement_per_frame = self.track_video(video_path)
+        track_table, team_ball_control = self.analyze_tracks(tracks, camera_movement_per_frame, frame_rate=video_properties["fps"])
+
+        # Columnar export of the tracks and per-frame analytics, see export.track_export
+        if export_path is not None:
+            with self.profiler.stage('export', frames=track_table.number_of_frames):
+                export_tracks(export_path, track_table, team_ball_control, camera_movement_per_frame, frame_rate=video_properties["fps"], format=export_format)
+
+        # The renderer only reads its own columns, so derived columns nothing else asked for are never computed
+        output_video_frames = self.annotate_video(video_path, track_table.as_tracks(self.renderer.columns), self.possession_stats, camera_movement_per_frame)
+        # Decoding and drawing run inside save_video as it pulls frames, and are recorded as their own stages
+        with self.profiler.stage('encode', frames=track_table.number_of_frames):
+            save_video(output_video_frames, output_video_path, fps=video_properties["fps"], threaded=self.threaded_io)
+
+        return track_table, team_ball_control
+
+    def track_pass_settings(self):
+        # Everything that changes the tracks or camera movement of a track pass; subclasses add their own settings
+        return {
+            "pipeline": type(self).__name__,
+            "detection": self.tracker.settings(),
+            "camera_movement": self.camera_movement_estimator.settings(),
+            "team_assigner": self.team_assigner.settings(),
+            "team_model": self.cache.file_digest(self.team_model_path) if self.team_model_loaded else None,
+        }
+
+    def track_pass_cache_key(self, video_path):
+        return self.cache.make_key('streaming_track_pass', video_path, self.tracker.model_path, self.track_pass_settings())
+
+    def track_video(self, video_path):
+        # The camera movement estimator needs the first frame for its feature mask
+        self.camera_movement_estimator = CameraMovementEstimator(next(read_video_frames(video_path)), scale=self.camera_scale, estimator=self.camera_estimator)
+        if self.cache is None:
+            return self.run_track_pass(video_path)
+
+        cache_key = self.track_pass_cache_key(video_path)
+        cached = self.cache.load(cache_key)
+        if cached is not None:
+            arrays, _ = cached
+            return TrackTable.from_arrays(arrays), arrays["camera_movement"].tolist()
+
+        tracks, camera_movement_per_frame = self.run_track_pass(video_path)
+        track_table = tracks if isinstance(tracks, TrackTable) else TrackTable.from_tracks(tracks)
+        arrays = track_table.to_arrays()
+        arrays["camera_movement"] = np.array(camera_movement_per_frame, dtype=np.float64).reshape(-1, 2)
+        self.cache.store(cache_key, arrays)
+
+        return tracks, camera_movement_per_frame
+
+    def run_track_pass(self, video_path):
+        tracks = self.tracker.create_empty_tracks()
+        camera_movement_per_frame = []
+
+        chunks = read_video_chunks(video_path, self.chunk_size, threaded=self.threaded_io)
+        for frames in self.profiler.iterate('decode', chunks):
+            start_frame = len(tracks["players"])
+
+            # Detect and track objects; ByteTrack state carries over between chunks
+            self.tracker.add_chunk_to_tracks(frames, tracks)
+
+            # Camera movement continues from the last frame of the previous chunk
+            with self.profiler.stage('camera_motion', frames=len(frames)):
+                camera_movement_per_frame += self.camera_movement_estimator.get_camera_movement_chunk(frames)
+
+            # Team colors are fitted on the first frame with enough players unless a team model was loaded, then player
+            # IDs are voted on while their frames are in memory. Chunks before the fit leave their players without a team.
+            with self.profiler.stage('team_assignment', frames=len(frames)):
+                if self.team_assigner.centers is None:
+                    self.fit_team_colors(frames, tracks['players'][start_frame:])
+                if self.team_assigner.centers is not None:
+                    self.assign_teams(frames, tracks, start_frame)
+
+        return tracks, camera_movement_per_frame
+
+    def fit_team_colors(self, frames, player_tracks):
+        for frame, player_track in zip(frames, player_tracks):
+            if len(player_track) >= 2:
+                self.team_assigner.assign_team_color(frame, player_track)
+                self.save_team_model()
+                return
+
+    def save_team_model(self):
+        # A freshly fitted model becomes the match's model; a loaded one is left as it was, so reruns see the same file
+        if self.team_model_path is not None and not self.team_model_loaded:
+            self.team_assigner.save(self.team_model_path)
+
+    def assign_teams(self, frames, tracks, start_frame):
+        # Crops of the players due for a vote are cut from the chunk's frames, then color clustered in one batch
+        player_tracks = tracks['players'][start_frame:start_frame + len(frames)]
+        chunk_teams = self.team_assigner.get_chunk_teams(frames, player_tracks, self.player_crops)
+        for player_track, player_teams in zip(player_tracks, chunk_teams):
+            for player_id, team in player_teams.items():
+                player_track[player_id]['team'] = team
+                player_track[player_id]['team_color'] = self.team_assigner.team_colors[team]
+
+    def analyze_tracks(self, tracks, camera_movement_per_frame, frame_rate=24):
+        # These stages only touch the tracks, so they run once over the whole match as array operations.
+        # Ball possession is computed right away; positions, speeds and proximity are lazy columns, computed the
+        # first time the renderer, the exporter or a statistic reads them.
+        track_table = tracks if isinstance(tracks, TrackTable) else TrackTable.from_tracks(tracks)
+        number_of_frames = track_table.number_of_frames
+
+        with self.profiler.stage('ball_interpolation', frames=number_of_frames):
+            track_table = self.tracker.interpolate_ball_positions(track_table)
+        self.add_derived_columns(track_table, camera_movement_per_frame, frame_rate)
+
+        with self.profiler.stage('ball_assignment', frames=number_of_frames):
+            team_ball_control = self.player_assigner.assign_ball_possession(track_table)
+            # Possession per time window and pitch zone, within the bounds of the pitch coordinates
+            pitch_bounds = (self.view_transformer.target_vertices.min(axis=0), self.view_transformer.target_vertices.max(axis=0))
+            self.possession_stats = PossessionStats.from_tracks(
+                track_table, team_ball_control, frame_rate=frame_rate, pitch_bounds=pitch_bounds,
+                view_transformer=self.view_transformer, camera_movement_per_frame=camera_movement_per_frame,
+            )
+        return track_table, team_ball_control
+
+    def add_derived_columns(self, track_table, camera_movement_per_frame, frame_rate):
+        self.speed_and_distance_estimator.frame_rate = frame_rate
+        add_derived_columns(
+            track_table, camera_movement_per_frame, self.tracker, self.camera_movement_estimator, self.view_transformer,
+            self.speed_and_distance_estimator, self.proximity_analyzer, self.profiler,
+        )
+
+    def annotate_video(self, video_path, tracks, team_ball_control, camera_movement_per_frame):
+        # Yields annotated frames chunk by chunk so save_video can encode them as they are produced
+        start_frame = 0
+        chunks = read_video_chunks(video_path, self.chunk_size, threaded=self.threaded_io)
+        for frames in self.profiler.iterate('decode', chunks):
+            # Decoded frames are not used again, so they are annotated in place
+            with self.profiler.stage('draw', frames=len(frames)):
+                output_frames = list(self.renderer.render_frames(frames, tracks, team_ball_control, camera_movement_per_frame, start_frame=start_frame))
+
+            yield from output_frames
+            start_frame += len(frames)
@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+from urllib.parse import urlsplit, parse_qsl
+
+# Make the repository root and utilities importable when run as a script
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, 'utilities'))
+
+from service.job_service import JobService, parse_settings
+
+# Minimal HTTP/1.1 front end for JobService on asyncio streams, one request per connection:
+#   POST   /jobs                          JSON {"video_path": ..., "settings": {...}} for a video on this box, or the
+#                                         video file itself as the body, with settings in the query string
+#   GET    /jobs                          every job
+#   GET    /jobs/<id>                     one job: status, progress per phase and stage timings
+#   GET    /jobs/<id>/events              server-sent events with the job's state after every change, until it is done
+#   GET    /jobs/<id>/artifacts/<name>    download tracks, statistics, profile or video
+#   DELETE /jobs/<id>                     cancel a queued job
+
+STATUS_TEXT = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 411: 'Length Required', 500: 'Internal Server Error'}
+ARTIFACT_TYPES = {"tracks": "application/octet-stream", "statistics": "application/json", "profile": "application/json", "video": "video/x-msvideo"}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class JobServer:
+    def __init__(self, service, host='127.0.0.1', port=8000, max_upload_bytes=16 * 1024**3, max_json_bytes=1024**2):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.max_upload_bytes = max_upload_bytes
+        self.max_json_bytes = max_json_bytes
+        self.server = None
+
+    async def start(self):
+        await self.service.start()
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        # Port 0 picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.service.stop()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            method, path, query, headers = await self.read_request_head(reader)
+            await self.route(method, path, query, headers, reader, writer)
+        except HTTPError as e:
+            await self.send_json(writer, e.status, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            await self.send_json(writer, 500, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def read_request_head(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise HTTPError(400, "Malformed request line")
+        method, target, _ = parts
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        return method, url.path.rstrip('/') or '/', dict(parse_qsl(url.query)), headers
+
+    async def route(self, method, path, query, headers, reader, writer):
+        parts = path.strip('/').split('/')
+        if parts[0] != 'jobs':
+            raise HTTPError(404, f"No route for {path}")
+
+        if len(parts) == 1:
+            if method == 'POST':
+                job = await self.submit(query, headers, reader)
+                await self.send_json(writer, 201, job.to_dict())
+            elif method == 'GET':
+                await self.send_json(writer, 200, [job.to_dict() for job in self.service.jobs.values()])
+            else:
+                raise HTTPError(405, f"{method} not allowed on /jobs")
+            return
+
+        job = self.service.jobs.get(parts[1])
+        if job is None:
+            raise HTTPError(404, f"No job {parts[1]}")
+
+        if len(parts) == 2 and method == 'GET':
+            await self.send_json(writer, 200, job.to_dict())
+        elif len(parts) == 2 and method == 'DELETE':
+            if not self.service.cancel(job.job_id):
+                raise HTTPError(409, f"Job {job.job_id} is {job.status} and can no longer be cancelled")
+            await self.send_json(writer, 200, job.to_dict())
+        elif len(parts) == 3 and parts[2] == 'events' and method == 'GET':
+            await self.send_events(writer, job)
+        elif len(parts) == 4 and parts[2] == 'artifacts' and method == 'GET':
+            if parts[3] not in job.artifacts:
+                raise HTTPError(404, f"Job {job.job_id} has no artifact {parts[3]}")
+            await self.send_file(writer, job.artifacts[parts[3]], ARTIFACT_TYPES.get(parts[3], 'application/octet-stream'))
+        else:
+            raise HTTPError(405 if len(parts) <= 4 else 404, f"{method} not allowed on {path}")
+
+    async def submit(self, query, headers, reader):
+        if 'content-length' not in headers:
+            raise HTTPError(411, "Content-Length required")
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise HTTPError(400, f"Invalid Content-Length: {headers['content-length']!r}")
+
+        try:
+            if headers.get('content-type', '').startswith('application/json'):
+                # The body is read into memory, so it gets a much smaller limit than an upload
+                if length > self.max_json_bytes:
+                    raise HTTPError(400, f"JSON body larger than {self.max_json_bytes} bytes")
+                request = json.loads(await reader.readexactly(length) or b'{}')
+                if not isinstance(request, dict):
+                    raise HTTPError(400, "JSON body must be an object")
+                if not isinstance(request.get("video_path"), str):
+                    raise HTTPError(400, "video_path is required")
+                if not isinstance(request.get("settings") or {}, dict):
+                    raise HTTPError(400, "settings must be an object")
+                return self.service.submit(request["video_path"], request.get("settings"))
+
+            # The body is the video itself; stream it to the job directory instead of holding it in memory
+            if length > self.max_upload_bytes:
+                raise HTTPError(400, f"Upload larger than {self.max_upload_bytes} bytes")
+            # Settings are checked before the upload is read, and a failed upload leaves nothing behind in jobs_dir
+            extension = os.path.splitext(query.pop('filename', 'input.mp4'))[1]
+            parse_settings(query)
+            job_id, job_dir = self.service.new_job_dir()
+            try:
+                video_path = os.path.join(job_dir, 'input' + extension)
+                with open(video_path, 'wb') as f:
+                    remaining = length
+                    while remaining:
+                        block = await reader.readexactly(min(remaining, 1024 * 1024))
+                        f.write(block)
+                        remaining -= len(block)
+                return self.service.submit(video_path, query, job_id=job_id, job_dir=job_dir)
+            except BaseException:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                raise
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+    async def send_head(self, writer, status, content_type, content_length=None):
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}", f"Content-Type: {content_type}", "Connection: close"]
+        if content_length is not None:
+            lines.append(f"Content-Length: {content_length}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+
+    async def send_json(self, writer, status, body):
+        data = json.dumps(body, default=str).encode()
+        await self.send_head(writer, status, 'application/json', len(data))
+        writer.write(data)
+        await writer.drain()
+
+    async def send_events(self, writer, job):
+        await self.send_head(writer, 200, 'text/event-stream')
+        async for state in self.service.watch(job):
+            writer.write(f"event: {state['status']}\ndata: {json.dumps(state, default=str)}\n\n".encode())
+            await writer.drain()
+
+    async def send_file(self, writer, path, content_type):
+        await self.send_head(writer, 200, content_type, os.path.getsize(path))
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                writer.write(block)
+                await writer.drain()
+
+async def serve(args):
+    service = JobService(args.model, workers=args.workers, jobs_dir=args.jobs_dir, cache_dir=args.cache_dir)
+    server = JobServer(service, args.host, args.port)
+    await server.start()
+    print(f"Serving match analysis jobs on http://{server.host}:{server.port}/jobs with {args.workers} workers")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='/teamspace/studios/this_studio/runs/detect/train/weights/best.pt')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=2, help='Matches analyzed at the same time, one process each')
+    parser.add_argument('--jobs-dir', default='output_jobs', help='Uploaded videos and job artifacts are kept here')
+    parser.add_argument('--cache-dir', default='stubs/cache', help='ResultCache shared by all workers')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utilities.video_utils import get_video_properties
+from utilities.result_cache import ResultCache
+from utilities.profiler import StageProfiler
+from pipeline.streaming_pipeline import StreamingPipeline
+from camera_motion_analysis.camera_movement_estimator import MOVEMENT_ESTIMATORS
+
+# Settings a job may override, with their types and defaults
+JOB_SETTINGS = {
+    "chunk_size": (int, 120),
+    "detection_stride": (int, 1),
+    "motion_threshold": (float, None),
+    "camera_scale": (float, 1.0),
+    "camera_estimator": (str, 'max'),
+    "calibration_path": (str, None),
+    "render": (bool, True),
+}
+
+# Stages whose frames count towards each phase of a job's progress
+PROGRESS_PHASES = {"camera_motion": "tracking", "draw": "rendering"}
+
+def parse_settings(settings):
+    # Validated job settings with defaults filled in; values may be strings, e.g. from a query string
+    unknown = set(settings) - set(JOB_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+
+    parsed = {}
+    for name, (setting_type, default) in JOB_SETTINGS.items():
+        value = settings.get(name, default)
+        if value is not None and not isinstance(value, setting_type):
+            if setting_type is bool:
+                if str(value).lower() not in ('1', '0', 'true', 'false', 'yes', 'no'):
+                    raise ValueError(f"{name} must be a boolean, got {value!r}")
+                value = str(value).lower() in ('1', 'true', 'yes')
+            else:
+                try:
+                    value = setting_type(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f"{name} must be {setting_type.__name__}, got {value!r}")
+        parsed[name] = value
+
+    if parsed["camera_estimator"] not in MOVEMENT_ESTIMATORS:
+        raise ValueError(f"camera_estimator must be one of {MOVEMENT_ESTIMATORS}, got {parsed['camera_estimator']!r}")
+    if parsed["chunk_size"] < 1 or parsed["detection_stride"] < 1 or parsed["camera_scale"] <= 0:
+        raise ValueError("chunk_size and detection_stride must be at least 1 and camera_scale positive")
+    return parsed
+
+def job_phases(settings):
+    return ('tracking', 'rendering') if settings["render"] else ('tracking',)
+
+def player_teams(track_table):
+    # Last team of every player track ID, read from the tracks, so it also covers cached runs and IDs the team
+    # assigner has since forgotten
+    players = track_table.object_mask('players')
+    teams = {}
+    for player_id, team in zip(track_table.track_id[players].tolist(), track_table['team'][players].tolist()):
+        teams[player_id] = team
+    return teams
+
+class JobProgress:
+    # StageProfiler listener in the worker process: totals stage events and sends a progress snapshot to the
+    # service at most every interval seconds, plus every time a phase completes, so a chatty stage such as
+    # per-frame tracking never floods the queue
+    def __init__(self, job_id, progress_queue, total_frames, phases, interval=0.5):
+        self.job_id = job_id
+        self.progress_queue = progress_queue
+        self.total_frames = total_frames
+        self.interval = interval
+        self.last_sent = 0
+        self.phases = {phase: 0 for phase in phases}
+        self.stages = {}
+
+    def __call__(self, event):
+        stage = self.stages.setdefault(event["name"], {"calls": 0, "self_time": 0.0, "frames": 0})
+        stage["calls"] += 1
+        stage["self_time"] += event["self_time"]
+        stage["frames"] += event["frames"]
+
+        phase = PROGRESS_PHASES.get(event["name"])
+        if phase in self.phases:
+            self.phases[phase] += event["frames"]
+        phase_done = phase in self.phases and self.phases[phase] >= self.total_frames
+
+        now = time.perf_counter()
+        if now - self.last_sent >= self.interval or phase_done:
+            self.send()
+            self.last_sent = now
+
+    def send(self):
+        self.progress_queue.put({
+            "job_id": self.job_id,
+            "type": "progress",
+            "phases": dict(self.phases),
+            "total_frames": self.total_frames,
+            "stages": {name: dict(stage) for name, stage in self.stages.items()},
+        })
+
+def run_job(job_id, video_path, job_dir, model_path, cache_dir, settings, total_frames, progress_queue, torch_threads):
+    # Runs in a worker process: the streaming pipeline on one match, writing its artifacts to job_dir.
+    # Returns artifact name -> path and the stage summary.
+    import torch
+    torch.set_num_threads(torch_threads)
+
+    profiler = StageProfiler(listener=JobProgress(job_id, progress_queue, total_frames, job_phases(settings)))
+    pipeline = StreamingPipeline(
+        model_path, chunk_size=settings["chunk_size"], calibration_path=settings["calibration_path"],
+        cache=ResultCache(cache_dir) if cache_dir is not None else None, detection_stride=settings["detection_stride"],
+        motion_threshold=settings["motion_threshold"], camera_scale=settings["camera_scale"],
+        camera_estimator=settings["camera_estimator"], profiler=profiler,
+    )
+
+    artifacts = {}
+    if settings["render"]:
+        artifacts["video"] = os.path.join(job_dir, 'output_video.avi')
+        track_table, _ = pipeline.run(video_path, artifacts["video"])
+    else:
+        tracks, camera_movement_per_frame = pipeline.track_video(video_path)
+        track_table, _ = pipeline.analyze_tracks(tracks, camera_movement_per_frame, frame_rate=get_video_properties(video_path)["fps"])
+
+    artifacts["tracks"] = os.path.join(job_dir, 'tracks.npz')
+    np.savez_compressed(artifacts["tracks"], **track_table.to_arrays())
+
+    artifacts["statistics"] = os.path.join(job_dir, 'statistics.json')
+    statistics = {
+        "possession": pipeline.possession_stats.summary(),
+        "players": pipeline.speed_and_distance_estimator.player_summary(track_table),
+        "team_shape": pipeline.proximity_analyzer.summary(track_table),
+        "teams": player_teams(track_table),
+    }
+    with open(artifacts["statistics"], 'w') as f:
+        json.dump(statistics, f, indent=2)
+
+    artifacts["profile"] = os.path.join(job_dir, 'profile.json')
+    profiler.save_json(artifacts["profile"])
+
+    return {"artifacts": artifacts, "stages": profiler.summary()}
+
+class Job:
+    def __init__(self, job_id, video_path, settings, total_frames, job_dir):
+        self.job_id = job_id
+        self.video_path = video_path
+        self.settings = settings
+        self.total_frames = total_frames
+        self.job_dir = job_dir
+        self.status = 'queued'
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = None
+        self.stages = {}
+        self.artifacts = {}
+        self.error = None
+        self.changed = asyncio.Event()
+
+    @property
+    def done(self):
+        return self.status in ('finished', 'failed', 'cancelled')
+
+    def notify(self):
+        # Wake every watcher, then start a fresh event for the next change
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "video_path": self.video_path,
+            "settings": self.settings,
+            "status": self.status,
+            "total_frames": self.total_frames,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "progress": self.progress,
+            "stages": self.stages,
+            "artifacts": sorted(self.artifacts),
+            "error": self.error,
+        }
+
+class JobService:
+    # Queues match videos and runs each through the streaming pipeline (Tracker, CameraMovementEstimator,
+    # ViewTransformer, SpeedAndDistance_Estimator, TeamAssigner, PlayerBallAssigner) in a fixed pool of worker
+    # processes, so many matches can be queued on one box. Workers report progress and stage timings while a job
+    # runs; finished jobs leave tracks, statistics, a profile and optionally the annotated video in jobs_dir/<job_id>.
+    # Only the max_finished_jobs most recently finished jobs are kept in jobs, so a long-running service does not
+    # grow without bound; their files stay in jobs_dir. run_job runs in the workers and must be picklable.
+    # All methods run on the event loop.
+    def __init__(self, model_path, workers=2, jobs_dir='output_jobs', cache_dir='stubs/cache', max_finished_jobs=1000, run_job=run_job):
+        self.model_path = model_path
+        self.workers = workers
+        self.jobs_dir = jobs_dir
+        self.cache_dir = cache_dir
+        self.max_finished_jobs = max_finished_jobs
+        self.run_job = run_job
+        self.jobs = {}
+        self.queue = None
+        self.pool = None
+        self.manager = None
+        self.progress_queue = None
+        self.worker_tasks = []
+        self.progress_thread = None
+        self.loop = None
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+        # spawn keeps torch and OpenCV thread pools out of forked children
+        context = multiprocessing.get_context('spawn')
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        self.manager = context.Manager()
+        self.progress_queue = self.manager.Queue()
+        self.progress_thread = threading.Thread(target=self._read_progress, daemon=True)
+        self.progress_thread.start()
+
+        self.worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        self.progress_queue.put(None)
+        await self.loop.run_in_executor(None, self.progress_thread.join)
+        # Both wait for their processes to exit, so they run off the event loop
+        await self.loop.run_in_executor(None, functools.partial(self.pool.shutdown, cancel_futures=True))
+        await self.loop.run_in_executor(None, self.manager.shutdown)
+
+    def new_job_dir(self):
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        return job_id, job_dir
+
+    def submit(self, video_path, settings=None, job_id=None, job_dir=None):
+        # Queue a video for analysis; raises ValueError for bad settings or a video that cannot be read
+        settings = parse_settings(settings or {})
+        if not os.path.isfile(video_path):
+            raise ValueError(f"Video not found: {video_path}")
+        total_frames = get_video_properties(video_path)["frame_count"]
+        if total_frames <= 0:
+            raise ValueError(f"Could not read video: {video_path}")
+
+        if job_id is None:
+            job_id, job_dir = self.new_job_dir()
+        job = Job(job_id, os.path.abspath(video_path), settings, total_frames, job_dir)
+        self.jobs[job_id] = job
+        self.queue.put_nowait(job)
+        return job
+
+    def cancel(self, job_id):
+        # Only queued jobs can be cancelled; a running job holds its worker until it finishes
+        job = self.jobs[job_id]
+        if job.status != 'queued':
+            return False
+        job.status = 'cancelled'
+        job.finished = time.time()
+        job.notify()
+        self.forget_finished_jobs()
+        return True
+
+    def forget_finished_jobs(self):
+        # Forget the jobs that finished first beyond max_finished_jobs; watchers already holding one still see it
+        finished = [job for job in self.jobs.values() if job.done]
+        finished.sort(key=lambda job: job.finished)
+        for job in finished[:max(len(finished) - self.max_finished_jobs, 0)]:
+            del self.jobs[job.job_id]
+
+    async def watch(self, job):
+        # Yields the job's state now and after every change, until it is done
+        while True:
+            changed = job.changed
+            yield job.to_dict()
+            if job.done:
+                return
+            await changed.wait()
+
+    async def _worker(self):
+        torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        while True:
+            job = await self.queue.get()
+            if job.status != 'queued':
+                continue
+
+            job.status = 'running'
+            job.started = time.time()
+            job.notify()
+            try:
+                result = await self.loop.run_in_executor(
+                    self.pool, self.run_job, job.job_id, job.video_path, job.job_dir, self.model_path, self.cache_dir,
+                    job.settings, job.total_frames, self.progress_queue, torch_threads,
+                )
+                job.artifacts = result["artifacts"]
+                job.stages = result["stages"]
+                # Phases served from the result cache never report frames
+                job.progress = {phase: 1.0 for phase in job_phases(job.settings)}
+                job.status = 'finished'
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = 'failed'
+            job.finished = time.time()
+            job.notify()
+            self.forget_finished_jobs()
+
+    def _read_progress(self):
+        # Runs on a thread: forward progress messages from the workers to the event loop
+        while True:
+            message = self.progress_queue.get()
+            if message is None:
+                return
+            self.loop.call_soon_threadsafe(self._on_progress, message)
+
+    def _on_progress(self, message):
+        job = self.jobs.get(message["job_id"])
+        if job is None or job.done:
+            return
+        job.progress = {phase: frames / job.total_frames for phase, frames in message["phases"].items()}
+        job.stages = message["stages"]
+        job.notify()
@@ -0,0 +1,160 @@
+import numpy as np
+
+class PitchGrid:
+    # Uniform grid index over pitch coordinates for a whole match at once. Every point (one object in one frame)
+    # lives in a (frame, cell) bucket, and the points are sorted by bucket key, so the points of any cell in any frame
+    # are found with a binary search. Queries are batched: each query has its own frame and position and only sees
+    # points of that frame. Points with a NaN position are left out.
+    # cell_size is in pitch units (meters); about the typical query radius works best.
+    def __init__(self, frames, positions, cell_size=5.0):
+        frames = np.asarray(frames, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        self.cell_size = cell_size
+        self.number_of_points = len(positions)
+
+        valid = ~np.isnan(positions).any(axis=1)
+        self.origin = positions[valid].min(axis=0) if valid.any() else np.zeros(2)
+        extent = positions[valid].max(axis=0) - self.origin if valid.any() else np.zeros(2)
+        self.grid_shape = (np.floor(extent / cell_size).astype(np.int64) + 1)
+        self.number_of_cells = int(self.grid_shape[0] * self.grid_shape[1])
+        # Farthest any two points can be apart: the diagonal of the grid
+        self.max_distance = float(np.hypot(*(self.grid_shape * cell_size)))
+
+        # Indices into the input arrays of the valid points, sorted by (frame, cell)
+        point_indices = np.flatnonzero(valid)
+        cells = self.cell_of(positions[point_indices])
+        keys = frames[point_indices] * self.number_of_cells + cells[:, 1] * self.grid_shape[0] + cells[:, 0]
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.point_indices = point_indices[order]
+        self.positions = positions[self.point_indices]
+
+    def cell_of(self, positions):
+        return np.floor((positions - self.origin) / self.cell_size).astype(np.int64)
+
+    def candidates(self, query_frames, query_positions, reach):
+        # (query, sorted point) pairs for every point within reach cells of each query's cell, in its frame.
+        # Queries are visited in key order, which keeps every shifted key array sorted and the binary searches
+        # cache friendly.
+        query_cells = self.cell_of(query_positions)
+        query_keys = query_frames * self.number_of_cells + query_cells[:, 1] * self.grid_shape[0] + query_cells[:, 0]
+        query_order = np.argsort(query_keys, kind='stable')
+        query_keys = query_keys[query_order]
+        query_cells = query_cells[query_order]
+        pair_queries = []
+        pair_points = []
+
+        # The cells of one grid row are adjacent in key order, so each row of the neighborhood is a single range
+        first_x = np.maximum(query_cells[:, 0] - reach, 0)
+        last_x = np.minimum(query_cells[:, 0] + reach, self.grid_shape[0] - 1)
+        # Only the rows that reach the grid, which matters for queries far outside it
+        first_dy = max(-reach, -int(query_cells[:, 1].max(initial=0)))
+        last_dy = min(reach, int(self.grid_shape[1]) - 1 - int(query_cells[:, 1].min(initial=0)))
+        for dy in range(first_dy, last_dy + 1):
+            cell_y = query_cells[:, 1] + dy
+            inside = np.flatnonzero((cell_y >= 0) & (cell_y < self.grid_shape[1]))
+            row_keys = query_keys[inside] + dy * self.grid_shape[0] - query_cells[inside, 0]
+            low = np.searchsorted(self.keys, row_keys + first_x[inside], side='left')
+            high = np.searchsorted(self.keys, row_keys + last_x[inside], side='right')
+
+            # Expand every [low, high) range into its point positions
+            counts = high - low
+            found = counts > 0
+            inside, low, counts = inside[found], low[found], counts[found]
+            total = counts.sum()
+            if total == 0:
+                continue
+            pair_queries.append(np.repeat(query_order[inside], counts))
+            pair_points.append(np.repeat(low - np.cumsum(counts) + counts, counts) + np.arange(total))
+
+        if not pair_queries:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(pair_queries), np.concatenate(pair_points)
+
+    def prepare_queries(self, query_frames, query_positions, exclude):
+        query_frames = np.asarray(query_frames, dtype=np.int64).reshape(-1)
+        query_positions = np.asarray(query_positions, dtype=np.float64).reshape(-1, 2)
+        exclude = np.full(len(query_frames), -1, dtype=np.int64) if exclude is None else np.asarray(exclude, dtype=np.int64).reshape(-1)
+        return query_frames, query_positions, exclude
+
+    def pairs_within(self, query_frames, query_positions, radius, exclude, queries=None, sort=True):
+        # (query, point index, distance) for every point within radius of a query, with sort by query then distance.
+        # queries restricts the search to a subset of the query numbers.
+        if queries is None:
+            queries = np.arange(len(query_frames))
+        valid = ~np.isnan(query_positions[queries]).any(axis=1)
+        queries = queries[valid]
+
+        reach = int(np.ceil(radius / self.cell_size))
+        pair_queries, pair_points = self.candidates(query_frames[queries], query_positions[queries], reach)
+        pair_queries = queries[pair_queries]
+
+        distances = np.hypot(*(self.positions[pair_points] - query_positions[pair_queries]).T)
+        point_indices = self.point_indices[pair_points]
+        keep = (distances <= radius) & (point_indices != exclude[pair_queries])
+        pair_queries, point_indices, distances = pair_queries[keep], point_indices[keep], distances[keep]
+        if not sort:
+            return pair_queries, point_indices, distances
+
+        # One float sort key is several times faster than lexsort; distances stay below the query step
+        order = np.argsort(pair_queries * (2 * radius + 1) + distances)
+        return pair_queries[order], point_indices[order], distances[order]
+
+    def radius_query(self, query_frames, query_positions, radius, exclude=None):
+        # Points of the query's frame within radius of each query, nearest first, as CSR arrays:
+        # the neighbors of query q are indices[offsets[q]:offsets[q + 1]] (indices into the arrays the grid was
+        # built from) at distances[offsets[q]:offsets[q + 1]]. exclude gives one point index per query to skip,
+        # e.g. the querying object itself, or -1.
+        query_frames, query_positions, exclude = self.prepare_queries(query_frames, query_positions, exclude)
+        pair_queries, point_indices, distances = self.pairs_within(query_frames, query_positions, radius, exclude)
+        offsets = np.r_[0, np.cumsum(np.bincount(pair_queries, minlength=len(query_frames)))]
+        return offsets, point_indices, distances
+
+    def count_within(self, query_frames, query_positions, radius, exclude=None, weights=None):
+        # Number of points within radius of each query; with weights (one per point the grid was built from),
+        # the sum of their weights instead, e.g. a mask to only count one team
+        query_frames, query_positions, exclude = self.prepare_queries(query_frames, query_positions, exclude)
+        pair_queries, point_indices, _ = self.pairs_within(query_frames, query_positions, radius, exclude, sort=False)
+        if weights is None:
+            return np.bincount(pair_queries, minlength=len(query_frames))
+        return np.bincount(pair_queries, weights=np.asarray(weights)[point_indices], minlength=len(query_frames))
+
+    def knn_query(self, query_frames, query_positions, k=1, exclude=None, max_radius=None):
+        # The k nearest points of the query's frame, nearest first, as (Q, k) indices (-1 where there are fewer than
+        # k points) and distances (inf there). Searches within one cell first and doubles the radius for the queries
+        # that found fewer than k points, so crowded frames stay cheap. max_radius, if given, limits the search.
+        query_frames, query_positions, exclude = self.prepare_queries(query_frames, query_positions, exclude)
+        # Every point is within a query's distance to the grid plus the grid's diagonal, also for queries outside it
+        grid_end = self.origin + self.grid_shape * self.cell_size
+        outside = np.maximum(np.maximum(self.origin - query_positions, query_positions - grid_end), 0)
+        reach_all = np.hypot(outside[:, 0], outside[:, 1]) + self.max_distance
+        max_radius = reach_all if max_radius is None else np.minimum(reach_all, max_radius)
+
+        indices = np.full((len(query_frames), k), -1, dtype=np.int64)
+        distances = np.full((len(query_frames), k), np.inf)
+        pending = np.flatnonzero(~np.isnan(query_positions).any(axis=1))
+        radius = self.cell_size
+
+        while len(pending):
+            radius = min(radius, max_radius[pending].max())
+            pair_queries, point_indices, pair_distances = self.pairs_within(query_frames, query_positions, radius, exclude, pending)
+            within = pair_distances <= max_radius[pair_queries]
+            pair_queries, point_indices, pair_distances = pair_queries[within], point_indices[within], pair_distances[within]
+
+            # Rank of each pair within its query; pairs are sorted by query, then distance
+            counts = np.bincount(pair_queries, minlength=len(query_frames))
+            first_pair = np.cumsum(counts) - counts
+            rank = np.arange(len(pair_queries)) - first_pair[pair_queries]
+
+            # Every point within the radius was seen, so the nearest k are final once k were found
+            done = pending[(counts[pending] >= k) | (radius >= max_radius[pending])]
+            is_done = np.zeros(len(query_frames), dtype=bool)
+            is_done[done] = True
+            take = is_done[pair_queries] & (rank < k)
+            indices[pair_queries[take], rank[take]] = point_indices[take]
+            distances[pair_queries[take], rank[take]] = pair_distances[take]
+
+            pending = pending[~is_done[pending]]
+            radius *= 2
+
+        return indices, distances
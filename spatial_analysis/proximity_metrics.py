@@ -0,0 +1,108 @@
+import numpy as np
+from spatial_analysis.pitch_grid import PitchGrid
+
+class ProximityAnalyzer:
+    # Proximity metrics over a whole match of a TrackTable, from the pitch coordinates in position_transformed.
+    # Every metric is one batched query against a PitchGrid per team, instead of a loop over frames and players.
+    # Players need a team (1 or 2) and a pitch position; rows without either get the column fill values.
+    # Distances are in pitch units (meters).
+    def __init__(self, pressure_radius=5.0, ball_control_distance=2.0, cell_size=5.0):
+        self.pressure_radius = pressure_radius
+        self.ball_control_distance = ball_control_distance
+        self.cell_size = cell_size
+
+    def player_rows(self, track_table, team=None):
+        # Rows of the players with a team and a pitch position, of one team or both
+        if 'position_transformed' not in track_table or 'team' not in track_table:
+            return np.zeros(0, dtype=np.int64)
+        mask = track_table.object_mask('players') & ~np.isnan(track_table['position_transformed']).any(axis=1)
+        mask &= (track_table['team'] == team) if team is not None else (track_table['team'] > 0)
+        return np.flatnonzero(mask)
+
+    def team_grid(self, track_table, team):
+        rows = self.player_rows(track_table, team)
+        return rows, PitchGrid(track_table.frame[rows], track_table['position_transformed'][rows], self.cell_size)
+
+    def add_proximity_to_tracks(self, track_table):
+        # Per player row: the track ID of and distance to the nearest opponent, and the number of opponents within
+        # pressure_radius
+        nearest_opponent = track_table.empty_column('nearest_opponent')
+        nearest_opponent_distance = track_table.empty_column('nearest_opponent_distance')
+        opponents_nearby = track_table.empty_column('opponents_nearby')
+
+        grids = {team: self.team_grid(track_table, team) for team in (1, 2)}
+        for team, opponent_team in ((1, 2), (2, 1)):
+            rows, _ = grids[team]
+            opponent_rows, opponent_grid = grids[opponent_team]
+            if len(rows) == 0 or len(opponent_rows) == 0:
+                continue
+            frames = track_table.frame[rows]
+            positions = track_table['position_transformed'][rows]
+
+            indices, distances = opponent_grid.knn_query(frames, positions, k=1)
+            found = indices[:, 0] >= 0
+            nearest_opponent[rows[found]] = track_table.track_id[opponent_rows[indices[found, 0]]]
+            nearest_opponent_distance[rows[found]] = distances[found, 0]
+            opponents_nearby[rows] = opponent_grid.count_within(frames, positions, self.pressure_radius)
+
+        track_table['nearest_opponent'] = nearest_opponent
+        track_table['nearest_opponent_distance'] = nearest_opponent_distance
+        track_table['opponents_nearby'] = opponents_nearby
+
+    def ball_owners(self, track_table, ball_positions):
+        # (frames,) track ID of the player nearest to the ball, given its (frames, 2) pitch position per frame
+        # (see ball_possession.possession_stats.ball_pitch_positions), or -1 where nobody is within
+        # ball_control_distance or the ball has no position
+        owners = np.full(track_table.number_of_frames, -1, dtype=np.int64)
+        rows = self.player_rows(track_table)
+        ball_frames = np.flatnonzero(~np.isnan(ball_positions).any(axis=1))
+        if len(rows) == 0 or len(ball_frames) == 0:
+            return owners
+
+        grid = PitchGrid(track_table.frame[rows], track_table['position_transformed'][rows], self.cell_size)
+        indices, _ = grid.knn_query(ball_frames, ball_positions[ball_frames], k=1, max_radius=self.ball_control_distance)
+        found = indices[:, 0] >= 0
+        owners[ball_frames[found]] = track_table.track_id[rows[indices[found, 0]]]
+        return owners
+
+    def team_compactness(self, track_table):
+        # {team: (frames, 3) array of spread, width, length}, NaN in frames without players of the team.
+        # spread is the mean distance of the players to the team's centroid; width and length are the extent of
+        # the team along the pitch x and y axes.
+        compactness = {}
+        for team in (1, 2):
+            rows = self.player_rows(track_table, team)
+            frames = track_table.frame[rows]
+            positions = track_table['position_transformed'][rows]
+            number_of_frames = track_table.number_of_frames
+
+            counts = np.bincount(frames, minlength=number_of_frames)
+            with np.errstate(invalid='ignore'):
+                centroids = np.stack([np.bincount(frames, positions[:, axis], number_of_frames) for axis in (0, 1)], axis=1) / counts[:, None]
+                offsets = np.hypot(*(positions - centroids[frames]).T)
+                spread = np.bincount(frames, offsets, number_of_frames) / counts
+
+            extent = np.full((number_of_frames, 2), np.nan)
+            if len(rows):
+                # Rows are ordered by frame, so each frame's players are one contiguous run
+                starts = np.flatnonzero(np.r_[True, frames[1:] != frames[:-1]])
+                extent[frames[starts]] = np.maximum.reduceat(positions, starts) - np.minimum.reduceat(positions, starts)
+            compactness[team] = np.column_stack([spread, extent])
+        return compactness
+
+    def summary(self, track_table, compactness=None):
+        # Match averages per team, for reports
+        compactness = self.team_compactness(track_table) if compactness is None else compactness
+        summary = {}
+        for team, values in compactness.items():
+            rows = self.player_rows(track_table, team)
+            with np.errstate(invalid='ignore'):
+                spread, width, length = np.nanmean(values, axis=0) if np.isfinite(values).any() else (np.nan,) * 3
+            pressure = track_table['opponents_nearby'][rows] if 'opponents_nearby' in track_table else np.zeros(0)
+            summary[f"team_{team}"] = {
+                "spread": None if np.isnan(spread) else float(spread),
+                "width": None if np.isnan(width) else float(width),
+                "length": None if np.isnan(length) else float(length),
+                "opponents_nearby": float(pressure.mean()) if len(pressure) else None,
+            }
+        return summary
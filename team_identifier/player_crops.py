@@ -0,0 +1,93 @@
+import cv2
+import numpy as np
+
+class PlayerCrops:
+    # Player crops in one preallocated (capacity, height, width, 3) tensor, with the frame and track ID of each crop.
+    # Crops are cut while their frame is decoded, so team colors can be computed later in one batch without keeping
+    # the frames. Each crop sits in the top-left corner of its slot, with its size in heights and widths; crops
+    # larger than crop_size are shrunk to fit, keeping their aspect ratio. clear() reuses the buffer, e.g. per chunk.
+    def __init__(self, capacity=512, crop_size=(128, 64)):
+        self.crop_size = tuple(crop_size)
+        self.pixels = np.zeros((capacity,) + self.crop_size + (3,), dtype=np.uint8)
+        self.frame = np.zeros(capacity, dtype=np.int64)
+        self.track_id = np.zeros(capacity, dtype=np.int64)
+        self.heights = np.zeros(capacity, dtype=np.int64)
+        self.widths = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+
+    @classmethod
+    def from_frame(cls, frame, bboxes, track_ids=None, frame_num=0, crop_size=(128, 64)):
+        # Crops of one frame, shrunk to the same slot size as crops collected over a chunk, so a player's colors do not
+        # depend on which path cut the crop
+        crops = cls(len(bboxes), crop_size)
+        crops.add(frame, frame_num, range(len(bboxes)) if track_ids is None else track_ids, bboxes)
+        return crops
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.size = 0
+
+    def reserve(self, count):
+        # Room for count more crops, doubling the buffers when they are full
+        capacity = len(self.pixels)
+        if self.size + count <= capacity:
+            return
+        capacity = max(self.size + count, 2 * capacity)
+        for name in ('pixels', 'frame', 'track_id', 'heights', 'widths'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add(self, frame, frame_num, track_ids, bboxes):
+        # Cut the box of every track from the frame; returns the rows of the new crops
+        track_ids = list(track_ids)
+        self.reserve(len(track_ids))
+        start = self.size
+        max_height, max_width = self.crop_size
+
+        for row, (track_id, bbox) in enumerate(zip(track_ids, bboxes), start=start):
+            x1, y1, x2, y2 = clip_bbox(bbox, frame.shape)
+            image = frame[y1:y2, x1:x2]
+            height, width = image.shape[:2]
+            if height > max_height or width > max_width:
+                scale = min(max_height / height, max_width / width)
+                height, width = max(int(height * scale), 1), max(int(width * scale), 1)
+                image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+            self.pixels[row, :height, :width] = image
+            self.frame[row] = frame_num
+            self.track_id[row] = track_id
+            self.heights[row] = height
+            self.widths[row] = width
+
+        self.size = start + len(track_ids)
+        return np.arange(start, self.size)
+
+    def tensor(self, rows=None):
+        # (N, height, width, 3) crops with their heights and widths; views unless rows is given
+        if rows is None:
+            rows = slice(0, self.size)
+        return self.pixels[rows], self.heights[rows], self.widths[rows]
+
+    def crop(self, row):
+        return self.pixels[row, :self.heights[row], :self.widths[row]]
+
+    def rows(self, frame_num=None, track_id=None):
+        keep = np.ones(self.size, dtype=bool)
+        if frame_num is not None:
+            keep &= self.frame[:self.size] == frame_num
+        if track_id is not None:
+            keep &= self.track_id[:self.size] == track_id
+        return np.flatnonzero(keep)
+
+def clip_bbox(bbox, frame_shape):
+    # Integer box inside the frame; boxes partly outside are cut at the frame edge
+    height, width = frame_shape[:2]
+    x1 = min(max(int(bbox[0]), 0), width)
+    y1 = min(max(int(bbox[1]), 0), height)
+    x2 = min(max(int(bbox[2]), x1), width)
+    y2 = min(max(int(bbox[3]), y1), height)
+    return x1, y1, x2, y2
@@ -1,73 +1,310 @@
+from collections import OrderedDict
+import json
+import os
 from sklearn.cluster import KMeans
+import numpy as np
+from team_identifier.player_crops import PlayerCrops
 
 class TeamAssigner:
-    def __init__(self):
+    # Team classifier over jersey color histograms.
+    # Every player crop is reduced to a normalized color histogram of its jersey pixels (the top half of the box
+    # minus the background cluster), compared by Hellinger distance. Two team centers are fitted with KMeans on the
+    # first frame; after that each track ID is classified by a vote over samples taken every sample_interval frames,
+    # and rechecked every recheck_interval frames once it has votes_needed samples, so one bad crop or a reused ID
+    # does not fix a wrong team. Confident samples move the team centers online to follow lighting changes.
+    # Votes and teams are kept for the max_tracks most recently seen IDs, so a long or live match does not grow them
+    # without bound; player_team_dict holds the current team of each of those IDs.
+    # The fitted model can be saved and loaded per match with save and load.
+    def __init__(self, histogram_bins=4, sample_interval=5, votes_needed=5, recheck_interval=50, max_tracks=256, learning_rate=0.02, min_margin=0.2):
         self.team_colors = {}
         self.player_team_dict = {}
-    
-    def get_clustering_model(self,image):
-        # Reshape the image to 2D array
-        image_2d = image.reshape(-1,3)
+        self.max_iterations = 300
+        self.crop_batch_size = 16
 
-        # Preform K-means with 2 clusters
-        kmeans = KMeans(n_clusters=2, init="k-means++",n_init=1)
-        kmeans.fit(image_2d)
+        self.histogram_bins = histogram_bins
+        self.sample_interval = sample_interval
+        self.votes_needed = votes_needed
+        self.recheck_interval = recheck_interval
+        self.max_tracks = max_tracks
+        self.learning_rate = learning_rate
+        self.min_margin = min_margin
 
-        return kmeans
+        # (2, bins**3) team centers in embedding space, and {track_id: [team 1 votes, team 2 votes, samples, last frame]}
+        self.centers = None
+        self.votes = OrderedDict()
+        self.frame_count = 0
+
+    def settings(self):
+        return {
+            "histogram_bins": self.histogram_bins,
+            "sample_interval": self.sample_interval,
+            "votes_needed": self.votes_needed,
+            "recheck_interval": self.recheck_interval,
+            "max_tracks": self.max_tracks,
+            "learning_rate": self.learning_rate,
+            "min_margin": self.min_margin,
+        }
 
     def get_player_color(self,frame,bbox):
-        image = frame[int(bbox[1]):int(bbox[3]),int(bbox[0]):int(bbox[2])]
+        return self.get_player_colors(frame,[bbox])[0]
+
+    def get_player_colors(self,frame,bboxes):
+        return self.get_player_features(frame,bboxes)[0]
+
+    def get_player_features(self,frame,bboxes):
+        return self.get_crop_features(*PlayerCrops.from_frame(frame,bboxes).tensor())
+
+    def get_crop_features(self,crops,heights,widths):
+        # (N, 3) jersey color and (N, bins**3) color histogram embedding of every player crop, from a PlayerCrops
+        # tensor. Only the top half of each crop is used; pixels outside a crop are masked out, whatever they hold.
+        # Crops are sorted by size and clustered in batches padded to their own largest crop, not the largest overall.
+        heights = np.asarray(heights) // 2
+        widths = np.asarray(widths)
+        colors = np.empty((len(crops), 3))
+        embeddings = np.empty((len(crops), self.histogram_bins ** 3))
+        order = np.lexsort((widths, heights))
+        for start in range(0, len(order), self.crop_batch_size):
+            rows = order[start:start + self.crop_batch_size]
+            max_height = max(heights[rows].max(), 1)
+            max_width = max(widths[rows].max(), 1)
+            colors[rows], embeddings[rows] = self.cluster_crops(crops[rows, :max_height, :max_width], heights[rows], widths[rows])
+        return colors, embeddings
+
+    def cluster_crops(self,crops,heights,widths):
+        # Runs 2-means on every crop of the batch at once instead of fitting one sklearn model per player
+        num_crops = len(crops)
+        pixels = crops.astype(np.float64)
+        _, max_height, max_width, _ = pixels.shape
+        rows = np.arange(max_height)[None, :, None] < heights[:, None, None]
+        cols = np.arange(max_width)[None, None, :] < widths[:, None, None]
+        mask = rows & cols
+
+        pixels = pixels.reshape(num_crops, max_height * max_width, 3)
+        mask = mask.reshape(num_crops, max_height * max_width)
+
+        # Deterministic seeding: split each crop's pixels along their principal color axis
+        weights = mask[:, :, None]
+        counts = np.maximum(mask.sum(axis=1), 1)[:, None]
+        mean = (pixels * weights).sum(axis=1) / counts
+        centered = (pixels - mean[:, None, :]) * weights
+        covariance = np.einsum('npi,npj->nij', centered, centered)
+        principal_axis = np.linalg.eigh(covariance)[1][:, :, -1]
+        side = np.einsum('npi,ni->np', centered, principal_axis) > 0
 
-        top_half_image = image[0:int(image.shape[0]/2),:]
+        centers = np.empty((num_crops, 2, 3))
+        for cluster in range(2):
+            members = (mask & (side == bool(cluster)))[:, :, None]
+            member_counts = members.sum(axis=1)
+            centers[:, cluster] = np.where(member_counts > 0, (pixels * members).sum(axis=1) / np.maximum(member_counts, 1), mean)
 
-        # Get Clustering model
-        kmeans = self.get_clustering_model(top_half_image)
+        # Crops whose labels stopped changing are done: their centers would not move again, so only the others are
+        # iterated, and a large batch does not run every crop for as long as the slowest one
+        labels = np.zeros(mask.shape, dtype=np.int64)
+        active = np.arange(num_crops)
+        for iteration in range(self.max_iterations):
+            if len(active) == 0:
+                break
+            active_pixels = pixels[active]
+            active_mask = mask[active]
+            distances = ((active_pixels[:, :, None, :] - centers[active][:, None, :, :]) ** 2).sum(axis=3)
+            new_labels = distances.argmin(axis=2)
+            if iteration > 0:
+                changed = ((new_labels != labels[active]) & active_mask).any(axis=1)
+                active, active_pixels, active_mask, new_labels = active[changed], active_pixels[changed], active_mask[changed], new_labels[changed]
+            labels[active] = new_labels
 
-        # Get the cluster labels forr each pixel
-        labels = kmeans.labels_
+            for cluster in range(2):
+                members = (active_mask & (new_labels == cluster))[:, :, None]
+                counts = members.sum(axis=1)
+                sums = (active_pixels * members).sum(axis=1)
+                # Keep the previous center if a cluster lost all of its pixels
+                centers[active, cluster] = np.where(counts > 0, sums / np.maximum(counts, 1), centers[active, cluster])
 
-        # Reshape the labels to the image shape
-        clustered_image = labels.reshape(top_half_image.shape[0],top_half_image.shape[1])
+        # Get the player cluster: the corners of each crop are treated as background
+        corner_indices = np.stack([
+            np.zeros(num_crops, dtype=np.int64),
+            widths - 1,
+            (heights - 1) * max_width,
+            (heights - 1) * max_width + widths - 1,
+        ], axis=1)
+        corner_clusters = np.take_along_axis(labels, np.maximum(corner_indices, 0), axis=1)
 
-        # Get the player cluster
-        corner_clusters = [clustered_image[0,0],clustered_image[0,-1],clustered_image[-1,0],clustered_image[-1,-1]]
-        non_player_cluster = max(set(corner_clusters),key=corner_clusters.count)
+        # Ties go to cluster 0, matching max(set(corner_clusters), key=corner_clusters.count)
+        non_player_cluster = (corner_clusters.sum(axis=1) >= 3).astype(np.int64)
         player_cluster = 1 - non_player_cluster
 
-        player_color = kmeans.cluster_centers_[player_cluster]
+        # Histogram of the jersey pixels over bins**3 color cells; the square root makes Euclidean distances
+        # between embeddings Hellinger distances between histograms
+        bins = self.histogram_bins
+        cells = np.minimum(pixels.astype(np.int64) * bins // 256, bins - 1)
+        cells = (cells[:, :, 0] * bins + cells[:, :, 1]) * bins + cells[:, :, 2]
+        jersey = mask & (labels == player_cluster[:, None])
+        crop_cells = np.arange(num_crops)[:, None] * bins ** 3 + cells
+        histograms = np.bincount(crop_cells[jersey], minlength=num_crops * bins ** 3).reshape(num_crops, -1).astype(np.float64)
+        histograms /= np.maximum(histograms.sum(axis=1, keepdims=True), 1)
 
-        return player_color
+        return centers[np.arange(num_crops), player_cluster], np.sqrt(histograms)
 
 
     def assign_team_color(self,frame, player_detections):
-        
-        player_colors = []
-        for _, player_detection in player_detections.items():
-            bbox = player_detection["bbox"]
-            player_color =  self.get_player_color(frame,bbox)
-            player_colors.append(player_color)
-        
+
+        bboxes = [player_detection["bbox"] for player_detection in player_detections.values()]
+        player_colors, player_embeddings = self.get_player_features(frame,bboxes)
+
+        self.fit_teams(player_embeddings, player_colors)
+
+    def fit_teams(self,player_embeddings,player_colors):
         kmeans = KMeans(n_clusters=2, init="k-means++",n_init=10)
-        kmeans.fit(player_colors)
+        kmeans.fit(player_embeddings)
 
-        self.kmeans = kmeans
+        self.centers = kmeans.cluster_centers_.copy()
+        # Drawing colors are the mean jersey color of each cluster; they stay fixed while the centers follow the match
+        player_colors = np.asarray(player_colors, dtype=np.float64).reshape(-1, 3)
+        for team in (1, 2):
+            self.team_colors[team] = player_colors[kmeans.labels_ == team - 1].mean(axis=0)
 
-        self.team_colors[1] = kmeans.cluster_centers_[0]
-        self.team_colors[2] = kmeans.cluster_centers_[1]
+    def predict(self,player_embeddings):
+        # Team of each embedding, and how clearly it is closer to that team's center, from 0 to 1
+        player_embeddings = np.asarray(player_embeddings, dtype=np.float64).reshape(len(player_embeddings), self.histogram_bins ** 3)
+        distances = np.linalg.norm(player_embeddings[:, None, :] - self.centers[None, :, :], axis=2)
+        teams = distances.argmin(axis=1) + 1
+        margins = np.abs(distances[:, 0] - distances[:, 1]) / np.maximum(distances.sum(axis=1), 1e-9)
+        return teams, margins
 
 
+    def is_due(self,samples,last_frame,frame_num):
+        # Whether an ID with this many samples, the last one taken at last_frame, gets a new sample at frame_num
+        interval = self.sample_interval if samples < self.votes_needed else self.recheck_interval
+        return frame_num - last_frame >= interval
+
     def get_player_team(self,frame,player_bbox,player_id):
-        if player_id in self.player_team_dict:
-            return self.player_team_dict[player_id]
+        return self.get_player_teams(frame,{player_id: {"bbox": player_bbox}})[player_id]
+
+    def get_player_teams(self,frame,player_detections):
+        # Assign teams for all players of one frame; call once per frame, in order.
+        # Colors are extracted in a single pass, and only for the IDs due for a new vote.
+        frame_num = self.frame_count
+        self.frame_count += 1
+
+        due_player_ids = self.due_player_ids(player_detections, frame_num)
+        if due_player_ids:
+            bboxes = [player_detections[player_id]["bbox"] for player_id in due_player_ids]
+            _, player_embeddings = self.get_player_features(frame,bboxes)
+            self.vote(due_player_ids, player_embeddings, frame_num, evict=False)
+
+        # Evict only once the frame's teams are read, so a frame with more than max_tracks players keeps them all
+        player_teams = {player_id: self.player_team_dict[player_id] for player_id in player_detections}
+        self.evict_tracks()
+        return player_teams
+
+    def get_chunk_teams(self,frames,player_tracks,player_crops=None):
+        # Same teams as get_player_teams over consecutive frames, with the color clustering batched: the crops of the
+        # IDs due for a vote are cut into player_crops frame by frame, then clustered all at once.
+        # frames can be any iterable, e.g. frames being decoded; none are kept. Returns one {player_id: team} per frame.
+        player_crops = PlayerCrops() if player_crops is None else player_crops
+        player_crops.clear()
+
+        # The schedule only depends on which IDs are seen when, so it can be worked out before any vote
+        schedule = OrderedDict((player_id, list(entry)) for player_id, entry in self.votes.items())
+        for frame_num, (frame, player_track) in enumerate(zip(frames, player_tracks), start=self.frame_count):
+            due_player_ids = self.due_player_ids(player_track, frame_num, schedule)
+            self.record_samples(due_player_ids, frame_num, schedule)
+            self.evict_tracks(schedule)
+            player_crops.add(frame, frame_num, due_player_ids, [player_track[player_id]["bbox"] for player_id in due_player_ids])
+
+        _, player_embeddings = self.get_crop_features(*player_crops.tensor())
+
+        player_teams = []
+        offset = 0
+        for player_track in player_tracks:
+            frame_num = self.frame_count
+            self.frame_count += 1
+            due_player_ids = self.due_player_ids(player_track, frame_num)
+            if due_player_ids:
+                self.vote(due_player_ids, player_embeddings[offset:offset + len(due_player_ids)], frame_num, evict=False)
+                offset += len(due_player_ids)
+            player_teams.append({player_id: self.player_team_dict[player_id] for player_id in player_track})
+            self.evict_tracks()
+
+        return player_teams
+
+    def due_player_ids(self,player_ids,frame_num,votes=None):
+        # IDs of one frame due for a new sample; every ID seen is marked as recently used
+        votes = self.votes if votes is None else votes
+        due_player_ids = []
+        for player_id in player_ids:
+            entry = votes.get(player_id)
+            if entry is None:
+                due_player_ids.append(player_id)
+                continue
+            votes.move_to_end(player_id)
+            if self.is_due(entry[2], entry[3], frame_num):
+                due_player_ids.append(player_id)
+        return due_player_ids
+
+    def record_samples(self,player_ids,frame_num,votes=None):
+        # Count a sample for every ID, creating entries for new IDs; returns the entries
+        votes = self.votes if votes is None else votes
+        entries = []
+        for player_id in player_ids:
+            entry = votes.get(player_id)
+            if entry is None:
+                entry = votes[player_id] = [0, 0, 0, frame_num]
+            entry[2] += 1
+            entry[3] = frame_num
+            entries.append(entry)
+        return entries
+
+    def evict_tracks(self,votes=None):
+        # Forget the least recently seen IDs; the teams of this assigner's own IDs go with their votes
+        evict_teams = votes is None
+        votes = self.votes if votes is None else votes
+        while len(votes) > self.max_tracks:
+            player_id, _ = votes.popitem(last=False)
+            if evict_teams:
+                self.player_team_dict.pop(player_id, None)
+
+    def vote(self,player_ids,player_embeddings,frame_num=None,evict=True):
+        frame_num = self.frame_count if frame_num is None else frame_num
+        teams, margins = self.predict(player_embeddings)
+        entries = self.record_samples(player_ids, frame_num)
+
+        for player_id, entry, team, margin, embedding in zip(player_ids, entries, teams, margins, player_embeddings):
+            entry[team - 1] += 1
+
+            # Majority of the votes; a tie keeps the current team
+            if entry[0] != entry[1] or player_id not in self.player_team_dict:
+                self.player_team_dict[player_id] = 1 if entry[0] >= entry[1] else 2
 
-        player_color = self.get_player_color(frame,player_bbox)
+            # Only clear samples move the centers, so occlusions and mixed crops do not drag them between teams
+            if margin >= self.min_margin:
+                self.centers[team - 1] += self.learning_rate * (embedding - self.centers[team - 1])
 
-        team_id = self.kmeans.predict(player_color.reshape(1,-1))[0]
-        team_id+=1
+        player_teams = {player_id: self.player_team_dict[player_id] for player_id in player_ids}
+        if evict:
+            self.evict_tracks()
+        return player_teams
 
-        if player_id ==91:
-            team_id=1
+    def assign_teams_from_embeddings(self,player_ids,player_embeddings):
+        # Classify already extracted embeddings, e.g. computed in worker processes; several embeddings of the same
+        # ID are votes for that ID. Returns the team of every ID, also of those evicted afterwards.
+        return self.vote(player_ids, np.asarray(player_embeddings, dtype=np.float64).reshape(len(player_ids), self.histogram_bins ** 3))
 
-        self.player_team_dict[player_id] = team_id
+    def save(self,path):
+        # Team centers, drawing colors and settings. Track IDs are not saved: they are only meaningful within one run.
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                "settings": self.settings(),
+                "centers": self.centers.tolist(),
+                "team_colors": {str(team): color.tolist() for team, color in self.team_colors.items()},
+            }, f)
 
-        return team_id
\ No newline at end of file
+    @classmethod
+    def load(cls,path):
+        with open(path) as f:
+            model = json.load(f)
+        team_assigner = cls(**model["settings"])
+        team_assigner.centers = np.array(model["centers"], dtype=np.float64)
+        team_assigner.team_colors = {int(team): np.array(color, dtype=np.float64) for team, color in model["team_colors"].items()}
+        return team_assigner
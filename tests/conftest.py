@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Make the repository root and utilities importable, as the scripts in benchmarks/ and service/ do
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, 'utilities'))
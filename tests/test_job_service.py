@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import time
+import cv2
+import numpy as np
+import pytest
+from service.job_service import JobService, parse_settings
+from service.http_api import JobServer
+
+def write_video(path, number_of_frames=5):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 25, (64, 48))
+    for frame_num in range(number_of_frames):
+        writer.write(np.full((48, 64, 3), frame_num * 20, dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+def stub_run_job(job_id, video_path, job_dir, model_path, cache_dir, settings, total_frames, progress_queue, torch_threads):
+    # Stands in for the pipeline in the worker process; the video's name says how the job should go
+    name = os.path.basename(video_path)
+    if name.startswith('broken'):
+        raise RuntimeError("cannot analyze")
+    progress_queue.put({"job_id": job_id, "type": "progress", "phases": {"tracking": total_frames}, "total_frames": total_frames, "stages": {}})
+    if name.startswith('slow'):
+        time.sleep(1.5)
+    statistics = os.path.join(job_dir, 'statistics.json')
+    with open(statistics, 'w') as f:
+        json.dump({"frames": total_frames, "settings": settings}, f)
+    return {"artifacts": {"statistics": statistics}, "stages": {"stub": {"calls": 1}}}
+
+async def request(server, method, target, body=b'', headers=None):
+    # One HTTP request; returns the status and the raw response body
+    reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+    headers = dict({"Content-Length": str(len(body))}, **(headers or {}))
+    head = f"{method} {target} HTTP/1.1\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers.items() if value is not None)
+    writer.write(head.encode() + b"\r\n" + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), body
+
+async def request_json(server, method, target, body=None):
+    data = json.dumps(body).encode() if body is not None else b''
+    status, response = await request(server, method, target, data, {"Content-Type": "application/json"})
+    return status, json.loads(response)
+
+async def wait_for_status(server, job_id, statuses):
+    # Follow the job's server-sent events until it reaches one of statuses; returns every status seen
+    reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+    writer.write(f"GET /jobs/{job_id}/events HTTP/1.1\r\n\r\n".encode())
+    await writer.drain()
+    seen = []
+    while not seen or seen[-1] not in statuses:
+        line = await reader.readline()
+        if not line:
+            break
+        if line.startswith(b'data: '):
+            seen.append(json.loads(line[len(b'data: '):])["status"])
+    writer.close()
+    return seen
+
+def serve(tmp_path, test, **kwargs):
+    async def main():
+        service = JobService('unused.pt', workers=1, jobs_dir=str(tmp_path / 'jobs'), cache_dir=None, run_job=stub_run_job, **kwargs)
+        server = JobServer(service, port=0, max_upload_bytes=10**6, max_json_bytes=1000)
+        await server.start()
+        try:
+            await asyncio.wait_for(test(server), 60)
+        finally:
+            await server.stop()
+    asyncio.run(main())
+
+def test_parse_settings():
+    settings = parse_settings({"chunk_size": "60", "render": "no", "camera_scale": "0.5"})
+    assert settings["chunk_size"] == 60 and settings["render"] is False and settings["camera_scale"] == 0.5
+    assert settings["detection_stride"] == 1 and settings["motion_threshold"] is None
+
+    for bad in ({"chunk_size": "many"}, {"render": "maybe"}, {"camera_estimator": "mean"}, {"chunk_size": 0}, {"camera_scale": -1}, {"colour": "red"}):
+        with pytest.raises(ValueError):
+            parse_settings(bad)
+
+def test_jobs_run_and_stream_their_events(tmp_path):
+    video_path = write_video(tmp_path / 'match.avi')
+
+    async def test(server):
+        status, job = await request_json(server, 'POST', '/jobs', {"video_path": video_path, "settings": {"render": False}})
+        assert status == 201 and job["status"] == 'queued' and job["total_frames"] == 5
+
+        seen = await wait_for_status(server, job["job_id"], ('finished', 'failed'))
+        assert seen[0] in ('queued', 'running') and seen[-1] == 'finished'
+
+        status, job = await request_json(server, 'GET', f'/jobs/{job["job_id"]}')
+        assert status == 200 and job["artifacts"] == ['statistics'] and job["progress"] == {"tracking": 1.0}
+        status, body = await request(server, 'GET', f'/jobs/{job["job_id"]}/artifacts/statistics')
+        assert status == 200 and json.loads(body)["settings"]["render"] is False
+        status, _ = await request(server, 'GET', f'/jobs/{job["job_id"]}/artifacts/video')
+        assert status == 404
+
+        # A finished job can no longer be cancelled
+        status, _ = await request_json(server, 'DELETE', f'/jobs/{job["job_id"]}')
+        assert status == 409
+
+        status, job = await request_json(server, 'POST', '/jobs', {"video_path": write_video(tmp_path / 'broken.avi')})
+        assert (await wait_for_status(server, job["job_id"], ('finished', 'failed')))[-1] == 'failed'
+        status, job = await request_json(server, 'GET', f'/jobs/{job["job_id"]}')
+        assert job["error"] == "RuntimeError: cannot analyze"
+
+    serve(tmp_path, test)
+
+def test_only_queued_jobs_can_be_cancelled(tmp_path):
+    slow_path = write_video(tmp_path / 'slow.avi')
+
+    async def test(server):
+        _, running = await request_json(server, 'POST', '/jobs', {"video_path": slow_path})
+        _, queued = await request_json(server, 'POST', '/jobs', {"video_path": slow_path})
+        assert (await wait_for_status(server, running["job_id"], ('running',)))[-1] == 'running'
+
+        status, job = await request_json(server, 'DELETE', f'/jobs/{queued["job_id"]}')
+        assert status == 200 and job["status"] == 'cancelled'
+        status, body = await request_json(server, 'DELETE', f'/jobs/{running["job_id"]}')
+        assert status == 409 and 'running' in body["error"]
+
+        assert (await wait_for_status(server, running["job_id"], ('finished',)))[-1] == 'finished'
+        # The worker skips the cancelled job instead of running it
+        _, job = await request_json(server, 'GET', f'/jobs/{queued["job_id"]}')
+        assert job["status"] == 'cancelled' and job["started"] is None
+
+    serve(tmp_path, test)
+
+def test_bad_requests_are_rejected(tmp_path):
+    video_path = write_video(tmp_path / 'match.avi')
+
+    async def test(server):
+        for body in ([video_path], "match.avi", {"settings": {}}, {"video_path": video_path, "settings": ["render"]}, {"video_path": 5}):
+            status, response = await request_json(server, 'POST', '/jobs', body)
+            assert status == 400, (body, response)
+
+        status, response = await request_json(server, 'POST', '/jobs', {"video_path": video_path, "settings": {"chunk_size": 0}})
+        assert status == 400 and 'chunk_size' in response["error"]
+        status, _ = await request_json(server, 'POST', '/jobs', {"video_path": str(tmp_path / 'missing.avi')})
+        assert status == 400
+        status, _ = await request(server, 'POST', '/jobs', b'{not json', {"Content-Type": "application/json"})
+        assert status == 400
+
+        # The JSON body is bounded before it is read
+        status, response = await request_json(server, 'POST', '/jobs', {"video_path": video_path, "padding": "x" * 2000})
+        assert status == 400 and 'larger than' in response["error"]
+
+        status, _ = await request(server, 'POST', '/jobs', headers={"Content-Length": None})
+        assert status == 411
+        status, _ = await request(server, 'GET', '/jobs/unknown')
+        assert status == 404
+        status, _ = await request(server, 'PUT', '/jobs')
+        assert status == 405
+        status, jobs = await request_json(server, 'GET', '/jobs')
+        assert status == 200 and jobs == []
+
+    serve(tmp_path, test)
+
+def test_uploads_leave_nothing_behind_when_they_fail(tmp_path):
+    with open(write_video(tmp_path / 'match.avi'), 'rb') as f:
+        video = f.read()
+    jobs_dir = tmp_path / 'jobs'
+
+    async def test(server):
+        # Bad settings and oversized uploads are refused before a job directory is made
+        status, _ = await request(server, 'POST', '/jobs?chunk_size=zero', video)
+        assert status == 400
+        status, _ = await request(server, 'POST', '/jobs', headers={"Content-Length": str(10**6 + 1)})
+        assert status == 400
+        assert os.listdir(jobs_dir) == []
+
+        # A connection closed in the middle of the upload, and an upload that is not a video
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        writer.write(f"POST /jobs?filename=match.avi HTTP/1.1\r\nContent-Length: {len(video)}\r\n\r\n".encode() + video[:100])
+        await writer.drain()
+        writer.close()
+        status, _ = await request(server, 'POST', '/jobs?filename=match.avi', b'not a video')
+        assert status == 400
+        await asyncio.sleep(0.1)
+        assert os.listdir(jobs_dir) == []
+
+        status, body = await request(server, 'POST', '/jobs?filename=match.avi&render=0', video)
+        job = json.loads(body)
+        assert status == 201
+        assert os.listdir(jobs_dir) == [job["job_id"]]
+        assert os.path.getsize(job["video_path"]) == len(video)
+        assert (await wait_for_status(server, job["job_id"], ('finished', 'failed')))[-1] == 'finished'
+
+    serve(tmp_path, test)
+
+def test_only_the_latest_finished_jobs_are_kept(tmp_path):
+    video_path = write_video(tmp_path / 'match.avi')
+
+    async def test(server):
+        job_ids = []
+        for _ in range(3):
+            _, job = await request_json(server, 'POST', '/jobs', {"video_path": video_path})
+            await wait_for_status(server, job["job_id"], ('finished',))
+            job_ids.append(job["job_id"])
+
+        _, jobs = await request_json(server, 'GET', '/jobs')
+        assert [job["job_id"] for job in jobs] == job_ids[1:]
+        status, _ = await request_json(server, 'GET', f'/jobs/{job_ids[0]}')
+        assert status == 404
+        # The forgotten job's files stay on disk
+        assert os.path.isdir(tmp_path / 'jobs' / job_ids[0])
+
+    serve(tmp_path, test, max_finished_jobs=2)
@@ -0,0 +1,129 @@
+import copy
+import time
+import cv2
+import numpy as np
+import pytest
+from utilities.video_utils import LiveVideoSource
+from pipeline.live_pipeline import LivePipeline
+from ball_possession.player_ball_assigner import PlayerBallAssigner
+from ball_possession.possession_stats import PossessionStats
+
+FPS = 25
+NUMBER_OF_FRAMES = 50
+FRAME_SIZE = (640, 360)
+JERSEYS = {1: (30, 30, 200), 2: (235, 235, 235)}
+# Player track ID -> (x1, y1) of its box; odd IDs wear jersey 1, even IDs jersey 2
+PLAYERS = {1: (60, 60), 2: (300, 60), 3: (60, 220), 4: (300, 220)}
+BOX_SIZE = (24, 60)
+
+def ball_owner(frame_index):
+    # Player 1 has the ball, then player 2, then the ball is out of sight and control carries over
+    if frame_index < 20:
+        return 1
+    if frame_index < 40:
+        return 2
+    return None
+
+def scripted_tracks(frame_index):
+    players = {}
+    for track_id, (x1, y1) in PLAYERS.items():
+        players[track_id] = {"bbox": [x1, y1, x1 + BOX_SIZE[0], y1 + BOX_SIZE[1]]}
+    ball = {}
+    owner = ball_owner(frame_index)
+    if owner is not None:
+        x1, y2 = players[owner]["bbox"][0], players[owner]["bbox"][3]
+        ball[1] = {"bbox": [x1 - 4, y2, x1 + 4, y2 + 8]}
+    return {"players": [players], "referees": [{}], "ball": [ball]}
+
+def write_match(path):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), FPS, FRAME_SIZE)
+    for frame_index in range(NUMBER_OF_FRAMES):
+        frame = np.full((FRAME_SIZE[1], FRAME_SIZE[0], 3), (40, 140, 40), dtype=np.uint8)
+        for track_id, player in scripted_tracks(frame_index)["players"][0].items():
+            x1, y1, x2, y2 = player["bbox"]
+            margin = BOX_SIZE[0] // 4
+            frame[y1 + 4:(y1 + y2) // 2, x1 + margin:x2 - margin] = JERSEYS[2 - track_id % 2]
+            frame[(y1 + y2) // 2:y2, x1 + margin:x2 - margin] = (20, 20, 20)
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+def scripted_pipeline(detection_delay=0.0, **kwargs):
+    # The untrained detector finds nothing, so detections come from the script; the rest of the pipeline runs as is
+    pipeline = LivePipeline('yolov8n.yaml', **kwargs)
+
+    def detect_frame(frame, frame_index):
+        time.sleep(detection_delay)
+        frame_tracks = scripted_tracks(frame_index)
+        pipeline.keyframe_tracks.append((frame_index, {object: object_tracks[0] for object, object_tracks in frame_tracks.items()}))
+        return frame_tracks
+
+    pipeline.detect_frame = detect_frame
+    return pipeline
+
+@pytest.fixture(scope='module')
+def match_video(tmp_path_factory):
+    return write_match(tmp_path_factory.mktemp('live') / 'match.avi')
+
+def test_replayed_stream_matches_offline_possession(match_video):
+    pipeline = scripted_pipeline(latency_budget=1.0)
+    # Tracks of every frame as the pipeline assigned the ball on them, detected or extrapolated
+    seen_tracks = []
+    assign_ball = pipeline.assign_ball
+
+    def record_and_assign_ball(frame_tracks):
+        seen_tracks.append(copy.deepcopy(frame_tracks))
+        return assign_ball(frame_tracks)
+
+    pipeline.assign_ball = record_and_assign_ball
+    source = LiveVideoSource(match_video, queue_size=NUMBER_OF_FRAMES, start=False)
+    assert source.realtime and source.fps == FPS
+
+    records = []
+    start = time.perf_counter()
+    report = pipeline.run(source, on_frame=lambda frame, record: records.append(record))
+    elapsed = time.perf_counter() - start
+
+    # Replayed at its native FPS, so it cannot finish faster than the video lasts
+    assert elapsed >= (NUMBER_OF_FRAMES - 1) / FPS
+    assert report["frames"] == NUMBER_OF_FRAMES
+    assert report["dropped_frames"] == 0
+
+    # One latency record per processed frame, in order, measured after the frame was handed on
+    assert [frame_index for frame_index, _, _, _ in pipeline.frame_latencies] == list(range(NUMBER_OF_FRAMES))
+    for record, (_, _, latency, detected) in zip(records, pipeline.frame_latencies):
+        assert 0 < record["processing_latency"] <= latency
+        assert record["detected"] == detected
+    assert report["latency_ms"]["max"] >= report["latency_ms"]["p50"] > 0
+
+    # The offline path on the tracks the pipeline saw gives the same possession
+    teams = pipeline.team_assigner.player_team_dict
+    assert teams[1] == teams[3] != teams[2] == teams[4]
+    tracks = {"players": [], "referees": [], "ball": []}
+    for frame_tracks in seen_tracks:
+        for object, object_tracks in frame_tracks.items():
+            tracks[object] += object_tracks
+    team_ball_control = PlayerBallAssigner().assign_ball_possession(tracks)
+    offline = PossessionStats.from_team_ball_control(team_ball_control, frame_rate=FPS)
+    assert len(pipeline.possession_stats) == NUMBER_OF_FRAMES
+    assert pipeline.possession_stats.frame_counts() == offline.frame_counts()
+
+    # Only frames whose detection was skipped can differ from the script
+    undetected = NUMBER_OF_FRAMES - report["detected_frames"]
+    assert abs(pipeline.possession_stats.frame_counts()[teams[1] - 1] - 20) <= undetected
+
+def test_slow_detection_is_skipped_and_frames_dropped(match_video):
+    # Detection takes several frame intervals, far over the latency budget
+    pipeline = scripted_pipeline(detection_delay=0.1, latency_budget=0.05, max_detection_gap=5)
+    report = pipeline.run(LiveVideoSource(match_video, start=False))
+
+    # Every source frame is either processed or dropped
+    assert report["dropped_frames"] > 0
+    assert report["frames"] + report["dropped_frames"] == NUMBER_OF_FRAMES
+    assert len(pipeline.frame_latencies) == report["frames"]
+
+    # Detection still runs at least every max_detection_gap frames, and is skipped in between
+    assert 0 < report["detected_frames"] < report["frames"]
+    detected_indices = [frame_index for frame_index, _, _, detected in pipeline.frame_latencies if detected]
+    assert np.diff(detected_indices).max(initial=0) <= 2 * pipeline.max_detection_gap
+    assert report["over_budget_frames"] > 0
@@ -0,0 +1,89 @@
+import numpy as np
+from spatial_analysis.pitch_grid import PitchGrid
+
+def make_points(number_of_frames=20, per_frame=15, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = np.repeat(np.arange(number_of_frames), per_frame)
+    positions = rng.uniform((0, 0), (105, 68), size=(len(frames), 2))
+    # Missing positions are never returned
+    positions[rng.random(len(frames)) < 0.1] = np.nan
+    return frames, positions
+
+def brute_force_distances(frames, positions, query_frames, query_positions, exclude):
+    # (Q, N) distance from every query to every point, inf for points of other frames, missing or excluded
+    distances = np.hypot(*(positions[None, :, :] - query_positions[:, None, :]).transpose(2, 0, 1))
+    distances[frames[None, :] != query_frames[:, None]] = np.inf
+    distances[np.isnan(distances)] = np.inf
+    excluded = exclude >= 0
+    distances[np.flatnonzero(excluded), exclude[excluded]] = np.inf
+    return distances
+
+def test_knn_query_matches_brute_force():
+    frames, positions = make_points()
+    grid = PitchGrid(frames, positions, cell_size=5.0)
+    queries = np.flatnonzero(~np.isnan(positions).any(axis=1))
+    k = 4
+
+    indices, distances = grid.knn_query(frames[queries], positions[queries], k=k, exclude=queries)
+    expected = brute_force_distances(frames, positions, frames[queries], positions[queries], queries)
+    expected_distances = np.sort(expected, axis=1)[:, :k]
+
+    np.testing.assert_allclose(distances, expected_distances)
+    found = indices >= 0
+    np.testing.assert_array_equal(found, np.isfinite(expected_distances))
+    np.testing.assert_allclose(expected[np.nonzero(found)[0], indices[found]], distances[found])
+
+def test_knn_query_with_fewer_points_than_k():
+    grid = PitchGrid([0, 0, 1], [[0, 0], [3, 4], [50, 50]])
+    indices, distances = grid.knn_query([0, 1], [[0, 0], [50, 50]], k=3)
+    np.testing.assert_array_equal(indices, [[0, 1, -1], [2, -1, -1]])
+    np.testing.assert_allclose(distances, [[0, 5, np.inf], [0, np.inf, np.inf]])
+
+def test_radius_query_matches_brute_force():
+    frames, positions = make_points(seed=1)
+    grid = PitchGrid(frames, positions, cell_size=5.0)
+    query_frames = np.arange(20)
+    query_positions = np.random.default_rng(2).uniform((0, 0), (105, 68), size=(20, 2))
+    radius = 12.0
+
+    offsets, indices, distances = grid.radius_query(query_frames, query_positions, radius)
+    expected = brute_force_distances(frames, positions, query_frames, query_positions, np.full(20, -1))
+    for query in range(len(query_frames)):
+        within = np.flatnonzero(expected[query] <= radius)
+        found = indices[offsets[query]:offsets[query + 1]]
+        assert set(found.tolist()) == set(within.tolist())
+        # Nearest first
+        assert (np.diff(distances[offsets[query]:offsets[query + 1]]) >= 0).all()
+
+    counts = grid.count_within(query_frames, query_positions, radius)
+    np.testing.assert_array_equal(counts, (expected <= radius).sum(axis=1))
+
+def test_knn_query_outside_the_point_extent():
+    # Queries far off the grid, e.g. one team's players against the other team's smaller extent
+    frames, positions = make_points(seed=3)
+    positions = positions * 0.2
+    grid = PitchGrid(frames, positions, cell_size=2.0)
+    rng = np.random.default_rng(4)
+    query_frames = rng.integers(0, 20, size=30)
+    query_positions = rng.uniform((-200, -150), (300, 250), size=(30, 2))
+
+    indices, distances = grid.knn_query(query_frames, query_positions, k=2)
+    expected = brute_force_distances(frames, positions, query_frames, query_positions, np.full(30, -1))
+    np.testing.assert_allclose(distances, np.sort(expected, axis=1)[:, :2])
+    assert (indices >= 0).all()
+
+    np.testing.assert_array_equal(
+        PitchGrid([0, 0, 0], [[0, 0], [1, 1], [2, 2]], 5).knn_query([0], [[20, 20]], k=1)[0], [[2]]
+    )
+
+def test_knn_query_max_radius():
+    frames, positions = make_points(seed=5)
+    grid = PitchGrid(frames, positions, cell_size=5.0)
+    query_frames = np.arange(20)
+    query_positions = np.random.default_rng(6).uniform((-20, -20), (125, 88), size=(20, 2))
+
+    indices, distances = grid.knn_query(query_frames, query_positions, k=1, max_radius=4.0)
+    nearest = np.sort(brute_force_distances(frames, positions, query_frames, query_positions, np.full(20, -1)), axis=1)[:, 0]
+    expected = np.where(nearest <= 4.0, nearest, np.inf)
+    np.testing.assert_allclose(distances[:, 0], expected)
+    np.testing.assert_array_equal(indices[:, 0] >= 0, np.isfinite(expected))
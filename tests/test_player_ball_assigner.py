@@ -0,0 +1,81 @@
+import copy
+import numpy as np
+from ball_possession.player_ball_assigner import PlayerBallAssigner
+from tracking_framework.track_table import TrackTable
+
+def make_tracks(number_of_frames=300, seed=0):
+    # Random players around a ball on integer coordinates, so distances often tie and land exactly on the cutoff.
+    # Some frames have no ball, some no players, and some a copy of another player's box under a new ID.
+    rng = np.random.default_rng(seed)
+    tracks = {"players": [], "referees": [], "ball": []}
+    for frame_num in range(number_of_frames):
+        ball_x, ball_y = rng.integers(100, 200, size=2)
+        player_track = {}
+        for track_id in rng.choice(np.arange(1, 30), size=rng.integers(0, 8), replace=False).tolist():
+            if player_track and rng.random() < 0.2:
+                bbox = list(player_track[rng.choice(list(player_track))]["bbox"])
+            elif rng.random() < 0.2:
+                # Nearest foot exactly at the cutoff, left or right of the ball
+                width = int(rng.integers(10, 40))
+                x1 = int(ball_x) + 70 if rng.random() < 0.5 else int(ball_x) - 70 - width
+                bbox = [x1, int(ball_y) - 60, x1 + width, int(ball_y)]
+            else:
+                # Feet within a little more than the cutoff of the ball
+                x1 = int(ball_x + rng.integers(-90, 90))
+                y2 = int(ball_y + rng.integers(-40, 40))
+                bbox = [x1, y2 - 60, x1 + int(rng.integers(10, 40)), y2]
+            player_track[track_id] = {"bbox": bbox, "team": int(rng.integers(1, 3))}
+        ball_track = {}
+        if rng.random() < 0.8:
+            ball_track[1] = {"bbox": [int(ball_x) - 5, int(ball_y) - 5, int(ball_x) + 6, int(ball_y) + 6]}
+        tracks["players"].append(player_track)
+        tracks["referees"].append({})
+        tracks["ball"].append(ball_track)
+    return tracks
+
+def loop_possession(tracks, initial_team=0):
+    # The original per-frame loop: the closest player within the cutoff gets the ball, otherwise the team in
+    # control carries over
+    player_assigner = PlayerBallAssigner()
+    assigned_players, team_ball_control = [], []
+    team = initial_team
+    for player_track, ball_track in zip(tracks["players"], tracks["ball"]):
+        assigned_player = -1
+        if 1 in ball_track:
+            assigned_player = player_assigner.assign_ball_to_player(player_track, ball_track[1]["bbox"])
+        if assigned_player != -1:
+            team = player_track[assigned_player]["team"]
+        assigned_players.append(assigned_player)
+        team_ball_control.append(team)
+    return assigned_players, team_ball_control
+
+def test_vectorized_assignment_matches_the_loop():
+    for seed in range(5):
+        tracks = make_tracks(seed=seed)
+        assigned_players, expected = loop_possession(tracks, initial_team=2)
+        # The generated tracks cover ties, the exact cutoff, missing balls and nobody close enough
+        assert -1 in assigned_players and max(assigned_players) > 0
+
+        dict_tracks = copy.deepcopy(tracks)
+        np.testing.assert_array_equal(PlayerBallAssigner().assign_ball_possession(dict_tracks, initial_team=2), expected)
+        for frame_num, player_track in enumerate(dict_tracks["players"]):
+            assert [track_id for track_id, player in player_track.items() if player.get("has_ball")] == ([assigned_players[frame_num]] if assigned_players[frame_num] != -1 else [])
+
+        table = TrackTable.from_tracks(tracks)
+        np.testing.assert_array_equal(PlayerBallAssigner().assign_ball_possession(table, initial_team=2), expected)
+        has_ball = table.object_mask("players") & (table["has_ball"] == True)
+        assert sorted(zip(table.frame[has_ball].tolist(), table.track_id[has_ball].tolist())) == [
+            (frame_num, player_id) for frame_num, player_id in enumerate(assigned_players) if player_id != -1
+        ]
+
+def test_ties_and_cutoff():
+    player_assigner = PlayerBallAssigner()
+    ball = {1: {"bbox": [95, 95, 105, 105]}}
+    # Players 4 and 7 have the same box and tie; the first one keeps the ball. Player 9's foot is exactly at the cutoff.
+    tied = {9: {"bbox": [10, 40, 30, 100], "team": 2}, 4: {"bbox": [120, 40, 140, 100], "team": 1}, 7: {"bbox": [120, 40, 140, 100], "team": 2}}
+    out_of_reach = {9: tied[9]}
+    tracks = {"players": [tied, out_of_reach, {}], "referees": [{}, {}, {}], "ball": [ball, ball, {}]}
+
+    assert loop_possession(tracks) == ([4, -1, -1], [1, 1, 1])
+    np.testing.assert_array_equal(player_assigner.assign_ball_possession(copy.deepcopy(tracks)), [1, 1, 1])
+    np.testing.assert_array_equal(player_assigner.assign_ball_possession(TrackTable.from_tracks(tracks)), [1, 1, 1])
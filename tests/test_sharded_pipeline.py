@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+import numpy as np
+from pipeline.sharded_pipeline import plan_segments, stitch_segments, ShardedPipeline
+from team_identifier.team_assigner import TeamAssigner
+from tracking_framework.track_table import TrackTable
+
+BOXES = {"a": [0, 0, 10, 20], "b": [100, 0, 110, 20], "c": [200, 0, 210, 20], "d": [300, 0, 310, 20]}
+EMBEDDINGS = {1: np.r_[np.ones(32), np.zeros(32)] / 32, 2: np.r_[np.zeros(32), np.ones(32)] / 32}
+COLORS = {1: np.array([200.0, 30, 30]), 2: np.array([230.0, 230, 230])}
+
+def make_result(start_frame, number_of_frames, players, samples):
+    # players: {local track ID: (box name, first local frame)}; samples: [(local track ID, local frame, team)]
+    tracks = {name: [{} for _ in range(number_of_frames)] for name in ('players', 'referees', 'ball')}
+    for track_id, (box, first_frame) in players.items():
+        for frame_num in range(first_frame, number_of_frames):
+            tracks['players'][frame_num][track_id] = {"bbox": BOXES[box]}
+    return {
+        "start_frame": start_frame,
+        "tracks": TrackTable.from_tracks(tracks).to_arrays(),
+        "camera_movement": np.zeros((number_of_frames, 2)),
+        "color_track_ids": np.array([track_id for track_id, _, _ in samples], dtype=np.int64),
+        "colors": np.array([COLORS[team] for _, _, team in samples]).reshape(-1, 3),
+        "embedding_track_ids": np.array([track_id for track_id, _, _ in samples], dtype=np.int64),
+        "embedding_frames": np.array([frame_num for _, frame_num, _ in samples], dtype=np.int64),
+        "embeddings": np.array([EMBEDDINGS[team] for _, _, team in samples]).reshape(-1, 64),
+    }
+
+def make_results():
+    # Frames 0-9 and 8-19, overlapping in frames 8 and 9. Player "a" crosses the boundary and is matched, and player
+    # "c" appears in frame 9 and is only sampled there, by the second segment. Player "d" is in frame 0, unsampled.
+    first = make_result(0, 10, {1: ("a", 0), 2: ("b", 0), 4: ("d", 0)}, [(1, 0, 1), (2, 0, 2), (1, 5, 1)])
+    second = make_result(8, 12, {3: ("a", 0), 5: ("c", 1)}, [(3, 0, 2), (5, 1, 2), (3, 5, 1)])
+    return [second, first]
+
+def test_plan_segments_reads_the_last_segment_to_the_end():
+    assert plan_segments(100, 40, 8) == [(0, 40), (32, 80), (72, None)]
+    assert plan_segments(0, 40, 8) == [(0, None)]
+
+def test_stitch_counts_overlap_samples_once():
+    table, camera_movement, player_colors, player_embeddings = stitch_segments(make_results())
+    assert table.number_of_frames == 20
+    assert len(camera_movement) == 20
+
+    ids = {box: int(table.track_id[(table.bbox == BOXES[box]).all(axis=1)][0]) for box in BOXES}
+    # "a" keeps one ID across the boundary; its overlap sample from the second segment is not counted again
+    assert set(table.track_id[(table.bbox == BOXES["a"]).all(axis=1)].tolist()) == {ids["a"]}
+    samples = [player_id for player_id, _ in player_embeddings]
+    assert samples.count(ids["a"]) == 3
+    # "c" has rows after the boundary but was only sampled in the overlap, so that sample is kept
+    assert samples.count(ids["c"]) == 1
+    assert ids["d"] not in samples
+
+def test_every_player_row_gets_its_own_team():
+    table, _, player_colors, player_embeddings = stitch_segments(make_results())
+    team_assigner = TeamAssigner()
+    pipeline = SimpleNamespace(team_assigner=team_assigner, save_team_model=lambda: None)
+    ShardedPipeline.assign_teams_from_features(pipeline, table, player_colors, player_embeddings)
+
+    def teams_of(box):
+        return set(table['team'][(table.bbox == BOXES[box]).all(axis=1)].tolist())
+
+    team_a = teams_of("a")
+    assert len(team_a) == 1 and team_a != teams_of("b")
+    assert teams_of("c") == teams_of("b")
+    # No sample and no color: no team rather than a neighbouring ID's
+    assert teams_of("d") == {0}
+    assert np.isnan(table['team_color'][table['team'] == 0]).all()
@@ -0,0 +1,118 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+import pytest
+from utilities.shared_frames import SharedFrameRing, FrameRef
+
+FRAME_SHAPE = (48, 64, 3)
+
+def write_video(path, number_of_frames=12):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 25, (FRAME_SHAPE[1], FRAME_SHAPE[0]))
+    for frame_num in range(number_of_frames):
+        writer.write(np.full(FRAME_SHAPE, frame_num * 20, dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+def test_slot_is_reused_after_every_reference_is_released():
+    with SharedFrameRing(2, FRAME_SHAPE) as ring:
+        ref = ring.put(np.full(FRAME_SHAPE, 7, dtype=np.uint8), frame_index=0)
+        ring.retain(ref, 2)
+        assert ring.reference_counts[ref.slot] == 3
+
+        ring.release(ref)
+        ring.release(ref)
+        assert (ring.frame(ref) == 7).all()
+        ring.release(ref)
+        assert ring.in_use() == 0
+
+        # The last release frees the slot: the stale ref can no longer be read, retained or released
+        with pytest.raises(ValueError):
+            ring.frame(ref)
+        with pytest.raises(ValueError):
+            ring.retain(ref)
+        with pytest.raises(ValueError):
+            ring.release(ref)
+
+def test_allocate_waits_for_a_free_slot():
+    with SharedFrameRing(2, FRAME_SHAPE) as ring:
+        first = ring.allocate(0)
+        second = ring.allocate(1)
+        assert {first.slot, second.slot} == {0, 1}
+        assert ring.allocate(2, timeout=0.05) is None
+
+        ring.release(first)
+        third = ring.allocate(2, timeout=0.05)
+        assert third.slot == first.slot
+        # A ref to the slot's earlier frame does not match the new one
+        with pytest.raises(ValueError):
+            ring.frame(first)
+
+def test_read_frames_counts_one_reference_per_consumer(tmp_path):
+    video_path = write_video(tmp_path / 'video.avi')
+    expected = []
+    cap = cv2.VideoCapture(video_path)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        expected.append(frame)
+    cap.release()
+
+    with SharedFrameRing(3, FRAME_SHAPE) as ring:
+        refs = []
+        for ref in ring.read_frames(video_path, consumers=2, timeout=1):
+            np.testing.assert_array_equal(ring.frame(ref), expected[ref.frame_index])
+            assert ring.reference_counts[ref.slot] == 3
+            refs.append(ref)
+            # Hold the two previous frames, as slow consumers would
+            if len(refs) > 2:
+                ring.release(refs[-3], 2)
+        for ref in refs[-2:]:
+            ring.release(ref, 2)
+        assert [ref.frame_index for ref in refs] == list(range(len(expected)))
+        assert ring.in_use() == 0
+
+def test_read_frames_releases_its_reference_when_closed_early(tmp_path):
+    video_path = write_video(tmp_path / 'video.avi')
+    with SharedFrameRing(2, FRAME_SHAPE) as ring:
+        frames = ring.read_frames(video_path, consumers=1, start_frame=3, end_frame=6)
+        ref = next(frames)
+        assert ref.frame_index == 3
+        frames.close()
+        assert ring.reference_counts[ref.slot] == 1
+        ring.release(ref)
+        assert ring.in_use() == 0
+
+def test_read_frames_rejects_frames_of_another_shape(tmp_path):
+    video_path = write_video(tmp_path / 'video.avi')
+    with SharedFrameRing(2, (FRAME_SHAPE[0] * 2, FRAME_SHAPE[1] * 2, 3)) as ring:
+        with pytest.raises(ValueError):
+            next(ring.read_frames(video_path))
+        assert ring.in_use() == 0
+
+_worker_ring = None
+
+def attach_ring(spec):
+    global _worker_ring
+    _worker_ring = SharedFrameRing.attach(spec)
+
+def sum_and_release(ref):
+    total = int(_worker_ring.frame(ref).sum())
+    _worker_ring.release(ref)
+    return total
+
+def test_worker_processes_read_and_release_slots():
+    context = multiprocessing.get_context('spawn')
+    with SharedFrameRing(2, FRAME_SHAPE, context=context) as ring:
+        with ProcessPoolExecutor(max_workers=2, mp_context=context, initializer=attach_ring, initargs=(ring.spec(),)) as pool:
+            futures = []
+            for frame_index in range(6):
+                ref = ring.put(np.full(FRAME_SHAPE, frame_index, dtype=np.uint8), frame_index, timeout=30)
+                # Each worker holds its own reference; the producer's is dropped once the ref is sent
+                ring.retain(ref)
+                futures.append(pool.submit(sum_and_release, FrameRef(ref.slot, ref.frame_index)))
+                ring.release(ref)
+            totals = [future.result() for future in futures]
+        assert totals == [frame_index * int(np.prod(FRAME_SHAPE)) for frame_index in range(6)]
+        assert ring.in_use() == 0
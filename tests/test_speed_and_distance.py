@@ -0,0 +1,48 @@
+import copy
+import numpy as np
+from motion_metrics.speed_and_distance_estimator import SpeedAndDistance_Estimator
+from tracking_framework.track_table import TrackTable
+
+def make_tracks(number_of_frames=200, seed=0):
+    # Three players on random walks; one track is lost for a while and some rows have no pitch position
+    rng = np.random.default_rng(seed)
+    tracks = {name: [{} for _ in range(number_of_frames)] for name in ('players', 'referees', 'ball')}
+    for track_id in (1, 2, 3):
+        positions = np.cumsum(rng.normal(0, 0.3, size=(number_of_frames, 2)), axis=0)
+        for frame_num in range(number_of_frames):
+            if track_id == 2 and 80 <= frame_num < 90:
+                continue
+            player = {"bbox": [0, 0, 10, 20]}
+            if rng.random() > 0.1:
+                player["position_transformed"] = positions[frame_num].tolist()
+            tracks['players'][frame_num][track_id] = player
+    return tracks
+
+def test_distance_matches_online_updates():
+    # Without smoothing the offline and online paths see the same positions, so the distances must agree,
+    # including steps across rows without a position
+    tracks = make_tracks()
+    table = TrackTable.from_tracks(tracks)
+    SpeedAndDistance_Estimator(smoothing_window=1).add_speed_and_distance_to_table(table)
+
+    online = SpeedAndDistance_Estimator(smoothing_window=1)
+    live_tracks = copy.deepcopy(tracks)
+    for frame_num, player_track in enumerate(live_tracks['players']):
+        online.update_speed_and_distance(frame_num, player_track)
+
+    players = table.object_mask('players')
+    for row in np.flatnonzero(players & ~np.isnan(table['distance'])):
+        player = live_tracks['players'][table.frame[row]][table.track_id[row]]
+        np.testing.assert_allclose(table['distance'][row], player['distance'])
+
+def test_distance_is_path_length_over_valid_positions():
+    tracks = make_tracks()
+    table = TrackTable.from_tracks(tracks)
+    SpeedAndDistance_Estimator(smoothing_window=1).add_speed_and_distance_to_table(table)
+
+    for track_id in (1, 2, 3):
+        rows = np.flatnonzero(table.object_mask('players') & (table.track_id == track_id))
+        positions = table['position_transformed'][rows]
+        positions = positions[~np.isnan(positions).any(axis=1)]
+        expected = np.hypot(*np.diff(positions, axis=0).T).sum()
+        np.testing.assert_allclose(np.nanmax(table['distance'][rows]), expected)
@@ -0,0 +1,38 @@
+import copy
+import cv2
+from pipeline.streaming_pipeline import StreamingPipeline
+from test_team_assigner import make_match
+
+def test_team_colors_are_fitted_once_enough_players_are_seen(tmp_path):
+    # Frame 0 has no players and frames up to 6 only one, so the first chunk cannot be fitted on
+    frames, player_tracks = make_match(number_of_frames=16)
+    for frame_num in range(7):
+        player_tracks[frame_num] = {track_id: player for track_id, player in player_tracks[frame_num].items() if frame_num and track_id == 1}
+
+    video_path = str(tmp_path / 'match.avi')
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), 25, frames[0].shape[1::-1])
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+    # The untrained detector finds nothing, so the chunks get the scripted players
+    pipeline = StreamingPipeline('yolov8n.yaml', chunk_size=5)
+
+    def add_chunk_to_tracks(chunk, tracks):
+        start_frame = len(tracks['players'])
+        for frame_num in range(start_frame, start_frame + len(chunk)):
+            tracks['players'].append(copy.deepcopy(player_tracks[frame_num]))
+            tracks['referees'].append({})
+            tracks['ball'].append({})
+
+    pipeline.tracker.add_chunk_to_tracks = add_chunk_to_tracks
+    tracks, camera_movement_per_frame = pipeline.track_video(video_path)
+
+    assert len(tracks['players']) == len(camera_movement_per_frame) == 16
+    # The first chunk had at most one player per frame, so its players have no team
+    assert all('team' not in player for player_track in tracks['players'][:5] for player in player_track.values())
+    # The fit happens on frame 7, and the whole chunk it is in gets teams that follow the jerseys
+    jersey_team = tracks['players'][7][1]['team']
+    for player_track in tracks['players'][5:]:
+        for track_id, player in player_track.items():
+            assert (player['team'] == jersey_team) == (track_id % 2 == 1)
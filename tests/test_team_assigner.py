@@ -0,0 +1,122 @@
+import copy
+import numpy as np
+from sklearn.cluster import KMeans
+from team_identifier.team_assigner import TeamAssigner
+from team_identifier.player_crops import PlayerCrops
+
+JERSEYS = {1: (30, 30, 200), 2: (235, 235, 235)}
+
+def make_match(number_of_frames=40, players=10, seed=0):
+    # Green frames with players as boxes around a jersey colored top half over dark shorts. Player boxes move a little
+    # every frame, and one player is taller than the crop slots, so its crops are shrunk.
+    rng = np.random.default_rng(seed)
+    height, width = 360, 640
+    starts = rng.uniform((20, 20), (width - 80, height - 200), size=(players, 2))
+    sizes = np.tile([24, 60], (players, 1))
+    sizes[0] = (40, 170)
+    frames, player_tracks = [], []
+    for frame_num in range(number_of_frames):
+        frame = np.full((height, width, 3), (40, 140, 40), dtype=np.uint8)
+        frame += rng.integers(0, 12, size=frame.shape, dtype=np.uint8)
+        player_track = {}
+        for index in range(players):
+            # Track IDs 2-4 leave after 20 frames, as if lost, and 5 only appears from frame 10 on
+            track_id = index + 1
+            if (track_id <= 4 and frame_num >= 20 and track_id != 1) or (track_id == 5 and frame_num < 10):
+                continue
+            x1, y1 = (starts[index] + frame_num).astype(int)
+            box_width, box_height = sizes[index]
+            # The pitch shows at the sides of the box, as around a real player
+            margin = box_width // 4
+            frame[y1 + 4:y1 + box_height // 2, x1 + margin:x1 + box_width - margin] = JERSEYS[1 + index % 2]
+            frame[y1 + box_height // 2:y1 + box_height, x1 + margin:x1 + box_width - margin] = (20, 20, 20)
+            player_track[track_id] = {"bbox": [x1, y1, x1 + box_width, y1 + box_height]}
+        frames.append(frame)
+        player_tracks.append(player_track)
+    return frames, player_tracks
+
+def fitted_assigner(frames, player_tracks):
+    team_assigner = TeamAssigner(sample_interval=3, votes_needed=3, recheck_interval=10, max_tracks=6)
+    team_assigner.assign_team_color(frames[0], player_tracks[0])
+    return team_assigner
+
+def test_chunk_teams_match_frame_by_frame():
+    frames, player_tracks = make_match()
+    per_frame = fitted_assigner(frames, player_tracks)
+    chunked = copy.deepcopy(per_frame)
+
+    expected = [per_frame.get_player_teams(frame, player_track) for frame, player_track in zip(frames, player_tracks)]
+    player_crops = PlayerCrops(capacity=4)
+    teams = []
+    for start, end in ((0, 7), (7, 8), (8, 40)):
+        teams += chunked.get_chunk_teams(iter(frames[start:end]), player_tracks[start:end], player_crops)
+
+    assert teams == expected
+    np.testing.assert_allclose(chunked.centers, per_frame.centers)
+    assert chunked.votes == per_frame.votes
+    assert chunked.player_team_dict == per_frame.player_team_dict
+    assert chunked.frame_count == per_frame.frame_count == 40
+
+def test_teams_follow_jerseys_and_stay_bounded():
+    frames, player_tracks = make_match()
+    team_assigner = fitted_assigner(frames, player_tracks)
+    teams = team_assigner.get_chunk_teams(frames, player_tracks)
+
+    # Jersey 1 is on even player indices, i.e. odd track IDs; which team number it gets depends on the fit
+    jersey_team = teams[0][1]
+    for frame_teams in teams:
+        for track_id, team in frame_teams.items():
+            assert (team == jersey_team) == (track_id % 2 == 1)
+    assert len(team_assigner.votes) <= team_assigner.max_tracks
+    assert set(team_assigner.player_team_dict) == set(team_assigner.votes)
+
+def sklearn_crop_features(crop, histogram_bins):
+    # The original per-player path with sklearn: 2-means on the top half of the crop, the cluster holding most corners
+    # is the background and the jersey is the other one. Lloyd starts from the same seeds as the batched clustering,
+    # a split of the pixels along their principal color axis, so both must reach the same clusters.
+    top_half = crop[:crop.shape[0] // 2].astype(np.float64)
+    pixels = top_half.reshape(-1, 3)
+    centered = pixels - pixels.mean(axis=0)
+    side = centered @ np.linalg.eigh(centered.T @ centered)[1][:, -1] > 0
+    seeds = np.stack([pixels[~side].mean(axis=0), pixels[side].mean(axis=0)])
+    kmeans = KMeans(n_clusters=2, init=seeds, n_init=1, algorithm='lloyd', tol=0).fit(pixels)
+
+    labels = kmeans.labels_.reshape(top_half.shape[:2])
+    corner_clusters = [labels[0, 0], labels[0, -1], labels[-1, 0], labels[-1, -1]]
+    non_player_cluster = max(set(corner_clusters), key=corner_clusters.count)
+    player_cluster = 1 - non_player_cluster
+
+    jersey = top_half[labels == player_cluster].astype(np.int64)
+    cells = np.minimum(jersey * histogram_bins // 256, histogram_bins - 1)
+    histogram = np.bincount((cells[:, 0] * histogram_bins + cells[:, 1]) * histogram_bins + cells[:, 2], minlength=histogram_bins ** 3)
+    return kmeans, kmeans.cluster_centers_[player_cluster], np.sqrt(histogram / histogram.sum())
+
+def test_batched_clustering_matches_sklearn():
+    frames, player_tracks = make_match(number_of_frames=3)
+    bboxes = [[player["bbox"] for player in player_track.values()] for player_track in player_tracks]
+
+    # Players cut off at the frame edge: split down the middle, so two corners each are pitch and jersey, and
+    # filling the crop but for one pitch corner
+    frame = np.full((120, 120, 3), (40, 140, 40), dtype=np.uint8)
+    frame += np.random.default_rng(1).integers(0, 12, size=frame.shape, dtype=np.uint8)
+    frame[:, :10] = JERSEYS[1]
+    frame[60:, 100:] = JERSEYS[2]
+    frame[60:64, 116:] = (40, 140, 40)
+    frames.append(frame)
+    bboxes.append([[0, 0, 20, 40], [100, 60, 120, 120]])
+
+    team_assigner = TeamAssigner()
+    for frame, frame_bboxes in zip(frames, bboxes):
+        crops = PlayerCrops.from_frame(frame, frame_bboxes)
+        colors, embeddings = team_assigner.get_crop_features(*crops.tensor())
+        for row in range(len(crops)):
+            crop = crops.crop(row)
+            kmeans, expected_color, expected_embedding = sklearn_crop_features(crop, team_assigner.histogram_bins)
+            np.testing.assert_allclose(colors[row], expected_color, atol=1e-6)
+            np.testing.assert_allclose(embeddings[row], expected_embedding, atol=1e-9)
+
+            # The seeding finds as good a clustering as sklearn's own k-means++. The shrunk crop's blended edge pixels
+            # leave two local optima sklearn itself picks between by seed, so it is compared by inertia.
+            pixels = crop[:crop.shape[0] // 2].reshape(-1, 3).astype(np.float64)
+            best = KMeans(n_clusters=2, n_init=10, random_state=0).fit(pixels)
+            assert kmeans.inertia_ <= 1.01 * best.inertia_
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from benchmarks.synthetic_tracks import make_synthetic_table, make_synthetic_camera_movement
+from export.track_export import export_tracks, TrackReader, EXPORT_DTYPES
+
+NUMBER_OF_FRAMES = 40
+
+def make_export(path, table=None):
+    table = make_synthetic_table(NUMBER_OF_FRAMES, players=6, referees=1, ball_visibility=0.6, seed=2) if table is None else table
+    speed = table.empty_column('speed')
+    players = table.object_mask('players')
+    speed[players] = np.linspace(0, 30, players.sum())
+    table['speed'] = speed
+    possession = np.arange(NUMBER_OF_FRAMES) % 3
+    camera_movement = make_synthetic_camera_movement(NUMBER_OF_FRAMES)
+    export_tracks(str(path), table, possession, camera_movement, frame_rate=25)
+    return table, possession, camera_movement
+
+def assert_rows_match(result, table, rows):
+    np.testing.assert_array_equal(result.frame, table.frame[rows])
+    np.testing.assert_array_equal(result.track_id, table.track_id[rows])
+    np.testing.assert_array_equal(result.object_class, table.object_class[rows])
+    np.testing.assert_allclose(result.bbox, table.bbox[rows].astype(EXPORT_DTYPES['bbox']))
+    for name in result.columns:
+        np.testing.assert_allclose(result[name], table[name][rows].astype(EXPORT_DTYPES[name]))
+
+def test_whole_table_round_trip(tmp_path):
+    table, possession, camera_movement = make_export(tmp_path)
+    reader = TrackReader(str(tmp_path))
+    result = reader.to_table()
+    assert result.number_of_frames == NUMBER_OF_FRAMES
+    assert set(result.columns) == {'team', 'team_color', 'speed'}
+    assert_rows_match(result, table, np.arange(len(table)))
+    np.testing.assert_array_equal(reader.frame_values('possession'), possession)
+    np.testing.assert_allclose(reader.frame_values('camera_movement', 5, 10), camera_movement[5:10].astype(np.float32))
+
+def test_frame_range(tmp_path):
+    table, _, _ = make_export(tmp_path)
+    reader = TrackReader(str(tmp_path))
+
+    result = reader.frame_range(10, 20, columns=['speed'])
+    assert list(result.columns) == ['speed']
+    assert_rows_match(result, table, np.flatnonzero((table.frame >= 10) & (table.frame < 20)))
+    # frame_offsets of the result still index absolute frames
+    assert (result.frame[result.frame_rows(15)] == 15).all()
+
+    players = reader.frame_range(10, 20, object_name='players')
+    assert_rows_match(players, table, np.flatnonzero((table.frame >= 10) & (table.frame < 20) & table.object_mask('players')))
+
+def test_single_track(tmp_path):
+    table, _, _ = make_export(tmp_path)
+    reader = TrackReader(str(tmp_path))
+    np.testing.assert_array_equal(np.sort(reader.track_ids('players')), np.arange(1, 7))
+
+    result = reader.track(3, start_frame=5, end_frame=30)
+    rows = np.flatnonzero(table.object_mask('players') & (table.track_id == 3) & (table.frame >= 5) & (table.frame < 30))
+    assert_rows_match(result, table, rows)
+
+    with pytest.raises(KeyError):
+        reader.track(99)
+    with pytest.raises(KeyError):
+        reader.to_table(columns=['acceleration'])
+
+def test_team_color_stored_when_not_one_color_per_team(tmp_path):
+    table = make_synthetic_table(NUMBER_OF_FRAMES, players=6, referees=1, seed=3)
+    team_color = table['team_color'].copy()
+    team_color[np.flatnonzero(table['team'] == 1)[0]] = (1, 2, 3)
+    table['team_color'] = team_color
+    make_export(tmp_path, table)
+
+    reader = TrackReader(str(tmp_path))
+    assert reader.manifest['team_palette'] is None
+    np.testing.assert_allclose(reader.to_table(columns=['team_color'])['team_color'], team_color.astype(np.float32))
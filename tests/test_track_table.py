@@ -0,0 +1,112 @@
+import pytest
+import numpy as np
+from benchmarks.synthetic_tracks import make_synthetic_table
+from tracking_framework.track_table import TrackTable, OBJECT_CLASSES
+
+def assert_tables_equal(table, other):
+    assert table.number_of_frames == other.number_of_frames
+    np.testing.assert_array_equal(table.frame, other.frame)
+    np.testing.assert_array_equal(table.track_id, other.track_id)
+    np.testing.assert_array_equal(table.object_class, other.object_class)
+    np.testing.assert_array_equal(table.bbox, other.bbox)
+    assert set(table.columns) == set(other.columns)
+    for name in table.columns:
+        np.testing.assert_array_equal(table[name], other[name])
+
+def make_table(number_of_frames=30):
+    table = make_synthetic_table(number_of_frames, players=6, referees=1, ball_visibility=0.5, seed=1)
+    # Some players without a speed, to check missing values survive
+    speed = table.empty_column('speed')
+    players = np.flatnonzero(table.object_mask('players'))
+    speed[players[::2]] = np.arange(len(players[::2]), dtype=np.float64)
+    table['speed'] = speed
+    return table
+
+def test_from_tracks_round_trip():
+    table = make_table()
+    tracks = table.to_tracks()
+    assert len(tracks['players']) == table.number_of_frames
+    assert_tables_equal(TrackTable.from_tracks(tracks), table)
+
+def test_arrays_round_trip():
+    table = make_table()
+    assert_tables_equal(TrackTable.from_arrays(table.to_arrays()), table)
+
+def test_frame_rows_match_frames():
+    table = make_table()
+    for frame_num in range(table.number_of_frames):
+        assert (table.frame[table.frame_rows(frame_num)] == frame_num).all()
+    assert table.frame_offsets[-1] == len(table)
+
+def test_concatenate_frame_ranges():
+    table = make_table()
+    parts = [table.select((table.frame >= start) & (table.frame < end)) for start, end in ((0, 10), (10, 11), (11, 30))]
+    # A part without one of the columns gets the column's fill value
+    del parts[1].columns['speed']
+    expected_speed = table['speed'].copy()
+    expected_speed[table.frame == 10] = np.nan
+
+    combined = TrackTable.concatenate(parts, table.number_of_frames)
+    table['speed'] = expected_speed
+    assert_tables_equal(combined, table)
+
+def test_replace_object_rows_keeps_order():
+    table = make_table()
+    balls = table.select(table.object_mask('ball'))
+    moved = TrackTable(balls.frame, balls.track_id, balls.object_class, balls.bbox + 1, table.number_of_frames)
+    replaced = table.replace_object_rows('ball', moved)
+
+    np.testing.assert_array_equal(replaced.frame, table.frame)
+    np.testing.assert_array_equal(replaced.object_class, table.object_class)
+    ball = table.object_mask('ball')
+    np.testing.assert_array_equal(replaced.bbox[ball], table.bbox[ball] + 1)
+    np.testing.assert_array_equal(replaced.bbox[~ball], table.bbox[~ball])
+    np.testing.assert_array_equal(replaced['team'], table['team'])
+    assert np.isnan(replaced['speed'][ball]).all()
+
+def test_frame_dict_matches_row_dict():
+    table = make_table()
+    for frame_num in (0, 7, 29):
+        rows = table.frame_rows(frame_num)
+        for object_name in OBJECT_CLASSES:
+            frame_tracks = table.frame_dict(object_name, frame_num, columns=['team', 'speed'])
+            expected = {
+                int(table.track_id[row]): table.row_dict(row, columns=['team', 'speed'])
+                for row in range(rows.start, rows.stop) if table.object_class[row] == OBJECT_CLASSES.index(object_name)
+            }
+            assert frame_tracks == expected
+
+def test_lazy_columns_compute_once_on_read():
+    table = make_table()
+    calls = []
+
+    def compute(table):
+        calls.append(1)
+        table['distance'] = table['speed'] * 2
+        table['acceleration'] = table['speed'] * 3
+
+    table.add_lazy_columns(('distance', 'acceleration'), compute)
+    assert 'distance' in table and 'distance' not in table.columns
+    assert not calls
+
+    np.testing.assert_array_equal(table['acceleration'], table['speed'] * 3)
+    np.testing.assert_array_equal(table['distance'], table['speed'] * 2)
+    assert len(calls) == 1
+    assert not table.lazy_columns
+
+def test_lazy_columns_materialize_for_whole_table_operations():
+    table = make_table()
+    table.add_lazy_columns(('distance',), lambda table: table.__setitem__('distance', table['speed'] + 1))
+    arrays = table.to_arrays()
+    np.testing.assert_array_equal(arrays['column_distance'], table['speed'] + 1)
+
+    other = make_table()
+    other.add_lazy_columns(('distance',), lambda table: table.__setitem__('distance', table['speed'] + 1))
+    combined = TrackTable.concatenate([other.select(other.frame < 15), other.select(other.frame >= 15)], other.number_of_frames)
+    np.testing.assert_array_equal(combined['distance'], table['distance'])
+
+def test_lazy_column_skipped_by_as_tracks_without_it():
+    table = make_table()
+    table.add_lazy_columns(('distance',), lambda table: pytest.fail("distance was computed"))
+    tracks = table.as_tracks(['team'])
+    assert all('distance' not in player for player in tracks['players'][3].values())
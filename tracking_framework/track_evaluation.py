@@ -0,0 +1,46 @@
+import numpy as np
+from utilities.bbox_utils import measure_iou_matrix
+from tracking_framework.track_table import OBJECT_CLASSES
+
+def match_boxes(reference_boxes, boxes, iou_threshold=0.5):
+    # Greedy one-to-one matching by descending IoU; returns the IoU of every matched pair
+    if len(reference_boxes) == 0 or len(boxes) == 0:
+        return np.zeros(0)
+    iou = measure_iou_matrix(reference_boxes, boxes)
+    matched_ious = []
+    used_reference = np.zeros(iou.shape[0], dtype=bool)
+    used = np.zeros(iou.shape[1], dtype=bool)
+    for index in np.argsort(iou, axis=None)[::-1]:
+        reference_index, box_index = np.unravel_index(index, iou.shape)
+        if iou[reference_index, box_index] < iou_threshold:
+            break
+        if used_reference[reference_index] or used[box_index]:
+            continue
+        used_reference[reference_index] = used[box_index] = True
+        matched_ious.append(iou[reference_index, box_index])
+    return np.array(matched_ious)
+
+def compare_tracks(reference_tracks, tracks, iou_threshold=0.5):
+    # Box-level agreement of tracks with reference tracks over the same frames, e.g. frame-skipped against full-rate.
+    # Returns recall, precision and mean IoU of the matched boxes per object class and over all classes.
+    report = {}
+    totals = np.zeros(4)  # matched, reference boxes, boxes, IoU sum
+    for object_name in OBJECT_CLASSES:
+        counts = np.zeros(4)
+        for reference_track, track in zip(reference_tracks[object_name], tracks[object_name]):
+            reference_boxes = [track_info["bbox"] for track_info in reference_track.values()]
+            boxes = [track_info["bbox"] for track_info in track.values()]
+            matched_ious = match_boxes(reference_boxes, boxes, iou_threshold)
+            counts += (len(matched_ious), len(reference_boxes), len(boxes), matched_ious.sum())
+        report[object_name] = summarize_counts(counts)
+        totals += counts
+    report["all"] = summarize_counts(totals)
+    return report
+
+def summarize_counts(counts):
+    matched, reference_boxes, boxes, iou_sum = counts
+    return {
+        "recall": float(matched / reference_boxes) if reference_boxes else 1.0,
+        "precision": float(matched / boxes) if boxes else 1.0,
+        "mean_iou": float(iou_sum / matched) if matched else 0.0,
+    }
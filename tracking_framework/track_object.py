@@ -6,22 +6,64 @@ import numpy as np
 import pandas as pd
 import cv2
 import sys
+import time
 
 # Add the utilities directory to the system path
 sys.path.append('/teamspace/studios/this_studio/utilities')
 
 # Import utility functions
 from bbox_utils import get_center_of_bbox, get_bbox_width, get_foot_position
+from tracking_framework.track_table import TrackTable, OBJECT_CLASSES
+from utilities.memory_utils import get_available_memory
+from utilities.profiler import StageProfiler
+from ball_possession.possession_stats import PossessionStats
 
 class Tracker:
-    def __init__(self, model_path):
+    def __init__(self, model_path, imgsz=640, max_batch_size=64, memory_fraction=0.5, detection_stride=1, motion_threshold=None):
         # Initialize the YOLO model with the given path
+        self.model_path = model_path
         self.model = YOLO(model_path)
+        self.conf = 0.1
+
+        # Frames are downscaled once to the detector input size before batching
+        self.imgsz = imgsz
+        self.prescale_interpolation = cv2.INTER_LINEAR
+
+        # Batch size starts small and grows while per-frame latency improves, within a memory budget
+        self.max_batch_size = max_batch_size
+        self.memory_fraction = memory_fraction
+        self.activation_memory_factor = 200  # Rough detector working set per input byte
+        self.batch_size = None
+        self.best_batch_size = None
+        self.best_frame_latency = None
+        self.growing_batch_size = True
+
+        # Run the detector only on keyframes: every detection_stride-th frame, plus any frame whose mean
+        # absolute difference from the last keyframe exceeds motion_threshold (grayscale levels, 0-255).
+        # Boxes on the frames in between are interpolated between the surrounding keyframes.
+        self.detection_stride = detection_stride
+        self.motion_threshold = motion_threshold
+        self.motion_thumbnail_size = (64, 36)
+        self.last_keyframe = None
+        self.last_keyframe_thumbnail = None
+        self.detected_frames = set()
+
+        # Records detect and track time separately; replaced by the pipeline's profiler when profiling
+        self.profiler = StageProfiler(enabled=False)
+
+        # Possession statistics of the last team_ball_control array drawn, so each frame is a constant-time lookup
+        self.possession_stats = None
+        self.possession_stats_source = None
+
         # Initialize the ByteTrack tracker
         self.tracker = sv.ByteTrack()
 
     def add_position_to_tracks(self, tracks):
         # Add the position of each tracked object to the tracks
+        if isinstance(tracks, TrackTable):
+            self.add_position_to_table(tracks)
+            return
+
         for object, object_tracks in tracks.items():
             for frame_num, track in enumerate(object_tracks):
                 for track_id, track_info in track.items():
@@ -32,8 +74,18 @@ class Tracker:
                         position = get_foot_position(bbox)
                     tracks[object][frame_num][track_id]['position'] = position
 
+    def add_position_to_table(self, table):
+        # Ball position is the bbox center, everything else uses the foot position; truncated like int()
+        bbox = table.bbox
+        x = np.trunc((bbox[:, 0] + bbox[:, 2]) / 2)
+        y = np.where(table.object_mask('ball'), np.trunc((bbox[:, 1] + bbox[:, 3]) / 2), np.trunc(bbox[:, 3]))
+        table['position'] = np.stack([x, y], axis=1)
+
     def interpolate_ball_positions(self, ball_positions):
         # Interpolate missing ball positions
+        if isinstance(ball_positions, TrackTable):
+            return self.interpolate_ball_in_table(ball_positions)
+
         ball_positions = [x.get(1, {}).get('bbox', []) for x in ball_positions]
         df_ball_positions = pd.DataFrame(ball_positions, columns=['x1', 'y1', 'x2', 'y2'])
 
@@ -45,78 +97,291 @@ class Tracker:
 
         return ball_positions
 
-    def detect_frames(self, frames):
-        # Detect objects in video frames in batches
-        batch_size = 20
-        detections = []
-        for i in range(0, len(frames), batch_size):
-            detections_batch = self.model.predict(frames[i:i+batch_size], conf=0.1)
-            detections += detections_batch
+    def interpolate_ball_in_table(self, table):
+        # Same interpolation as interpolate_ball_positions, returning a table with one ball row per frame
+        ball = table.select(table.object_mask('ball'))
+        bboxes = np.full((table.number_of_frames, 4), np.nan)
+        bboxes[ball.frame] = ball.bbox
+
+        df_ball_positions = pd.DataFrame(bboxes, columns=['x1', 'y1', 'x2', 'y2'])
+        df_ball_positions = df_ball_positions.interpolate()
+        df_ball_positions = df_ball_positions.bfill()
+
+        number_of_frames = table.number_of_frames
+        interpolated_ball = TrackTable(
+            np.arange(number_of_frames),
+            np.ones(number_of_frames, dtype=np.int64),
+            np.full(number_of_frames, OBJECT_CLASSES.index('ball')),
+            df_ball_positions.to_numpy(),
+            number_of_frames,
+        )
+        return table.replace_object_rows('ball', interpolated_ball)
+
+    def prepare_frame(self, frame):
+        # Downscale to the detector input size once, instead of inside every predict call.
+        # Returns the frame and its scale, which maps the detected boxes back to full resolution.
+        height, width = frame.shape[:2]
+        scale = min(self.imgsz / max(height, width), 1.0)
+        if scale == 1.0:
+            return frame, scale
+        return cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=self.prescale_interpolation), scale
+
+    def memory_batch_limit(self, frame):
+        # Largest batch whose estimated working set fits in a fraction of the available memory
+        available_memory = get_available_memory()
+        if available_memory is None:
+            return self.max_batch_size
+        frame_memory = frame.nbytes * self.activation_memory_factor
+        return int(max(1, min(self.max_batch_size, available_memory * self.memory_fraction // frame_memory)))
+
+    def update_batch_size(self, batch_length, elapsed):
+        # Keep doubling the batch while it lowers per-frame latency, then settle on the fastest size seen
+        if batch_length < self.batch_size:
+            return
+        frame_latency = elapsed / batch_length
+        if self.best_frame_latency is None or frame_latency < self.best_frame_latency * 0.95:
+            self.best_frame_latency = frame_latency
+            self.best_batch_size = batch_length
+            if self.growing_batch_size and batch_length * 2 <= self.max_batch_size:
+                self.batch_size = batch_length * 2
+            else:
+                self.growing_batch_size = False
+        else:
+            self.growing_batch_size = False
+            self.batch_size = self.best_batch_size
+
+    def predict_batch(self, batch):
+        start = time.perf_counter()
+        try:
+            with self.profiler.stage('detect', frames=len(batch)):
+                detections = self.model.predict(batch, conf=self.conf, imgsz=self.imgsz, verbose=False)
+        except (MemoryError, RuntimeError) as e:
+            if (isinstance(e, RuntimeError) and 'memory' not in str(e).lower()) or len(batch) == 1:
+                raise
+            # Out of memory: never try this size again and split the batch
+            self.max_batch_size = max(1, len(batch) // 2)
+            self.batch_size = min(self.batch_size, self.max_batch_size)
+            self.growing_batch_size = False
+            half = len(batch) // 2
+            return self.predict_batch(batch[:half]) + self.predict_batch(batch[half:])
+
+        self.update_batch_size(len(batch), time.perf_counter() - start)
         return detections
 
-    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None):
+    def iter_detections(self, frames):
+        # Detect objects in any iterable of frames, yielding (result, scale of the detector input) per frame as
+        # batches complete
+        batch = []
+        scales = []
+        for frame in frames:
+            prepared_frame, scale = self.prepare_frame(frame)
+            batch.append(prepared_frame)
+            scales.append(scale)
+            if self.batch_size is None:
+                self.max_batch_size = self.memory_batch_limit(batch[0])
+                self.batch_size = min(4, self.max_batch_size)
+
+            if len(batch) >= self.batch_size:
+                yield from zip(self.predict_batch(batch), scales)
+                batch = []
+                scales = []
+
+        if batch:
+            yield from zip(self.predict_batch(batch), scales)
+
+    def detect_frames(self, frames):
+        # Detect objects in video frames in adaptively sized batches; boxes are in detector input coordinates
+        return [detection for detection, _ in self.iter_detections(frames)]
+
+    def settings(self):
+        # Everything besides the video and the weights that changes the tracks
+        return {
+            "conf": self.conf,
+            "tracker": "ByteTrack",
+            "imgsz": self.imgsz,
+            "prescale_interpolation": self.prescale_interpolation,
+            "detection_stride": self.detection_stride,
+            "motion_threshold": self.motion_threshold,
+            "motion_thumbnail_size": self.motion_thumbnail_size,
+        }
+
+    def tracks_cache_key(self, cache, video_path, number_of_frames):
+        # Tracks depend on the video, the weights and the detection settings
+        return cache.make_key('object_tracks', video_path, self.model_path, {
+            **self.settings(),
+            "number_of_frames": number_of_frames,
+        })
+
+    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None, cache=None, video_path=None):
         # Retrieve object tracks from a stub file if available, otherwise detect and track objects
         if read_from_stub and stub_path is not None and os.path.exists(stub_path):
             with open(stub_path, 'rb') as f:
                 tracks = pickle.load(f)
             return tracks
 
-        # Detect objects in the video frames
-        detections = self.detect_frames(frames)
+        # Retrieve object tracks from the result cache when the video, weights and settings are unchanged
+        cache_key = None
+        if cache is not None and video_path is not None:
+            cache_key = self.tracks_cache_key(cache, video_path, len(frames))
+            cached = cache.load(cache_key)
+            if cached is not None:
+                return TrackTable.from_arrays(cached[0]).to_tracks()
 
         # Initialize tracks dictionary
-        tracks = {
-            "players": [],
-            "referees": [],
-            "ball": []
-        }
-
-        # Process each frame's detections
-        for frame_num, detection in enumerate(detections):
-            cls_names = detection.names
-            cls_names_inv = {v: k for k, v in cls_names.items()}
+        tracks = self.create_empty_tracks()
 
-            # Convert to supervision Detection format
-            detection_supervision = sv.Detections.from_ultralytics(detection)
+        # Detect and track objects in the video frames, skipping non-keyframes if configured
+        self.add_chunk_to_tracks(frames, tracks)
 
-            # Convert GoalKeeper to player object
-            for object_ind, class_id in enumerate(detection_supervision.class_id):
-                if cls_names[class_id] == "goalkeeper":
-                    detection_supervision.class_id[object_ind] = cls_names_inv["player"]
+        if cache_key is not None:
+            cache.store(cache_key, TrackTable.from_tracks(tracks).to_arrays())
 
-            # Track objects
-            detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
-
-            # Initialize empty dictionaries for the current frame
-            tracks["players"].append({})
-            tracks["referees"].append({})
-            tracks["ball"].append({})
+        # Save the tracks to a pickle file if a stub path is provided
+        if stub_path is not None:
+            os.makedirs(os.path.dirname(stub_path), exist_ok=True)  # Ensure the directory exists
+            with open(stub_path, 'wb') as f:
+                pickle.dump(tracks, f)
 
-            # Process tracked detections
-            for frame_detection in detection_with_tracks:
-                bbox = frame_detection[0].tolist()
-                cls_id = frame_detection[3]
-                track_id = frame_detection[4]
+        return tracks
 
-                if cls_id == cls_names_inv['player']:
-                    tracks["players"][frame_num][track_id] = {"bbox": bbox}
+    def create_empty_tracks(self):
+        return {
+            "players": [],
+            "referees": [],
+            "ball": []
+        }
 
-                if cls_id == cls_names_inv['referee']:
-                    tracks["referees"][frame_num][track_id] = {"bbox": bbox}
+    def add_chunk_to_tracks(self, frames, tracks):
+        # Detect and track one chunk of frames, appending its results to tracks.
+        # ByteTrack keeps its state between calls, so track IDs carry over chunk boundaries.
+        if self.detection_stride == 1 and self.motion_threshold is None:
+            detections = self.iter_detections(frames)
+            self.add_detections_to_tracks(detections, tracks)
+            return tracks
 
-            # Process detections to find the ball
-            for frame_detection in detection_supervision:
-                bbox = frame_detection[0].tolist()
-                cls_id = frame_detection[3]
+        start_frame = len(tracks["players"])
+        keyframes = self.select_keyframes(frames, start_frame)
+        detections = self.iter_detections(frames[i] for i in keyframes)
+        self.add_detections_to_tracks(detections, tracks, frame_numbers=[start_frame + i for i in keyframes])
+        with self.profiler.stage('track', frames=len(frames) - len(keyframes)):
+            self.fill_skipped_frames(tracks, start_frame, start_frame + len(frames))
+        return tracks
 
-                if cls_id == cls_names_inv['ball']:
-                    tracks["ball"][frame_num][1] = {"bbox": bbox}
+    def motion_thumbnail(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, self.motion_thumbnail_size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def select_keyframes(self, frames, start_frame):
+        # Indices into frames to run the detector on. The last frame of every chunk is always a keyframe,
+        # so skipped frames can be interpolated without waiting for the next chunk.
+        return [i for i, frame in enumerate(frames) if self.is_keyframe(frame, start_frame + i, force=i == len(frames) - 1)]
+
+    def is_keyframe(self, frame, frame_num, force=False):
+        # Whether the detector should run on this frame: every detection_stride frames, on a forced frame, or when the
+        # frame changed by more than motion_threshold since the last keyframe. Records the frame when it is a keyframe.
+        is_keyframe = (
+            force
+            or self.last_keyframe is None
+            or frame_num - self.last_keyframe >= self.detection_stride
+        )
 
-        # Save the tracks to a pickle file if a stub path is provided
-        if stub_path is not None:
-            os.makedirs(os.path.dirname(stub_path), exist_ok=True)  # Ensure the directory exists
-            with open(stub_path, 'wb') as f:
-                pickle.dump(tracks, f)
+        thumbnail = None
+        if not is_keyframe and self.motion_threshold is not None:
+            thumbnail = self.motion_thumbnail(frame)
+            is_keyframe = np.abs(thumbnail - self.last_keyframe_thumbnail).mean() > self.motion_threshold
+
+        if is_keyframe:
+            self.last_keyframe = frame_num
+            if self.motion_threshold is not None:
+                self.last_keyframe_thumbnail = thumbnail if thumbnail is not None else self.motion_thumbnail(frame)
+
+        return is_keyframe
+
+    def fill_skipped_frames(self, tracks, start_frame, end_frame):
+        # Linearly interpolate the boxes of every track seen on both keyframes around a run of skipped frames,
+        # the same interpolation interpolate_ball_positions applies to the ball
+        for object_tracks in tracks.values():
+            while len(object_tracks) < end_frame:
+                object_tracks.append({})
+
+        # The previous chunk always ends on a keyframe
+        first_frame = max(start_frame - 1, 0)
+        keyframes = [frame_num for frame_num in range(first_frame, end_frame) if frame_num in self.detected_frames]
+        for previous, following in zip(keyframes, keyframes[1:]):
+            gap = following - previous
+            if gap == 1:
+                continue
+            for object_tracks in tracks.values():
+                before = object_tracks[previous]
+                after = object_tracks[following]
+                for track_id in before.keys() & after.keys():
+                    bbox_before = np.array(before[track_id]["bbox"])
+                    bbox_after = np.array(after[track_id]["bbox"])
+                    for frame_num in range(previous + 1, following):
+                        weight = (frame_num - previous) / gap
+                        object_tracks[frame_num][track_id] = {"bbox": (bbox_before + weight * (bbox_after - bbox_before)).tolist()}
+
+        self.detected_frames = {frame_num for frame_num in self.detected_frames if frame_num >= end_frame - 1}
+
+    def add_detections_to_tracks(self, detections, tracks, frame_numbers=None):
+        # detections are (result, scale) pairs from iter_detections.
+        # frame_numbers gives the frame of each detection when frames were skipped; missing frames are left empty
+        if frame_numbers is not None:
+            frame_numbers = iter(frame_numbers)
+
+        # One track stage for the whole call rather than one per frame; the detect stages run inside it as the
+        # detections are pulled, and are not counted in its self time
+        with self.profiler.stage('track') as stage_info:
+            for detection, scale in detections:
+                stage_info["frames"] += 1
+                if frame_numbers is not None:
+                    frame_num = next(frame_numbers)
+                    for object_tracks in tracks.values():
+                        while len(object_tracks) < frame_num:
+                            object_tracks.append({})
+                    self.detected_frames.add(frame_num)
+                else:
+                    frame_num = len(tracks["players"])
+                cls_names = detection.names
+                cls_names_inv = {v: k for k, v in cls_names.items()}
+
+                # Convert to supervision Detection format, mapping boxes back to full-resolution coordinates
+                detection_supervision = sv.Detections.from_ultralytics(detection)
+                if scale != 1.0:
+                    detection_supervision.xyxy = detection_supervision.xyxy / scale
+
+                # Convert GoalKeeper to player object
+                for object_ind, class_id in enumerate(detection_supervision.class_id):
+                    if cls_names[class_id] == "goalkeeper":
+                        detection_supervision.class_id[object_ind] = cls_names_inv["player"]
+
+                # Track objects
+                detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
+
+                # Initialize empty dictionaries for the current frame
+                tracks["players"].append({})
+                tracks["referees"].append({})
+                tracks["ball"].append({})
+
+                # Process tracked detections
+                for frame_detection in detection_with_tracks:
+                    bbox = frame_detection[0].tolist()
+                    cls_id = frame_detection[3]
+                    track_id = frame_detection[4]
+
+                    if cls_id == cls_names_inv['player']:
+                        tracks["players"][frame_num][track_id] = {"bbox": bbox}
+
+                    if cls_id == cls_names_inv['referee']:
+                        tracks["referees"][frame_num][track_id] = {"bbox": bbox}
+
+                # Process detections to find the ball
+                for frame_detection in detection_supervision:
+                    bbox = frame_detection[0].tolist()
+                    cls_id = frame_detection[3]
+
+                    if cls_id == cls_names_inv['ball']:
+                        tracks["ball"][frame_num][1] = {"bbox": bbox}
 
         return tracks
 
@@ -184,6 +449,15 @@ class Tracker:
 
         return frame
 
+    def get_possession_stats(self, team_ball_control):
+        # team_ball_control is a PossessionStats or the per-frame array, which is counted once and reused
+        if isinstance(team_ball_control, PossessionStats):
+            return team_ball_control
+        if team_ball_control is not self.possession_stats_source:
+            self.possession_stats = PossessionStats.from_team_ball_control(team_ball_control)
+            self.possession_stats_source = team_ball_control
+        return self.possession_stats
+
     def draw_team_ball_control(self, frame, frame_num, team_ball_control):
         # Draw the team ball control statistics
         overlay = frame.copy()
@@ -191,31 +465,20 @@ class Tracker:
         alpha = 0.4
         cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
 
-        team_ball_control_till_frame = team_ball_control[:frame_num+1]
-        # Get the number of times each team had ball control
-        team_1_num_frames = team_ball_control_till_frame[team_ball_control_till_frame == 1].shape[0]
-        team_2_num_frames = team_ball_control_till_frame[team_ball_control_till_frame == 2].shape[0]
-        total_frames = team_1_num_frames + team_2_num_frames
-
-        if total_frames > 0:
-            team_1 = team_1_num_frames / total_frames
-            team_2 = team_2_num_frames / total_frames
-        else:
-            team_1 = 0
-            team_2 = 0
+        # Share of frames each team had ball control up to this frame
+        team_1, team_2 = self.get_possession_stats(team_ball_control).possession(frame_num)
 
         cv2.putText(frame, f"Team 1 Ball Control: {team_1 * 100:.2f}%", (30, 620), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
         cv2.putText(frame, f"Team 2 Ball Control: {team_2 * 100:.2f}%", (30, 670), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
 
         return frame
 
-    def draw_annotations(self, video_frames, tracks, team_ball_control):
-        # Draw annotations on the video frames
+    def draw_annotations(self, video_frames, tracks, team_ball_control, start_frame=0):
+        # Draw annotations on the video frames; start_frame is the index of video_frames[0] in tracks
         output_video_frames = []
-        for frame_num, frame in enumerate(video_frames):
+        for frame_num, frame in enumerate(video_frames, start=start_frame):
             frame = frame.copy()
-            print(f"Processing frame {frame_num}")
-            
+
             player_dict = tracks["players"][frame_num]
             ball_dict = tracks["ball"][frame_num]
             referee_dict = tracks["referees"][frame_num]
@@ -237,7 +500,6 @@ class Tracker:
                 frame = self.draw_triangle(frame, ball["bbox"], (0, 255, 0))
 
             # Draw team ball control
-            print("Calling draw_team_ball_control")
             frame = self.draw_team_ball_control(frame, frame_num, team_ball_control)
 
             output_video_frames.append(frame)
@@ -0,0 +1,263 @@
+import numpy as np
+
+# Object classes in the order they appear in the tracks dict and within each frame of the table
+OBJECT_CLASSES = ("players", "referees", "ball")
+
+# Derived per-row columns: (shape of one value, dtype, fill value for rows where it is missing)
+COLUMN_SPECS = {
+    "position": ((2,), np.float64, np.nan),
+    "position_adjusted": ((2,), np.float64, np.nan),
+    "position_transformed": ((2,), np.float64, np.nan),
+    "speed": ((), np.float64, np.nan),
+    "distance": ((), np.float64, np.nan),
+    "acceleration": ((), np.float64, np.nan),
+    "max_speed": ((), np.float64, np.nan),
+    "team": ((), np.int64, 0),
+    "team_color": ((3,), np.float64, np.nan),
+    "has_ball": ((), np.bool_, False),
+    "nearest_opponent": ((), np.int64, -1),
+    "nearest_opponent_distance": ((), np.float64, np.nan),
+    "opponents_nearby": ((), np.int64, -1),
+}
+
+# Columns the dict-based stages always write, storing None when there is no value
+NULLABLE_COLUMNS = ("position_transformed",)
+
+def _is_missing(name, value):
+    _, dtype, fill = COLUMN_SPECS[name]
+    if dtype == np.float64:
+        return np.isnan(value).all()
+    return np.all(value == fill)
+
+def _to_track_value(name, value):
+    # Convert a stored value back to the type the dict-based stages produce
+    if name == "position":
+        return (int(value[0]), int(value[1]))
+    if name == "position_adjusted":
+        return (float(value[0]), float(value[1]))
+    if name == "position_transformed":
+        return [float(value[0]), float(value[1])]
+    if name in ("speed", "distance", "acceleration", "max_speed", "nearest_opponent_distance"):
+        return float(value)
+    if name in ("team", "nearest_opponent", "opponents_nearby"):
+        return int(value)
+    if name == "has_ball":
+        return bool(value)
+    return value.copy()
+
+class TrackTable:
+    # Columnar store for tracks: one row per tracked object per frame, held in parallel NumPy arrays.
+    # Rows are ordered by frame, then object class, then the order the tracker reported them,
+    # so frame_offsets[f]:frame_offsets[f+1] is the slice of rows for frame f.
+    # Derived columns can be added lazily with add_lazy_columns: they count as present, but are only computed the
+    # first time they are read, and then kept. Anything that walks every column (to_arrays, select, row dicts)
+    # computes the pending ones first.
+    def __init__(self, frame, track_id, object_class, bbox, number_of_frames, columns=None):
+        self.frame = np.asarray(frame, dtype=np.int64)
+        self.track_id = np.asarray(track_id, dtype=np.int64)
+        self.object_class = np.asarray(object_class, dtype=np.int8)
+        self.bbox = np.asarray(bbox, dtype=np.float64).reshape(-1, 4)
+        self.number_of_frames = number_of_frames
+        self.columns = dict(columns or {})
+        self.frame_offsets = np.searchsorted(self.frame, np.arange(number_of_frames + 1))
+        # Column name -> function(table) that sets it, for lazy columns not computed yet
+        self.lazy_columns = {}
+
+    @classmethod
+    def from_tracks(cls, tracks):
+        frames, track_ids, object_classes, bboxes = [], [], [], []
+        values = {name: {} for name in COLUMN_SPECS}
+
+        number_of_frames = len(tracks["players"])
+        for frame_num in range(number_of_frames):
+            for class_index, object_name in enumerate(OBJECT_CLASSES):
+                for track_id, track_info in tracks[object_name][frame_num].items():
+                    row = len(frames)
+                    frames.append(frame_num)
+                    track_ids.append(track_id)
+                    object_classes.append(class_index)
+                    bboxes.append(track_info["bbox"])
+
+                    for name in COLUMN_SPECS:
+                        value = track_info.get(name)
+                        if value is not None:
+                            values[name][row] = value
+
+        table = cls(frames, track_ids, object_classes, np.array(bboxes, dtype=np.float64).reshape(-1, 4), number_of_frames)
+        for name, column_values in values.items():
+            if column_values:
+                column = table.empty_column(name)
+                rows = np.fromiter(column_values.keys(), dtype=np.int64, count=len(column_values))
+                column[rows] = np.array(list(column_values.values()))
+                table.columns[name] = column
+
+        return table
+
+    def to_arrays(self):
+        # Flat name -> array mapping for saving, e.g. with ResultCache
+        self.materialize()
+        arrays = {
+            "frame": self.frame,
+            "track_id": self.track_id,
+            "object_class": self.object_class,
+            "bbox": self.bbox,
+            "number_of_frames": np.array([self.number_of_frames]),
+        }
+        for name, column in self.columns.items():
+            arrays[f"column_{name}"] = column
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        columns = {name[len("column_"):]: array for name, array in arrays.items() if name.startswith("column_")}
+        return cls(arrays["frame"], arrays["track_id"], arrays["object_class"], arrays["bbox"], int(arrays["number_of_frames"][0]), columns)
+
+    @classmethod
+    def concatenate(cls, tables, number_of_frames):
+        # Tables must cover consecutive, non-overlapping frame ranges and be given in frame order
+        columns = {}
+        for table in tables:
+            table.materialize()
+        for name in set().union(*(table.columns for table in tables)):
+            columns[name] = np.concatenate([table.columns[name] if name in table else table.empty_column(name) for table in tables])
+        return cls(
+            np.concatenate([table.frame for table in tables]),
+            np.concatenate([table.track_id for table in tables]),
+            np.concatenate([table.object_class for table in tables]),
+            np.concatenate([table.bbox for table in tables]),
+            number_of_frames,
+            columns,
+        )
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __contains__(self, name):
+        return name in self.columns or name in self.lazy_columns
+
+    def __getitem__(self, name):
+        if name not in self.columns and name in self.lazy_columns:
+            self.lazy_columns[name](self)
+            # A function that did not set its column must not run again on every read
+            self.lazy_columns.pop(name, None)
+        return self.columns[name]
+
+    def __setitem__(self, name, value):
+        self.columns[name] = value
+        self.lazy_columns.pop(name, None)
+
+    def add_lazy_columns(self, names, compute):
+        # compute(table) sets every column in names, reading its inputs through table[...] so that lazy inputs are
+        # computed in turn. Replaces any computed values of these columns.
+        for name in names:
+            self.columns.pop(name, None)
+            self.lazy_columns[name] = compute
+
+    def materialize(self, names=None):
+        # Compute the given lazy columns, or all of them
+        for name in list(self.lazy_columns) if names is None else names:
+            if name in self.lazy_columns:
+                self[name]
+
+    def empty_column(self, name):
+        shape, dtype, fill = COLUMN_SPECS[name]
+        return np.full((len(self),) + shape, fill, dtype=dtype)
+
+    def object_mask(self, object_name):
+        return self.object_class == OBJECT_CLASSES.index(object_name)
+
+    def frame_rows(self, frame_num):
+        return slice(self.frame_offsets[frame_num], self.frame_offsets[frame_num + 1])
+
+    def select(self, mask):
+        # New table holding only the rows where mask is True
+        self.materialize()
+        columns = {name: column[mask] for name, column in self.columns.items()}
+        return TrackTable(self.frame[mask], self.track_id[mask], self.object_class[mask], self.bbox[mask], self.number_of_frames, columns)
+
+    def replace_object_rows(self, object_name, other):
+        # New table with the rows of one object class replaced by the rows of other, keeping the row order
+        self.materialize()
+        other.materialize()
+        keep = ~self.object_mask(object_name)
+        frame = np.concatenate([self.frame[keep], other.frame])
+        object_class = np.concatenate([self.object_class[keep], other.object_class])
+        order = np.lexsort((object_class, frame))
+
+        columns = {}
+        for name in set(self.columns) | set(other.columns):
+            own = self.columns[name][keep] if name in self.columns else self.select(keep).empty_column(name)
+            others = other.columns[name] if name in other.columns else other.empty_column(name)
+            columns[name] = np.concatenate([own, others])[order]
+
+        return TrackTable(
+            frame[order],
+            np.concatenate([self.track_id[keep], other.track_id])[order],
+            object_class[order],
+            np.concatenate([self.bbox[keep], other.bbox])[order],
+            self.number_of_frames,
+            columns,
+        )
+
+    def row_dict(self, row, columns=None):
+        # With columns, only those of them the table has are included (and computed if lazy)
+        self.materialize(columns)
+        track_info = {"bbox": self.bbox[row].tolist()}
+        names = self.columns if columns is None else [name for name in columns if name in self.columns]
+        for name in names:
+            column = self.columns[name]
+            if not _is_missing(name, column[row]):
+                track_info[name] = _to_track_value(name, column[row])
+            elif name in NULLABLE_COLUMNS:
+                track_info[name] = None
+        return track_info
+
+    def frame_dict(self, object_name, frame_num, columns=None):
+        # Same dicts as row_dict, with the missing-value checks done once per column for the whole frame
+        self.materialize(columns)
+        rows = self.frame_rows(frame_num)
+        rows = np.arange(rows.start, rows.stop)[self.object_class[rows] == OBJECT_CLASSES.index(object_name)]
+        frame_tracks = {int(track_id): {"bbox": bbox} for track_id, bbox in zip(self.track_id[rows].tolist(), self.bbox[rows].tolist())}
+        track_infos = list(frame_tracks.values())
+
+        names = self.columns if columns is None else [name for name in columns if name in self.columns]
+        for name in names:
+            values = self.columns[name][rows]
+            _, dtype, fill = COLUMN_SPECS[name]
+            missing = np.isnan(values) if dtype == np.float64 else values == fill
+            missing = missing.all(axis=tuple(range(1, missing.ndim)))
+            for track_info, value, is_missing in zip(track_infos, values, missing.tolist()):
+                if not is_missing:
+                    track_info[name] = _to_track_value(name, value)
+                elif name in NULLABLE_COLUMNS:
+                    track_info[name] = None
+        return frame_tracks
+
+    def as_tracks(self, columns=None):
+        # Read-only view with the old tracks[object][frame_num][track_id] shape.
+        # Each frame's dicts are built on access, so drawing code can use it without materializing the match.
+        # With columns, the dicts only hold those, so lazy columns nobody reads are never computed.
+        return {object_name: _FrameListView(self, object_name, columns) for object_name in OBJECT_CLASSES}
+
+    def to_tracks(self):
+        return {object_name: list(view) for object_name, view in self.as_tracks().items()}
+
+class _FrameListView:
+    def __init__(self, table, object_name, columns=None):
+        self.table = table
+        self.object_name = object_name
+        self.columns = columns
+
+    def __len__(self):
+        return self.table.number_of_frames
+
+    def __getitem__(self, frame_num):
+        if frame_num < 0:
+            frame_num += len(self)
+        if not 0 <= frame_num < len(self):
+            raise IndexError(frame_num)
+        return self.table.frame_dict(self.object_name, frame_num, self.columns)
+
+    def __iter__(self):
+        for frame_num in range(len(self)):
+            yield self.table.frame_dict(self.object_name, frame_num, self.columns)
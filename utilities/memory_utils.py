@@ -0,0 +1,41 @@
+import os
+import sys
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def get_available_memory():
+    # Bytes of memory available to new allocations, or None if it cannot be determined
+    if psutil is not None:
+        return psutil.virtual_memory().available
+
+    if os.path.exists('/proc/meminfo'):
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+
+    return None
+
+def get_process_memory():
+    # Resident memory of this process in bytes, or None if it cannot be determined
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    if os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    return None
+
+def get_peak_process_memory():
+    # Highest resident memory of this process so far in bytes, or None if it cannot be determined
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
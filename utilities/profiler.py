@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from utilities.memory_utils import get_process_memory, get_peak_process_memory
+
+class StageProfiler:
+    # Records one event per stage call: wall time, frames processed and memory, per process and thread.
+    # Stages nest; each event also keeps its self time, i.e. its duration minus that of the stages inside it,
+    # so e.g. encode is not charged for the drawing that produced its frames.
+    # stage() yields a dict whose "frames" entry can be set once the frame count is known.
+    # A disabled profiler keeps the same interface and records nothing.
+    # listener, if given, is called with every recorded event, e.g. to stream progress while a job runs.
+    # Per stage totals are kept as events arrive; only the first max_events events are stored for the JSON file and
+    # the trace, so a long or live run does not grow without bound.
+    def __init__(self, enabled=True, listener=None, max_events=100000):
+        self.enabled = enabled
+        self.listener = listener
+        self.max_events = max_events
+        self.events = []
+        self.dropped_events = 0
+        self.totals = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @contextmanager
+    def stage(self, name, frames=0):
+        stage_info = {"frames": frames}
+        if not self.enabled:
+            yield stage_info
+            return
+
+        stack = self.local.__dict__.setdefault('stack', [])
+        child_times = [0.0]
+        stack.append(child_times)
+        memory_before = get_process_memory()
+        start_time = time.time()
+        start = time.perf_counter()
+        try:
+            yield stage_info
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += duration
+
+            memory_after = get_process_memory()
+            event = {
+                "name": name,
+                "start": start_time,
+                "duration": duration,
+                "self_time": duration - child_times[0],
+                "frames": stage_info["frames"],
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "memory_delta": memory_after - memory_before if memory_before is not None and memory_after is not None else None,
+                "peak_memory": get_peak_process_memory(),
+            }
+            self.add_events([event])
+            if self.listener is not None:
+                self.listener(event)
+
+    def iterate(self, name, iterable, frames_per_item=len):
+        # Charge the time spent producing each item of a lazy iterable, e.g. decoding a chunk, to a stage
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as stage_info:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                stage_info["frames"] = frames_per_item(item)
+            yield item
+
+    def add_events(self, events):
+        # Record events, also those recorded elsewhere, e.g. returned by a worker process
+        with self.lock:
+            for event in events:
+                stage = self.totals.get(event["name"])
+                if stage is None:
+                    stage = self.totals[event["name"]] = {"calls": 0, "wall_time": 0.0, "self_time": 0.0, "frames": 0, "memory_delta": 0, "peak_memory": None, "first_start": event["start"]}
+                stage["calls"] += 1
+                stage["wall_time"] += event["duration"]
+                stage["self_time"] += event["self_time"]
+                stage["frames"] += event["frames"]
+                stage["memory_delta"] += event["memory_delta"] or 0
+                stage["first_start"] = min(stage["first_start"], event["start"])
+                if event["peak_memory"] is not None:
+                    stage["peak_memory"] = max(stage["peak_memory"] or 0, event["peak_memory"])
+
+                if len(self.events) < self.max_events:
+                    self.events.append(event)
+                else:
+                    self.dropped_events += 1
+
+    def summary(self):
+        # Per stage totals in the order stages first ran
+        with self.lock:
+            totals = sorted(self.totals.items(), key=lambda item: item[1]["first_start"])
+        stages = {}
+        for name, total in totals:
+            stage = {key: value for key, value in total.items() if key != "first_start"}
+            stage["fps"] = stage["frames"] / stage["self_time"] if stage["frames"] and stage["self_time"] > 0 else None
+            stages[name] = stage
+        return stages
+
+    def report(self):
+        lines = [f"{'stage':<20} {'calls':>7} {'wall s':>9} {'self s':>9} {'frames':>8} {'fps':>9} {'peak MB':>9}"]
+        for name, stage in self.summary().items():
+            fps = f"{stage['fps']:.1f}" if stage["fps"] is not None else "-"
+            peak_memory = f"{stage['peak_memory'] / 1024**2:.0f}" if stage["peak_memory"] is not None else "-"
+            lines.append(
+                f"{name:<20} {stage['calls']:>7} {stage['wall_time']:>9.3f} {stage['self_time']:>9.3f} "
+                f"{stage['frames']:>8} {fps:>9} {peak_memory:>9}"
+            )
+        return "\n".join(lines)
+
+    def save_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({"stages": self.summary(), "events": self.events, "dropped_events": self.dropped_events}, f, indent=2)
+
+    def save_chrome_trace(self, path):
+        # Complete events in the Trace Event Format, viewable in chrome://tracing or Perfetto
+        origin = min((event["start"] for event in self.events), default=0)
+        trace_events = [
+            {
+                "name": event["name"],
+                "ph": "X",
+                "ts": (event["start"] - origin) * 1e6,
+                "dur": event["duration"] * 1e6,
+                "pid": event["pid"],
+                "tid": event["tid"],
+                "args": {"frames": event["frames"], "memory_delta": event["memory_delta"]},
+            }
+            for event in self.events
+        ]
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+class ResultCache:
+    # Content-addressed store for stage results.
+    # Entries are keyed by a hash of the input video, the model weights and the stage parameters, so a
+    # changed input or setting can never return a stale result. Each entry is a directory of .npy files
+    # that load memory-mapped, and the least recently used entries are evicted once max_bytes is exceeded.
+    def __init__(self, cache_dir='stubs/cache', max_bytes=2 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.digest_index_path = os.path.join(cache_dir, 'file_digests.json')
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def file_digest(self, path):
+        # sha256 of the file contents, remembered per (path, size, mtime) so unchanged videos are hashed once
+        stat = os.stat(path)
+        index_key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+        digest_index = {}
+        if os.path.exists(self.digest_index_path):
+            with open(self.digest_index_path) as f:
+                digest_index = json.load(f)
+        if index_key in digest_index:
+            return digest_index[index_key]
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+        digest_index[index_key] = sha.hexdigest()
+
+        # Replace the index atomically, since several processes may share one cache
+        temporary_path = f"{self.digest_index_path}.tmp{os.getpid()}"
+        with open(temporary_path, 'w') as f:
+            json.dump(digest_index, f)
+        os.replace(temporary_path, self.digest_index_path)
+        return digest_index[index_key]
+
+    def make_key(self, stage, video_path=None, weights_path=None, params=None):
+        key_source = {
+            "stage": stage,
+            "video": self.file_digest(video_path) if video_path is not None else None,
+            "weights": self.file_digest(weights_path) if weights_path is not None and os.path.exists(weights_path) else weights_path,
+            "params": params or {},
+        }
+        return hashlib.sha256(json.dumps(key_source, sort_keys=True, default=str).encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key, mmap_mode='r'):
+        # Returns (arrays, metadata) for a cached entry, or None on a miss
+        entry_path = self.entry_path(key)
+        metadata_path = os.path.join(entry_path, 'metadata.json')
+        if not os.path.exists(metadata_path):
+            return None
+
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(entry_path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in metadata["arrays"]
+        }
+
+        # Mark the entry as recently used for eviction
+        os.utime(metadata_path)
+        return arrays, metadata["metadata"]
+
+    def store(self, key, arrays, metadata=None):
+        # Write into a temporary directory first so readers never see a half-written entry
+        entry_path = self.entry_path(key)
+        temporary_path = f"{entry_path}.tmp{os.getpid()}"
+        os.makedirs(temporary_path, exist_ok=True)
+
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary_path, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(temporary_path, 'metadata.json'), 'w') as f:
+            json.dump({"arrays": list(arrays), "metadata": metadata or {}, "created": time.time()}, f)
+
+        if os.path.exists(entry_path):
+            shutil.rmtree(entry_path, ignore_errors=True)
+        try:
+            os.rename(temporary_path, entry_path)
+        except OSError:
+            # Another process stored the same entry first; the results are identical
+            shutil.rmtree(temporary_path, ignore_errors=True)
+
+        self.evict(keep=entry_path)
+
+    def entries(self):
+        # (last used time, size in bytes, path) for every complete entry
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, name)
+            metadata_path = os.path.join(entry_path, 'metadata.json')
+            if not os.path.isdir(entry_path) or not os.path.exists(metadata_path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(entry_path))
+            entries.append((os.stat(metadata_path).st_mtime, size, entry_path))
+        return entries
+
+    def evict(self, keep=None):
+        # Remove least recently used entries until the cache fits in max_bytes, never removing keep
+        entries = sorted(self.entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry_path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if entry_path == keep:
+                continue
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total_bytes -= size
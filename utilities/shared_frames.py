@@ -0,0 +1,169 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+class FrameRef:
+    # Handle to one frame in a SharedFrameRing; a few bytes to send between processes instead of the frame itself
+    __slots__ = ('slot', 'frame_index')
+
+    def __init__(self, slot, frame_index):
+        self.slot = slot
+        self.frame_index = frame_index
+
+    def __reduce__(self):
+        return (FrameRef, (self.slot, self.frame_index))
+
+    def __repr__(self):
+        return f"FrameRef(slot={self.slot}, frame_index={self.frame_index})"
+
+class SharedFrameRing:
+    # A fixed ring of frame slots in shared memory, so that processes pass frames as FrameRef handles instead of
+    # pickling them. Every stage (detector, camera movement, team color crops, renderer) reads the same pixels
+    # through a NumPy view of the slot.
+    # Each slot has a reference count, kept in a second shared block and changed under one shared lock:
+    #  - the producer allocates a free slot (count 1) and decodes straight into it;
+    #  - it retains the slot once for every consumer it hands the FrameRef to, then releases its own reference;
+    #  - every consumer releases the slot when done with it, and the slot is reused once the count is zero.
+    # A stage that draws in place, like AnnotationRenderer, must be the last one to hold the frame.
+    # Create the ring in the parent process and pass ring.spec() to workers when they start (e.g. as a
+    # ProcessPoolExecutor initializer argument; the lock cannot be pickled later), then attach there.
+    def __init__(self, slots, frame_shape, dtype=np.uint8, context=None):
+        self.slots = slots
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        self.owner = True
+
+        self.memory = shared_memory.SharedMemory(create=True, size=slots * self.frame_bytes)
+        # Per slot: reference count and the index of the frame it holds (-1 when free)
+        self.control_memory = shared_memory.SharedMemory(create=True, size=slots * 16)
+        self.condition = (context or multiprocessing).Condition()
+        self.map_arrays()
+        self.reference_counts[:] = 0
+        self.frame_indices[:] = -1
+        self.next_slot = 0
+
+    def map_arrays(self):
+        self.frames = np.ndarray((self.slots,) + self.frame_shape, dtype=self.dtype, buffer=self.memory.buf)
+        self.reference_counts = np.ndarray((self.slots,), dtype=np.int64, buffer=self.control_memory.buf)
+        self.frame_indices = np.ndarray((self.slots,), dtype=np.int64, buffer=self.control_memory.buf, offset=self.slots * 8)
+
+    def spec(self):
+        return {
+            "name": self.memory.name,
+            "control_name": self.control_memory.name,
+            "slots": self.slots,
+            "frame_shape": self.frame_shape,
+            "dtype": self.dtype.str,
+            "condition": self.condition,
+        }
+
+    @classmethod
+    def attach(cls, spec):
+        ring = cls.__new__(cls)
+        ring.slots = spec["slots"]
+        ring.frame_shape = tuple(spec["frame_shape"])
+        ring.dtype = np.dtype(spec["dtype"])
+        ring.frame_bytes = int(np.prod(ring.frame_shape)) * ring.dtype.itemsize
+        ring.owner = False
+        ring.memory = shared_memory.SharedMemory(name=spec["name"])
+        ring.control_memory = shared_memory.SharedMemory(name=spec["control_name"])
+        ring.condition = spec["condition"]
+        ring.map_arrays()
+        ring.next_slot = 0
+        return ring
+
+    def allocate(self, frame_index, timeout=None):
+        # A free slot with a reference count of 1 held by the caller. Blocks until a consumer frees one;
+        # returns None if timeout seconds pass first. Meant for a single producer.
+        with self.condition:
+            if not self.condition.wait_for(lambda: (self.reference_counts == 0).any(), timeout):
+                return None
+            free = np.flatnonzero(self.reference_counts == 0)
+            # Oldest first: the first free slot at or after the last one handed out
+            slot = int(free[np.argmax(free >= self.next_slot)] if (free >= self.next_slot).any() else free[0])
+            self.reference_counts[slot] = 1
+            self.frame_indices[slot] = frame_index
+        self.next_slot = (slot + 1) % self.slots
+        return FrameRef(slot, frame_index)
+
+    def put(self, frame, frame_index, timeout=None):
+        # Copy a frame decoded elsewhere into a new slot; prefer decoding straight into frame(ref), see read_frames
+        ref = self.allocate(frame_index, timeout)
+        if ref is not None:
+            np.copyto(self.frames[ref.slot], frame)
+        return ref
+
+    def frame(self, ref):
+        # Writable view of the frame, without copying. Checks that the slot still holds this frame, which catches
+        # a consumer reading after the last release.
+        if self.frame_indices[ref.slot] != ref.frame_index:
+            raise ValueError(f"slot {ref.slot} no longer holds frame {ref.frame_index}")
+        return self.frames[ref.slot]
+
+    def retain(self, ref, count=1):
+        with self.condition:
+            if self.reference_counts[ref.slot] <= 0 or self.frame_indices[ref.slot] != ref.frame_index:
+                raise ValueError(f"cannot retain {ref}: it was already released")
+            self.reference_counts[ref.slot] += count
+
+    def release(self, ref, count=1):
+        with self.condition:
+            if self.reference_counts[ref.slot] < count or self.frame_indices[ref.slot] != ref.frame_index:
+                raise ValueError(f"cannot release {ref}: it is not held")
+            self.reference_counts[ref.slot] -= count
+            if self.reference_counts[ref.slot] == 0:
+                self.frame_indices[ref.slot] = -1
+                self.condition.notify_all()
+
+    def in_use(self):
+        with self.condition:
+            return int((self.reference_counts > 0).sum())
+
+    def read_frames(self, video_path, consumers=1, start_frame=0, end_frame=None, timeout=None):
+        # Decode a video straight into ring slots and yield a FrameRef per frame, retained once per consumer.
+        # The producer's own reference is released before the next frame, so every consumer must release its
+        # reference for the slot to be reused; decoding waits while the ring is full.
+        cap = cv2.VideoCapture(video_path)
+        if start_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_index = start_frame
+        try:
+            while end_frame is None or frame_index < end_frame:
+                ref = self.allocate(frame_index, timeout)
+                if ref is None:
+                    raise TimeoutError(f"no free frame slot within {timeout} s")
+                slot = self.frames[ref.slot]
+                ret, frame = cap.read(slot)
+                if not ret:
+                    self.release(ref)
+                    break
+                # OpenCV allocates a new array instead of decoding into the slot when its shape or dtype differs
+                if frame is not slot:
+                    self.release(ref)
+                    raise ValueError(f"decoded frame {frame.shape} {frame.dtype} does not fit ring slots {slot.shape} {slot.dtype}")
+                self.retain(ref, consumers)
+                try:
+                    yield ref
+                finally:
+                    # Also when the caller stops early, so the slot is freed once the consumers are done
+                    self.release(ref)
+                frame_index += 1
+        finally:
+            cap.release()
+
+    def close(self):
+        # Views into the blocks must be gone before they can be closed
+        self.frames = self.reference_counts = self.frame_indices = None
+        self.memory.close()
+        self.control_memory.close()
+        if self.owner:
+            self.memory.unlink()
+            self.control_memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,4 +1,12 @@
 import cv2
+import itertools
+import os
+import queue
+import threading
+import time
+
+# Marks the end of a frame queue
+_END_OF_STREAM = object()
 
 def read_video(video_path):
     cap = cv2.VideoCapture(video_path)
@@ -10,9 +18,247 @@ def read_video(video_path):
         frames.append(frame)
     return frames
 
-def save_video(ouput_video_frames,output_video_path):
+def read_video_frames(video_path, start_frame=0, end_frame=None):
+    # Decode frames lazily, one at a time, so only the current frame is held in memory
+    cap = cv2.VideoCapture(video_path)
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    frame_num = start_frame
+    try:
+        while end_frame is None or frame_num < end_frame:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+            frame_num += 1
+    finally:
+        cap.release()
+
+def read_video_chunks(video_path, chunk_size=120, start_frame=0, end_frame=None, threaded=False):
+    # Group decoded frames into lists of at most chunk_size frames
+    if threaded:
+        frames = iter(ThreadedVideoReader(video_path, queue_size=chunk_size, start_frame=start_frame, end_frame=end_frame))
+    else:
+        frames = read_video_frames(video_path, start_frame, end_frame)
+    try:
+        while True:
+            chunk = list(itertools.islice(frames, chunk_size))
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        frames.close()
+
+class ThreadedVideoReader:
+    # Decodes frames on a background thread into a bounded queue.
+    # The decoder blocks when the queue is full, so it never runs more than queue_size frames ahead.
+    def __init__(self, video_path, queue_size=64, start_frame=0, end_frame=None):
+        self.video_path = video_path
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._decode, daemon=True)
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode(self):
+        try:
+            for frame in read_video_frames(self.video_path, self.start_frame, self.end_frame):
+                if not self._put(frame):
+                    return
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(_END_OF_STREAM)
+
+    def __iter__(self):
+        if not self.thread.is_alive() and not self.stopped.is_set():
+            self.thread.start()
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is _END_OF_STREAM:
+                    break
+                yield frame
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.close()
+
+    def close(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+class ThreadedVideoWriter:
+    # Encodes frames on a background thread. write() blocks once queue_size frames are waiting,
+    # which applies backpressure to the producer instead of buffering without bound.
+    def __init__(self, output_video_path, fps=24, queue_size=64):
+        self.output_video_path = output_video_path
+        self.fps = fps
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._encode, daemon=True)
+        self.thread.start()
+
+    def _encode(self):
+        # Keeps draining the queue after an error so a blocked write() can never deadlock
+        out = None
+        while True:
+            frame = self.queue.get()
+            if frame is _END_OF_STREAM:
+                break
+            if self.error is not None:
+                continue
+            try:
+                if out is None:
+                    fourcc = cv2.VideoWriter_fourcc(*'XVID')
+                    out = cv2.VideoWriter(self.output_video_path, fourcc, self.fps, (frame.shape[1], frame.shape[0]))
+                out.write(frame)
+            except Exception as e:
+                self.error = e
+        if out is not None:
+            out.release()
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(frame)
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(_END_OF_STREAM)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class LiveVideoSource:
+    # Captures a live stream (RTSP/HTTP URL or device index) on a background thread. A video file is replayed as a
+    # stream, paced at its native FPS. Frames are (frame_index, capture_time, frame) with capture_time on the
+    # time.perf_counter clock. The queue holds at most queue_size frames; when the consumer falls behind the oldest
+    # waiting frame is dropped, so latency stays bounded instead of growing.
+    # With start=False nothing is captured until start(), e.g. until the detector has warmed up.
+    def __init__(self, source, queue_size=2, realtime=None, start=True):
+        self.source = source
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open video source {source!r}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30
+        self.frame_size = (int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        # Files would otherwise be read as fast as they decode
+        self.realtime = isinstance(source, str) and os.path.exists(source) if realtime is None else realtime
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped_frames = 0
+        self.stopped = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._capture, daemon=True)
+        if start:
+            self.start()
+
+    def start(self):
+        if self.thread.ident is None:
+            self.thread.start()
+
+    def _capture(self):
+        start = time.perf_counter()
+        frame_index = 0
+        try:
+            while not self.stopped.is_set():
+                if self.realtime:
+                    delay = start + frame_index / self.fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                ret, frame = self.capture.read()
+                if not ret:
+                    break
+                self._put_latest((frame_index, time.perf_counter(), frame))
+                frame_index += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self.capture.release()
+            self._put_latest(_END_OF_STREAM)
+
+    def _put_latest(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    dropped = self.queue.get_nowait()
+                    if dropped is not _END_OF_STREAM:
+                        self.dropped_frames += 1
+                except queue.Empty:
+                    pass
+
+    def pending(self):
+        # Frames captured but not yet taken, i.e. how far the consumer is behind
+        return self.queue.qsize()
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _END_OF_STREAM:
+                    break
+                yield item
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.close()
+
+    def close(self, timeout=1.0):
+        self.stopped.set()
+        if self.thread.ident is None:
+            self.capture.release()
+        elif threading.current_thread() is not self.thread:
+            # The capture thread stops before its next read and releases the capture itself. A read stalled on a
+            # network stream may not return for a long time, so stop waiting after timeout; the thread is a daemon.
+            self.thread.join(timeout)
+
+def get_video_properties(video_path):
+    cap = cv2.VideoCapture(video_path)
+    properties = {
+        "fps": cap.get(cv2.CAP_PROP_FPS) or 24,
+        "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+    cap.release()
+    return properties
+
+def save_video(ouput_video_frames,output_video_path,fps=24,threaded=False):
+    # Accepts a list or any iterable of frames; the writer is opened from the first frame's size
+    if threaded:
+        with ThreadedVideoWriter(output_video_path, fps=fps) as writer:
+            for frame in ouput_video_frames:
+                writer.write(frame)
+        return
+
+    frames = iter(ouput_video_frames)
+    first_frame = next(frames, None)
+    if first_frame is None:
+        return
     fourcc = cv2.VideoWriter_fourcc(*'XVID')
-    out= cv2.VideoWriter(output_video_path, fourcc, 24, (ouput_video_frames[0].shape[1], ouput_video_frames[0].shape[0]))
-    for frame in ouput_video_frames:
+    out= cv2.VideoWriter(output_video_path, fourcc, fps, (first_frame.shape[1], first_frame.shape[0]))
+    out.write(first_frame)
+    for frame in frames:
         out.write(frame)
-    out.release()
\ No newline at end of file
+    out.release()
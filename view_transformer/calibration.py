@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import numpy as np
+import cv2
+
+# Calibrations already loaded in this process, keyed by camera ID and calibration file hash
+_loaded_calibrations = {}
+
+def points_inside_polygon(polygon, points):
+    # Vectorized cv2.pointPolygonTest(polygon, point, False) >= 0 for integer-truncated points: inside or on an edge
+    points = np.trunc(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    x, y = points[:, 0:1], points[:, 1:2]
+
+    start = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+    end = np.roll(start, -1, axis=0)
+    x1, y1, x2, y2 = start[:, 0], start[:, 1], end[:, 0], end[:, 1]
+
+    # Even-odd rule: count edges crossed by a ray cast to the right of each point
+    straddles = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    inside = (straddles & (x < crossing_x)).sum(axis=1) % 2 == 1
+
+    # Points lying exactly on an edge count as inside
+    cross = (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1)
+    within_x = (x >= np.minimum(x1, x2)) & (x <= np.maximum(x1, x2))
+    within_y = (y >= np.minimum(y1, y2)) & (y <= np.maximum(y1, y2))
+    on_edge = ((cross == 0) & within_x & within_y).any(axis=1)
+
+    return inside | on_edge
+
+class PitchCalibration:
+    # Homography from image pixels to pitch meters for one camera, fitted from N >= 4 keypoint pairs.
+    # The polygon is the convex hull of the pixel keypoints, and polygon_mask rasterizes it over its
+    # bounding box (starting at mask_origin) so inside-pitch tests become an array lookup.
+    def __init__(self, camera_id, pixel_points, pitch_points, homography, polygon, polygon_mask, mask_origin):
+        self.camera_id = camera_id
+        self.pixel_points = pixel_points
+        self.pitch_points = pitch_points
+        self.homography = homography
+        self.polygon = polygon
+        self.polygon_mask = polygon_mask
+        self.mask_origin = mask_origin
+
+    def points_inside_polygon(self, points):
+        # Same integer truncation as cv2.pointPolygonTest on int points; anything outside the mask is off the pitch
+        points = np.trunc(np.asarray(points, dtype=np.float64).reshape(-1, 2)) - self.mask_origin
+        height, width = self.polygon_mask.shape
+        inside_mask = (points[:, 0] >= 0) & (points[:, 0] < width) & (points[:, 1] >= 0) & (points[:, 1] < height)
+
+        inside = np.zeros(len(points), dtype=bool)
+        columns = points[inside_mask, 0].astype(np.int64)
+        rows = points[inside_mask, 1].astype(np.int64)
+        inside[inside_mask] = self.polygon_mask[rows, columns]
+        return inside
+
+def read_keypoints(calibration_path):
+    with open(calibration_path) as f:
+        calibration = json.load(f)
+
+    pixel_points = np.array([keypoint["pixel"] for keypoint in calibration["keypoints"]], dtype=np.float32)
+    pitch_points = np.array([keypoint["pitch"] for keypoint in calibration["keypoints"]], dtype=np.float32)
+    if len(pixel_points) < 4:
+        raise ValueError(f"Calibration {calibration_path} needs at least 4 keypoints, got {len(pixel_points)}")
+
+    camera_id = calibration.get("camera_id", os.path.splitext(os.path.basename(calibration_path))[0])
+    ransac_threshold = calibration.get("ransac_reprojection_threshold", 0.5)
+    return camera_id, pixel_points, pitch_points, ransac_threshold
+
+def fit_calibration(camera_id, pixel_points, pitch_points, ransac_threshold):
+    # Robust fit: RANSAC discards keypoints whose reprojection error exceeds the threshold (in meters)
+    homography, _ = cv2.findHomography(pixel_points, pitch_points, cv2.RANSAC, ransac_threshold)
+    if homography is None:
+        raise ValueError(f"Could not fit a homography for camera {camera_id}")
+
+    polygon = cv2.convexHull(pixel_points).reshape(-1, 2)
+
+    # Rasterize the polygon with the same edge rules as points_inside_polygon
+    mask_origin = np.floor(polygon.min(axis=0)).astype(np.int64)
+    mask_end = np.ceil(polygon.max(axis=0)).astype(np.int64) + 1
+    xs, ys = np.meshgrid(np.arange(mask_origin[0], mask_end[0]), np.arange(mask_origin[1], mask_end[1]))
+    grid = np.stack([xs.ravel(), ys.ravel()], axis=1)
+    polygon_mask = points_inside_polygon(polygon, grid).reshape(xs.shape)
+
+    return PitchCalibration(camera_id, pixel_points, pitch_points, homography, polygon, polygon_mask, mask_origin)
+
+def load_calibration(calibration_path, cache_dir='stubs/calibration_cache'):
+    # Load a camera calibration, reusing the fitted homography and mask from memory or from cache_dir.
+    # The cache entry is keyed by camera ID and a hash of the calibration file, so editing the file refits it.
+    with open(calibration_path, 'rb') as f:
+        calibration_hash = hashlib.sha256(f.read()).hexdigest()
+
+    camera_id, pixel_points, pitch_points, ransac_threshold = read_keypoints(calibration_path)
+    key = (camera_id, calibration_hash)
+    if key in _loaded_calibrations:
+        return _loaded_calibrations[key]
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f"{camera_id}.npz")
+        if os.path.exists(cache_path):
+            cached = np.load(cache_path)
+            if str(cached["calibration_hash"]) == calibration_hash:
+                calibration = PitchCalibration(camera_id, pixel_points, pitch_points, cached["homography"],
+                                               cached["polygon"], cached["polygon_mask"], cached["mask_origin"])
+                _loaded_calibrations[key] = calibration
+                return calibration
+
+    calibration = fit_calibration(camera_id, pixel_points, pitch_points, ransac_threshold)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(cache_path, calibration_hash=calibration_hash, homography=calibration.homography,
+                 polygon=calibration.polygon, polygon_mask=calibration.polygon_mask, mask_origin=calibration.mask_origin)
+
+    _loaded_calibrations[key] = calibration
+    return calibration
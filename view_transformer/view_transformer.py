@@ -1,8 +1,19 @@
 import numpy as np
 import cv2
+from tracking_framework.track_table import TrackTable
+from view_transformer.calibration import load_calibration, points_inside_polygon
 
 class ViewTransformer():
-    def __init__(self):
+    def __init__(self, calibration_path=None, calibration_cache_dir='stubs/calibration_cache'):
+        self.calibration = None
+        if calibration_path is not None:
+            # Use the fitted homography and pitch polygon of a calibrated camera
+            self.calibration = load_calibration(calibration_path, cache_dir=calibration_cache_dir)
+            self.pixel_vertices = self.calibration.polygon.astype(np.float32)
+            self.target_vertices = self.calibration.pitch_points
+            self.persepctive_trasnformer = self.calibration.homography
+            return
+
         # Define court dimensions
         court_width = 68
         court_length = 23.32
@@ -48,21 +59,51 @@ class ViewTransformer():
         # Return the transformed point
         return tranform_point.reshape(-1, 2)
 
+    def points_inside_polygon(self, points):
+        # Vectorized cv2.pointPolygonTest(..., False) >= 0; calibrated cameras use their precomputed mask
+        if self.calibration is not None:
+            return self.calibration.points_inside_polygon(points)
+        return points_inside_polygon(self.pixel_vertices, points)
+
+    def transform_points(self, points):
+        # Transform many points with one inside-polygon test and one homography multiply.
+        # Returns an (N, 2) array with NaN rows for points outside the court polygon.
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        transformed = np.full(points.shape, np.nan)
+
+        valid = ~np.isnan(points).any(axis=1)
+        inside = np.zeros(len(points), dtype=bool)
+        inside[valid] = self.points_inside_polygon(points[valid])
+        if not inside.any():
+            return transformed
+
+        # Same float32 input and output precision as cv2.perspectiveTransform
+        homogeneous = np.hstack([points[inside].astype(np.float32), np.ones((inside.sum(), 1), dtype=np.float32)])
+        projected = homogeneous.astype(np.float64) @ self.persepctive_trasnformer.T
+        transformed[inside] = (projected[:, :2] / projected[:, 2:3]).astype(np.float32)
+
+        return transformed
+
     def add_transformed_position_to_tracks(self, tracks):
-        # Iterate over all tracked objects
+        if isinstance(tracks, TrackTable):
+            tracks['position_transformed'] = self.transform_points(tracks['position_adjusted'])
+            return
+
+        # Gather every adjusted position so they can be transformed in one batch
+        keys = []
+        positions = []
         for object, object_tracks in tracks.items():
-            # Iterate over frames for each object
             for frame_num, track in enumerate(object_tracks):
-                # Iterate over individual tracks in each frame
                 for track_id, track_info in track.items():
-                    # Get the adjusted position of the track
-                    position = track_info['position_adjusted']
-                    position = np.array(position)
+                    keys.append((object, frame_num, track_id))
+                    positions.append(track_info['position_adjusted'])
 
-                    # Transform the position
-                    position_trasnformed = self.transform_point(position)
-                    if position_trasnformed is not None:
-                        position_trasnformed = position_trasnformed.squeeze().tolist()
+        positions_transformed = self.transform_points(np.array(positions, dtype=np.float64).reshape(-1, 2))
 
-                    # Add the transformed position to the track information
-                    tracks[object][frame_num][track_id]['position_transformed'] = position_trasnformed
+        # Add the transformed position to the track information; points outside the court map to None
+        for (object, frame_num, track_id), position_trasnformed in zip(keys, positions_transformed):
+            if np.isnan(position_trasnformed[0]):
+                position_trasnformed = None
+            else:
+                position_trasnformed = position_trasnformed.tolist()
+            tracks[object][frame_num][track_id]['position_transformed'] = position_trasnformed
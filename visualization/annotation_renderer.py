@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+import sys
+
+# Add the utilities directory to the system path
+sys.path.append('/teamspace/studios/this_studio/utilities')
+
+# Import utility functions
+from bbox_utils import get_foot_position
+
+# Semi-transparent white panels: (top left, bottom right, opacity). Corners are inclusive, as in cv2.rectangle.
+PANELS = {
+    "ball_control": ((20, 600), (400, 720), 0.4),
+    "camera_movement": ((0, 0), (500, 100), 0.6),
+}
+
+class AnnotationRenderer:
+    # Draws everything Tracker.draw_annotations, CameraMovementEstimator.draw_camera_movement and
+    # SpeedAndDistance_Estimator.draw_speed_and_distance draw, in the same order, in one pass over each frame.
+    # Frames are drawn in place and only the panel regions are blended, against white backgrounds cached per panel size;
+    # the output is pixel-identical to the three separate passes.
+    def __init__(self, tracker):
+        # Ellipse and triangle markers are shared with Tracker
+        self.tracker = tracker
+        self.panel_backgrounds = {}
+        # Track columns the drawing reads, for TrackTable.as_tracks
+        self.columns = ("team_color", "has_ball", "speed", "distance")
+
+    def blend_panel(self, frame, panel_name):
+        (x1, y1), (x2, y2), alpha = PANELS[panel_name]
+        roi = frame[max(y1, 0):y2 + 1, max(x1, 0):x2 + 1]
+        if roi.size == 0:
+            return
+
+        key = (panel_name, roi.shape)
+        if key not in self.panel_backgrounds:
+            self.panel_backgrounds[key] = np.full(roi.shape, 255, dtype=np.uint8)
+        cv2.addWeighted(self.panel_backgrounds[key], alpha, roi, 1 - alpha, 0, dst=roi)
+
+    def render_frame(self, frame, frame_num, tracks, possession_stats, camera_movement_per_frame):
+        player_dict = tracks["players"][frame_num]
+
+        # Players, with a triangle over the player in possession
+        for track_id, player in player_dict.items():
+            color = player.get("team_color", (0, 0, 255))
+            self.tracker.draw_ellipse(frame, player["bbox"], color, track_id)
+            if player.get('has_ball', False):
+                self.tracker.draw_triangle(frame, player["bbox"], (0, 0, 255))
+
+        for referee in tracks["referees"][frame_num].values():
+            self.tracker.draw_ellipse(frame, referee["bbox"], (0, 255, 255))
+
+        for ball in tracks["ball"][frame_num].values():
+            self.tracker.draw_triangle(frame, ball["bbox"], (0, 255, 0))
+
+        # Team ball control panel
+        team_1, team_2 = possession_stats.possession(frame_num)
+        self.blend_panel(frame, "ball_control")
+        cv2.putText(frame, f"Team 1 Ball Control: {team_1 * 100:.2f}%", (30, 620), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
+        cv2.putText(frame, f"Team 2 Ball Control: {team_2 * 100:.2f}%", (30, 670), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
+
+        # Camera movement panel
+        if camera_movement_per_frame is not None:
+            x_movement, y_movement = camera_movement_per_frame[frame_num]
+            self.blend_panel(frame, "camera_movement")
+            cv2.putText(frame, f"Camera Movement X: {x_movement:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
+            cv2.putText(frame, f"Camera Movement Y: {y_movement:.2f}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
+
+        # Speed and distance under each player
+        for player in player_dict.values():
+            speed = player.get('speed')
+            distance = player.get('distance')
+            if speed is None or distance is None:
+                continue
+            x, y = get_foot_position(player['bbox'])
+            y += 40  # Offset for drawing text
+            cv2.putText(frame, f"{speed:.2f} km/h", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+            cv2.putText(frame, f"{distance:.2f} m", (x, y + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+
+        return frame
+
+    def render_frames(self, frames, tracks, team_ball_control, camera_movement_per_frame=None, start_frame=0):
+        # Yields each frame annotated in place; start_frame is the index of frames[0] in tracks.
+        # team_ball_control is a PossessionStats or the per-frame array.
+        possession_stats = self.tracker.get_possession_stats(team_ball_control)
+        for frame_num, frame in enumerate(frames, start=start_frame):
+            yield self.render_frame(frame, frame_num, tracks, possession_stats, camera_movement_per_frame)